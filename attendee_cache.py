@@ -0,0 +1,273 @@
+import functools
+import json
+import re
+import select
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import psycopg2 as pg2
+
+from backend import (
+    ATTENDEE_COLUMNS,
+    escape_like_pattern,
+    get_attendee,
+    get_attendees_page,
+)
+from config import get_cached_configuration
+import connection_pool
+
+NOTIFICATION_CHANNEL = "guestlist_changes"
+CHANGES_TRIGGER = "guestlist_changes"
+
+DEFAULT_CACHE_SETTINGS = {
+    "enabled": "yes",
+    "max_records": "50000",
+}
+
+# Seconds to wait before connecting again after the listener lost its connection
+RECONNECT_DELAY = 5
+
+
+def like_pattern_matches(pattern, text):
+    """
+    Checks if the text matches an ILIKE pattern, the same way
+    PostgreSQL would: '%' matches any text, '_' any single character
+    and a backslash makes the next character match literally.
+    """
+    return like_pattern_regex(pattern).fullmatch(text) is not None
+
+
+@functools.lru_cache(maxsize=256)
+def like_pattern_regex(pattern):
+    """Returns the compiled regular expression for an ILIKE pattern."""
+    regex = []
+    characters = iter(pattern)
+    for character in characters:
+        if character == "\\":
+            regex.append(re.escape(next(characters, "\\")))
+        elif character == "%":
+            regex.append(".*")
+        elif character == "_":
+            regex.append(".")
+        else:
+            regex.append(re.escape(character))
+    return re.compile("".join(regex), re.IGNORECASE | re.DOTALL)
+
+
+class AttendeeCache:
+    """
+    In-process cache of attendee's data kept up to date by the database.
+
+    Holds single attendees by guest_id and results of name lookups by
+    their normalized pattern. Together the entries never hold more than
+    max_records attendee tuples; the least recently used ones are
+    evicted first. A ChangeListener removes the entries an
+    insert, update or delete in guestlist affects. While no listener is
+    connected the cache is bypassed, so it never serves stale data.
+    """
+    def __init__(self, max_records=50000):
+        self.max_records = max_records
+        self.listening = False
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()       # key -> (value, number of records)
+        self._keys_by_guest_id = defaultdict(set)
+        self._records = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def read_through(self, key, load):
+        """
+        Returns the cached value for the key, or loads it with load()
+        and caches it. Values loaded while a change came in are not cached.
+        """
+        if not self.listening:
+            return load()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            generation = self._generation
+        value = load()
+        if value is not None:
+            with self._lock:
+                if generation == self._generation and self.listening:
+                    self._store(key, value)
+        return value
+
+    def _store(self, key, value):
+        """Adds an entry, evicting the least recently used ones if needed."""
+        attendees = value if isinstance(value, list) else [value]
+        size = max(len(attendees), 1)
+        if size > self.max_records:
+            return
+        self._remove(key)
+        self._entries[key] = (value, size)
+        self._records += size
+        for attendee in attendees:
+            self._keys_by_guest_id[attendee[0]].add(key)
+        while self._records > self.max_records:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """Removes an entry and forgets which attendees it held."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        value, size = entry
+        self._records -= size
+        for attendee in value if isinstance(value, list) else [value]:
+            keys = self._keys_by_guest_id.get(attendee[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_guest_id[attendee[0]]
+
+    def apply_change(self, change):
+        """
+        Takes in a change notification: a dictionary with the operation,
+        guest_id and full name of the changed attendee. Removes every entry
+        that held the attendee and the name lookups the new or changed
+        attendee now matches.
+        """
+        with self._lock:
+            self._generation += 1
+            guest_id = change["guest_id"]
+            stale = set(self._keys_by_guest_id.get(guest_id, ()))
+            stale.add(("id", guest_id))
+            if change["operation"] != "DELETE":
+                stale.update(key for key in self._entries
+                             if key[0] == "name"
+                             and like_pattern_matches(key[1], change["name"]))
+            for key in stale:
+                self._remove(key)
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_guest_id.clear()
+            self._records = 0
+
+
+class ChangeListener(threading.Thread):
+    """
+    Background thread that listens for the notifications sent by the
+    guestlist_changes trigger (see schema.py) and applies them to the
+    cache. It keeps its own connection, outside of the pool, and connects
+    again when the connection is lost. The cache is only used while the
+    listener is connected.
+    """
+    def __init__(self, cache, filename=None):
+        super().__init__(name="attendee-cache-listener", daemon=True)
+        self.cache = cache
+        self.filename = filename or connection_pool.CONFIGURATION_FILE
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Stops listening; the cache is bypassed from now on."""
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                parameters = get_cached_configuration(filename=self.filename,
+                                                      section="postgresql")
+                conn = pg2.connect(**parameters)
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute("""SELECT 1 FROM pg_trigger WHERE tgname = %s;""",
+                            (CHANGES_TRIGGER,))
+                if cur.fetchone() is None:
+                    print("attendee cache disabled: run the database migrations")
+                    return
+                cur.execute(f"""LISTEN {NOTIFICATION_CHANNEL};""")
+                self.cache.clear()
+                self.cache.listening = True
+                self.listen(conn)
+            except (Exception, pg2.DatabaseError) as error:
+                print(error)
+            finally:
+                self.cache.listening = False
+                self.cache.clear()
+                if conn is not None:
+                    conn.close()
+            self._stopped.wait(RECONNECT_DELAY)
+
+    def listen(self, conn):
+        """Applies the notifications until the listener is stopped."""
+        while not self._stopped.is_set():
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notification = conn.notifies.pop(0)
+                self.cache.apply_change(json.loads(notification.payload))
+
+
+_cache = AttendeeCache()
+_listener = None
+
+
+def start_attendee_cache(filename=None):
+    """
+    Starts the cache if it is enabled in the [cache] section of the
+    configuration file (connection_pool.CONFIGURATION_FILE by default).
+    Returns True if the listener was started.
+    """
+    global _listener
+    if filename is None:
+        filename = connection_pool.CONFIGURATION_FILE
+    settings = get_cached_configuration(filename=filename, section="cache",
+                                        defaults=DEFAULT_CACHE_SETTINGS)
+    if settings["enabled"].lower() not in ("yes", "true", "on", "1"):
+        return False
+    if _listener is None or not _listener.is_alive():
+        _cache.max_records = int(settings["max_records"])
+        _listener = ChangeListener(_cache, filename)
+        _listener.start()
+    return True
+
+
+def stop_attendee_cache():
+    """Stops the listener. Lookups go straight to the database again."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener.join()
+        _listener = None
+
+
+def wait_until_listening(timeout=5.0):
+    """Waits until the listener is connected. Returns True if it is."""
+    deadline = time.monotonic() + timeout
+    while not _cache.listening and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return _cache.listening
+
+
+def cached_get_attendee(guest_id):
+    """Works like backend.get_attendee, but uses the cache."""
+    return _cache.read_through(("id", int(guest_id)), lambda: get_attendee(guest_id))
+
+
+def cached_get_attendees_page(name_filter, page_size, columns=ATTENDEE_COLUMNS):
+    """
+    Works like backend.get_attendees_page for the first page of the
+    attendees whose full name contains name_filter, but uses the cache.
+    The page is kept under its name pattern, so adding, changing or
+    removing an attendee it matches removes it. columns have to start
+    with guest_id.
+    """
+    pattern = "%" + escape_like_pattern(name_filter) + "%"
+    return _cache.read_through(
+        ("name", pattern.casefold(), page_size, tuple(columns)),
+        lambda: get_attendees_page(0, page_size, name_filter, columns=columns))
@@ -0,0 +1,111 @@
+import time
+import unittest
+
+from datetime import datetime
+
+import attendee_cache
+from attendee_cache import (
+    AttendeeCache,
+    cached_get_attendees_page,
+    like_pattern_matches,
+    start_attendee_cache,
+    stop_attendee_cache,
+    wait_until_listening,
+)
+from backend import base_query, store_attendee_data_in_postgresql
+from schema import trigger_installed
+
+
+@base_query
+def remove_cache_test_attendee(cur):
+    sql = """DELETE FROM guestlist WHERE last_name = 'Cachedname';"""
+    cur.execute(sql, )
+    return cur, None
+
+
+john = (1, 'John', 'Doe')
+jane = (2, 'Jane', 'Doe')
+
+
+class AttendeeCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = AttendeeCache(max_records=3)
+        self.cache.listening = True
+
+    def test_like_pattern_matches(self):
+        """Checks if ILIKE patterns are matched like in PostgreSQL."""
+        self.assertTrue(like_pattern_matches('%doe%', 'John Doe'))
+        self.assertTrue(like_pattern_matches('j_hn%', 'John Doe'))
+        self.assertFalse(like_pattern_matches('%smith%', 'John Doe'))
+        self.assertFalse(like_pattern_matches('50\\%', '500'))
+        self.assertTrue(like_pattern_matches('50\\%', '50%'))
+
+    def test_read_through(self):
+        """Checks if a value is loaded once and then served from the cache."""
+        loads = []
+        load = lambda: loads.append(1) or [john]
+        self.assertEqual(self.cache.read_through(('name', '%doe%'), load), [john])
+        self.assertEqual(self.cache.read_through(('name', '%doe%'), load), [john])
+        self.assertEqual(len(loads), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_bypassed_when_not_listening(self):
+        """Checks if nothing is cached while no listener is connected."""
+        self.cache.listening = False
+        self.cache.read_through(('name', '%doe%'), lambda: [john, jane])
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_evicted(self):
+        """Checks if the entries never hold more than max_records attendees."""
+        self.cache.read_through(('id', 1), lambda: john)
+        self.cache.read_through(('id', 2), lambda: jane)
+        self.cache.read_through(('id', 1), lambda: john)
+        self.cache.read_through(('name', '%doe%'), lambda: [john, jane])
+        self.cache.read_through(('name', '%o%'), lambda: [john, jane, jane, john])
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.read_through(('id', 2), lambda: None), None)
+
+    def test_apply_change(self):
+        """
+        Checks if only the entries affected by a change are removed.
+        """
+        self.cache.max_records = 10
+        self.cache.read_through(('id', 1), lambda: john)
+        self.cache.read_through(('id', 2), lambda: jane)
+        self.cache.read_through(('name', '%john%'), lambda: [john])
+        self.cache.read_through(('name', '%smith%'), lambda: [])
+        self.cache.read_through(('name', '%doe%'), lambda: [john, jane])
+
+        self.cache.apply_change({'operation': 'DELETE', 'guest_id': 1,
+                                 'name': 'John Doe'})
+        self.assertEqual(len(self.cache), 2)
+        self.cache.apply_change({'operation': 'INSERT', 'guest_id': 3,
+                                 'name': 'Anna Smith'})
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.read_through(('id', 2), lambda: None), jane)
+
+    def test_invalidated_by_database(self):
+        """
+        Checks if an attendee added to the database shows up
+        in a cached lookup made before it was added.
+        """
+        if not trigger_installed('guestlist_changes'):
+            self.skipTest('guestlist_changes trigger missing, run schema.migrate()')
+        start_attendee_cache()
+        try:
+            self.assertTrue(wait_until_listening())
+            self.assertEqual(cached_get_attendees_page('gildo cached', 5), [])
+            store_attendee_data_in_postgresql(
+                ['Hermenegildo', 'Cachedname', 'New York', 'Testers',
+                 'jd@testers.com', '111222333', datetime(2010, 10, 10)])
+            deadline = time.monotonic() + 5
+            while (not cached_get_attendees_page('gildo cached', 5)
+                   and time.monotonic() < deadline):
+                time.sleep(0.01)
+            hits = attendee_cache._cache.hits
+            self.assertEqual(len(cached_get_attendees_page('GILDO CACHED', 5)), 1)
+            self.assertGreater(attendee_cache._cache.hits, hits)
+        finally:
+            stop_attendee_cache()
+            remove_cache_test_attendee()
@@ -1,35 +1,230 @@
-import docx
+import csv
+import functools
+import instrumentation
+import itertools
+import os
 import psycopg2 as pg2
-import xlsxwriter
+import threading
 
-from config import get_database_configuration
+from collections import namedtuple
+from connection_pool import get_pool
+from contextlib import contextmanager, suppress
+from docx_stream import write_docx_paragraphs
 from datetime import datetime
 
+# docx and xlsxwriter are imported by the export functions that need them,
+# so starting the app (or searching for an attendee) does not load them.
+
+# Columns filled in when an attendee is added, in the order used by the queries
+GUESTLIST_COLUMNS = (
+    "first_name",
+    "last_name",
+    "city",
+    "company",
+    "email",
+    "phone",
+    "date_added",
+)
+
+# All columns of guestlist, in the order of the fields of Attendee
+ATTENDEE_COLUMNS = ("guest_id",) + GUESTLIST_COLUMNS
+
+# Record with the data of one attendee, returned by the query functions.
+# It is a tuple, so attendee[0] is still the guest_id, and it has
+# no per-instance dictionary, so large lists of them stay small.
+Attendee = namedtuple("Attendee", ATTENDEE_COLUMNS)
+
+# Default number of attendees returned by get_attendees_page
+PAGE_SIZE = 100
+
+# Default number of results returned by search_attendees
+SEARCH_LIMIT = 10
+
+# Number of rows fetched at once when attendees are streamed from the database
+STREAM_BATCH_SIZE = 2000
+
+XLSX_COLUMN_TITLES = [
+    "id",
+    "first name",
+    "last_name",
+    "city",
+    "company",
+    "email",
+    "phone number",
+    "date added",
+]
+XLSX_DATE_FORMAT = "yyyy-mm-dd hh:mm:ss"
+
+# Attendees per row group of the parquet export
+PARQUET_BATCH_SIZE = 50000
+# Rows an Excel worksheet can hold, including the row with column titles
+XLSX_MAX_ROWS = 1048576
+
+
+_local = threading.local()
+_cursor_numbers = itertools.count()
+
+
+class Session:
+    """
+    A connection shared by all the base_query functions called
+    inside one transaction() block (see transaction).
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self._savepoints = 0
+
+    @contextmanager
+    def savepoint(self):
+        """
+        Everything done inside the with block is undone if the block
+        raises an exception; the rest of the transaction is kept.
+        """
+        self._savepoints += 1
+        name = f"savepoint_{self._savepoints}"
+        cur = self.conn.cursor()
+        cur.execute(f"SAVEPOINT {name};")
+        try:
+            yield self
+        except BaseException:
+            cur.execute(f"ROLLBACK TO SAVEPOINT {name};")
+            raise
+        else:
+            cur.execute(f"RELEASE SAVEPOINT {name};")
+        finally:
+            cur.close()
+
+
+def current_session():
+    """Returns the Session of this thread's transaction() block, if any."""
+    return getattr(_local, "session", None)
+
+
+@contextmanager
+def transaction():
+    """
+    Runs every base_query function called inside the with block
+    (in the same thread) on one connection, and commits them all at
+    the end. If the block raises an exception, everything is rolled back.
+    Database errors inside the block are raised instead of printed.
+    A transaction() inside another one becomes a savepoint.
+
+    Example:
+        with transaction():
+            guest_id = store_attendee_data_in_postgresql(attendee_data)
+            remove_attendee(old_guest_id)
+    """
+    session = current_session()
+    if session is not None:
+        with session.savepoint():
+            yield session
+        return
+
+    connection_pool = get_pool()
+    conn = connection_pool.get_connection()
+    _local.session = Session(conn)
+    try:
+        yield _local.session
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _local.session = None
+        connection_pool.release_connection(conn)
+
+
+@functools.lru_cache(maxsize=None)
+def attendee_record_type(columns):
+    """
+    Takes in a tuple of guestlist column names. Returns the record type
+    for rows with just these columns, in this order: Attendee for all
+    of them, a smaller namedtuple with the same field names otherwise.
+    Raises ValueError for columns guestlist does not have.
+    """
+    unknown = [column for column in columns if column not in ATTENDEE_COLUMNS]
+    if unknown or not columns:
+        raise ValueError(f"invalid guestlist columns: {columns}")
+    if columns == ATTENDEE_COLUMNS:
+        return Attendee
+    return namedtuple("PartialAttendee", columns)
+
+
+def select_attendee_columns(columns):
+    """
+    Takes in an iterable of guestlist column names. Returns the text
+    to put in a SELECT (or RETURNING) clause to read just these columns
+    and the record type for the rows it returns (see attendee_record_type).
+    """
+    record_type = attendee_record_type(tuple(columns))
+    return ", ".join(record_type._fields), record_type
+
+
+def make_attendees(rows, record_type=Attendee):
+    """
+    Takes in a list of row tuples and the record type returned by
+    select_attendee_columns. Returns a list of such records.
+    """
+    return list(map(record_type._make, rows))
+
 
 def base_query(func_to_modify):
     """
     Serves as a base for PostgreSQL queries. Use it to avoid Code Bloat.
-    Opens and closes the connection each time, commits changes.
+    Borrows a connection from the pool (see connection_pool.py) each time,
+    commits changes and gives the connection back.
+    Inside a transaction() block the transaction's connection is used
+    instead and nothing is committed until the block ends.
     Takes in a function (func) which should be a PostgreSQL query
-    and arguments which are then transferred to the func function as its arguments.
+    and arguments (positional or keyword) which are then transferred
+    to the func function as its arguments.
     Returns query's result, if any - otherwise returns None.
     """
-    def complete_query(*args):
+    @functools.wraps(func_to_modify)
+    def complete_query(*args, **kwargs):
+        # Measured only when instrumentation is enabled (see instrumentation.py)
+        timer = instrumentation.start_query_timer(func_to_modify.__name__)
+        session = current_session()
+        if session is not None:
+            cur = session.conn.cursor()
+            if timer is not None:
+                timer.connected()
+                cur = timer.wrap(cur)
+            try:
+                cur, result = func_to_modify(cur, *args, **kwargs)
+            except Exception as error:
+                if timer is not None:
+                    timer.failed(error)
+                raise
+            finally:
+                if timer is not None:
+                    timer.finish()
+            cur.close()
+            return result
+
         conn = None
         result = None
+        connection_pool = None
         try:
-            parameters = get_database_configuration(filename="conference_attendees.ini")
-            conn = pg2.connect(**parameters)
+            connection_pool = get_pool()
+            conn = connection_pool.get_connection()
             cur = conn.cursor()
+            if timer is not None:
+                timer.connected()
+                cur = timer.wrap(cur)
             # Here goes the query
-            cur, result = func_to_modify(cur, *args)
+            cur, result = func_to_modify(cur, *args, **kwargs)
             conn.commit()
             cur.close()
         except (Exception, pg2.DatabaseError) as error:
+            if timer is not None:
+                timer.failed(error)
             print(error)
         finally:
+            if timer is not None:
+                timer.finish()
             if conn is not None:
-                conn.close()
+                connection_pool.release_connection(conn)
                 return result
 
     return complete_query
@@ -39,7 +234,7 @@ def base_query(func_to_modify):
 def store_attendee_data_in_postgresql(cur, attendee_data):
     """
     Takes in a list of attendee's data, adds current time to it,
-    saves it in the database.
+    saves it in the database. Returns the new attendee's guest_id.
     """
     if len(attendee_data) == 6:
         attendee_data.append(datetime.now())
@@ -54,32 +249,215 @@ def store_attendee_data_in_postgresql(cur, attendee_data):
                     phone,
                     date_added)
             VALUES
-                    (%s,%s,%s,%s,%s,%s,%s);"""
+                    (%s,%s,%s,%s,%s,%s,%s)
+            RETURNING guest_id;"""
     cur.execute(sql, (first, last, city, company, email, phone, date))
-    return cur, None
+    guest_id = cur.fetchone()[0]
+    return cur, guest_id
 
 
 @base_query
-def get_list_all_attendees(cur):
+def get_list_all_attendees(cur, columns=ATTENDEE_COLUMNS):
     """
-    Creates and returns a list of tuples of attendee's data
-    - each item in such a list is one piece of info.
-    For example list[0][0] is first_name of the first attendee.
+    Creates and returns a list of Attendee records (tuples of attendee's
+    data) - each item in such a record is one piece of info.
+    For example list[0][0] (or list[0].guest_id) is guest_id of the first
+    attendee. Pass columns to read only some of them (see
+    select_attendee_columns).
     """
-    sql = """SELECT * FROM guestlist ORDER BY guest_id;"""
+    selected, record_type = select_attendee_columns(columns)
+    sql = f"""SELECT {selected} FROM guestlist ORDER BY guest_id;"""
     cur.execute(sql)
-    all_attendees = cur.fetchall()
+    all_attendees = make_attendees(cur.fetchall(), record_type)
     return cur, all_attendees
 
 
 @base_query
-def get_matching_attendees(cur, attendees_name):
-    """Returns a list of tuples with attendees data."""
-    sql = """SELECT * FROM guestlist
+def get_attendee(cur, guest_id, columns=ATTENDEE_COLUMNS):
+    """
+    Returns an Attendee record with the data of the attendee with
+    the given guest_id, or None if there is no such attendee.
+    """
+    selected, record_type = select_attendee_columns(columns)
+    sql = f"""SELECT {selected} FROM guestlist WHERE guest_id = %s;"""
+    cur.execute(sql, (guest_id,))
+    attendee = cur.fetchone()
+    if attendee is not None:
+        attendee = record_type._make(attendee)
+    return cur, attendee
+
+
+@base_query
+def get_guestlist_version(cur):
+    """
+    Returns a text that changes whenever attendees are added, changed or
+    removed: the database's id and the value of the sequence bumped by
+    the guestlist_version trigger (see the 0010_guestlist_version_sequence
+    migration). Returns None if the migration is not applied, or if
+    a change is not committed yet, as the version is bumped before it
+    is (the trigger holds a shared advisory lock until then, so that
+    writers never wait for each other). Reading it is a one-row query,
+    whatever the size of the guest list.
+    """
+    cur.execute("""SELECT to_regclass('guestlist_version_seq') IS NOT NULL;""")
+    if not cur.fetchone()[0]:
+        return cur, None
+    sql = """SELECT CASE WHEN pg_try_advisory_xact_lock(hashtext('guestlist_version'))
+                         THEN instance_id || '-' || last_value END
+             FROM guestlist_version, guestlist_version_seq;"""
+    cur.execute(sql)
+    return cur, cur.fetchone()[0]
+
+
+@base_query
+def get_attendees_page(cur, after_guest_id=0, page_size=PAGE_SIZE, name_filter=None,
+                       columns=ATTENDEE_COLUMNS):
+    """
+    Returns a list of Attendee records of up to page_size attendees
+    whose guest_id is greater than after_guest_id, ordered by guest_id.
+    Pass the guest_id of the last attendee of a page to get the next one.
+    If name_filter is given, only attendees whose full name contains it
+    are returned. Pass columns to read only some of them
+    (see select_attendee_columns).
+    """
+    selected, record_type = select_attendee_columns(columns)
+    if name_filter:
+        sql = f"""SELECT {selected} FROM guestlist
+                 WHERE guest_id > %s
+                   AND first_name || ' ' || last_name ILIKE %s
+                 ORDER BY guest_id
+                 LIMIT %s;"""
+        pattern = "%" + escape_like_pattern(name_filter) + "%"
+        cur.execute(sql, (after_guest_id, pattern, page_size))
+    else:
+        sql = f"""SELECT {selected} FROM guestlist
+                 WHERE guest_id > %s
+                 ORDER BY guest_id
+                 LIMIT %s;"""
+        cur.execute(sql, (after_guest_id, page_size))
+    attendees_page = make_attendees(cur.fetchall(), record_type)
+    return cur, attendees_page
+
+
+def fetch_in_batches(conn, sql, parameters=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Yields the rows returned by the query one by one. Reads them through
+    a server-side cursor batch_size rows at a time, so the whole result
+    is never held in memory.
+    """
+    cur = conn.cursor(name=f"stream_{next(_cursor_numbers)}")
+    cur.itersize = batch_size
+    cur.execute(sql, parameters)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+    cur.close()
+
+
+def stream_query(sql, parameters=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Yields the rows returned by the query (see fetch_in_batches).
+    Unlike the base_query functions, database errors are raised.
+    Inside a transaction() block the transaction's connection is used.
+    """
+    session = current_session()
+    if session is not None:
+        yield from fetch_in_batches(session.conn, sql, parameters, batch_size)
+        return
+
+    connection_pool = get_pool()
+    conn = connection_pool.get_connection()
+    try:
+        yield from fetch_in_batches(conn, sql, parameters, batch_size)
+        conn.commit()
+    finally:
+        connection_pool.release_connection(conn)
+
+
+def copy_to_file(sql, output_file):
+    """
+    Runs a COPY ... TO STDOUT statement and writes its output
+    straight into the binary file object. Like stream_query, database
+    errors are raised and a transaction() block's connection is used.
+    """
+    session = current_session()
+    if session is not None:
+        cur = session.conn.cursor()
+        cur.copy_expert(sql, output_file)
+        cur.close()
+        return
+
+    connection_pool = get_pool()
+    conn = connection_pool.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.copy_expert(sql, output_file)
+        cur.close()
+        conn.commit()
+    finally:
+        connection_pool.release_connection(conn)
+
+
+def iterate_all_attendees(batch_size=STREAM_BATCH_SIZE, columns=ATTENDEE_COLUMNS):
+    """
+    Yields Attendee records one by one, ordered by guest_id,
+    reading them from the database batch_size rows at a time
+    (see stream_query).
+    """
+    selected, record_type = select_attendee_columns(columns)
+    sql = f"""SELECT {selected} FROM guestlist ORDER BY guest_id;"""
+    return map(record_type._make, stream_query(sql, batch_size=batch_size))
+
+
+@base_query
+def get_matching_attendees(cur, attendees_name, columns=ATTENDEE_COLUMNS):
+    """
+    Returns a list of Attendee records of the attendees whose full name
+    matches the ILIKE pattern.
+    On large tables the lookup uses the trigram index on the full name
+    created by the 0002_trigram_search_indexes migration (see schema.py).
+    """
+    selected, record_type = select_attendee_columns(columns)
+    sql = f"""SELECT {selected} FROM guestlist
              WHERE first_name || ' ' || last_name
              ILIKE %s"""
     cur.execute(sql, (attendees_name,))
-    attendees_list = cur.fetchall()
+    attendees_list = make_attendees(cur.fetchall(), record_type)
+    return cur, attendees_list
+
+
+def escape_like_pattern(text):
+    """
+    Escapes the characters that have a special meaning in LIKE patterns,
+    so that the text is matched literally.
+    """
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@base_query
+def search_attendees(cur, query, limit=SEARCH_LIMIT, columns=ATTENDEE_COLUMNS):
+    """
+    Takes in a part of an attendee's name, email or company.
+    Returns a list of Attendee records of up to limit matching
+    attendees, best matches first. Uses the trigram indexes created
+    by the 0002_trigram_search_indexes migration (see schema.py).
+    """
+    selected, record_type = select_attendee_columns(columns)
+    sql = f"""SELECT {selected} FROM guestlist
+             WHERE first_name || ' ' || last_name ILIKE %(pattern)s
+                OR email ILIKE %(pattern)s
+                OR company ILIKE %(pattern)s
+             ORDER BY greatest(
+                        similarity(first_name || ' ' || last_name, %(query)s),
+                        similarity(email, %(query)s),
+                        similarity(company, %(query)s)) DESC,
+                      guest_id
+             LIMIT %(limit)s;"""
+    pattern = "%" + escape_like_pattern(query.strip()) + "%"
+    cur.execute(sql, {"pattern": pattern, "query": query.strip(), "limit": limit})
+    attendees_list = make_attendees(cur.fetchall(), record_type)
     return cur, attendees_list
 
 
@@ -95,12 +473,49 @@ def remove_attendee(cur, guest_id):
     return cur, None
 
 
+@base_query
+def remove_attendees(cur, guest_ids=None, company=None,
+                     added_after=None, added_before=None):
+    """
+    Deletes all the attendees that match every given filter:
+    - guest_ids: an iterable of guest_ids,
+    - company: the exact company name,
+    - added_after / added_before: date_added is at or after / before it.
+    Runs as one DELETE statement in one transaction.
+    Returns a list of Attendee records of the deleted attendees.
+    Refuses to run without any filter, so it never empties the table.
+    """
+    conditions, parameters = [], []
+    if guest_ids is not None:
+        conditions.append("guest_id = ANY(%s)")
+        parameters.append([int(guest_id) for guest_id in guest_ids])
+    if company is not None:
+        conditions.append("company = %s")
+        parameters.append(company)
+    if added_after is not None:
+        conditions.append("date_added >= %s")
+        parameters.append(added_after)
+    if added_before is not None:
+        conditions.append("date_added < %s")
+        parameters.append(added_before)
+    if not conditions:
+        raise ValueError("remove_attendees needs at least one filter")
+
+    sql = f"""DELETE FROM guestlist
+              WHERE {" AND ".join(conditions)}
+              RETURNING {", ".join(ATTENDEE_COLUMNS)};"""
+    cur.execute(sql, parameters)
+    removed_attendees = make_attendees(cur.fetchall())
+    return cur, removed_attendees
+
+
 def create_text_version_list_of_all_attendees(list_from_query):
     """
-    Takes in a list of tuples created by SQL query. For every
-    tuple (position from SQL database) creates a text string
+    Takes in a list of Attendee records created by SQL query. For every
+    record (position from SQL database) creates a text string
     that can be presented to the user. Returns a list of such
-    strings.
+    strings. The records need only the guest_id, first_name,
+    last_name, city and company columns.
 
     Result Example: John Doe from Warsaw wokring at GDF, id 55
     """
@@ -108,61 +523,141 @@ def create_text_version_list_of_all_attendees(list_from_query):
     text_version_list_of_all_attendees = []
     for attendee in list_from_query:
         text_version_list_of_all_attendees.append(
-            f"{attendee[1]} {attendee[2]} from {attendee[3]}"
-            f" working at {attendee[4]}, id {attendee[0]}"
+            f"{attendee.first_name} {attendee.last_name} from {attendee.city}"
+            f" working at {attendee.company}, id {attendee.guest_id}"
         )
         counter += 1
     return text_version_list_of_all_attendees
 
 
-def get_attendees_list_format_docx(directory):
+def create_docx_paragraph_text(attendee):
+    """
+    Takes in an Attendee record. Returns the text of
+    the paragraph presenting the attendee in the docx list.
+    """
+    return (
+        f"[ ] id {attendee.guest_id}:"
+        f"\n\t{attendee.first_name} {attendee.last_name} from {attendee.city}"
+        f"\n\tWorking at {attendee.company},"
+        f"\n\temail: {attendee.email},"
+        f"\n\tnumber: {attendee.phone}"
+    )
+
+
+class OperationCancelled(Exception):
+    """Raised by a progress callback to stop a long running operation."""
+
+
+def report_progress(rows, progress_callback, every=STREAM_BATCH_SIZE):
+    """
+    Yields the rows unchanged. After every 'every' rows and after
+    the last one calls progress_callback with the number of rows
+    yielded so far. Does nothing more if progress_callback is None.
+    """
+    if progress_callback is None:
+        yield from rows
+        return
+    count = 0
+    for row in rows:
+        yield row
+        count += 1
+        if count % every == 0:
+            progress_callback(count)
+    progress_callback(count)
+
+
+def remove_unfinished_file(directory):
+    """Deletes a file that was left half-written, if it exists."""
+    if os.path.exists(directory):
+        os.unlink(directory)
+
+
+def get_attendees_list_format_docx(directory, streaming=False, progress_callback=None,
+                                   attendees=None):
     """
     Takes in a directory with the 'to-be-created' filename.
     Creates a word document (*.docx) with a list of attendees.
     Returns the directory with the created file.
+
+    With streaming=True the attendees are read from the database in
+    batches and their paragraphs are written straight into the file
+    (see docx_stream.py), so memory use does not grow with the guest list.
+    progress_callback is then called with the number of attendees written
+    so far (see report_progress). If it raises OperationCancelled, or
+    the export fails, the unfinished file is deleted.
+
+    attendees, if given, is an iterable of Attendee records exported
+    instead of the ones in PostgreSQL (e.g. from a storage.StorageEngine).
     """
+    if streaming:
+        if attendees is None:
+            attendees = iterate_all_attendees()
+        attendees = report_progress(attendees, progress_callback)
+        paragraphs = (create_docx_paragraph_text(attendee) for attendee in attendees)
+        try:
+            return write_docx_paragraphs(f"{directory}", paragraphs)
+        except BaseException:
+            remove_unfinished_file(f"{directory}")
+            raise
+
+    import docx
+
     doc = docx.Document()
-    attendees_list = get_list_all_attendees()
-    counter = 0
-    for attendee in attendees_list:
-        attendees_list[counter] = (
-            f"[ ] id {attendee[0]}:"
-            f"\n\t{attendee[1]} {attendee[2]} from {attendee[3]}"
-            f"\n\tWorking at {attendee[4]},"
-            f"\n\temail: {attendee[5]},"
-            f"\n\tnumber: {attendee[6]}"
-        )
-        doc.add_paragraph(attendees_list[counter])
-        counter += 1
+    if attendees is None:
+        attendees = get_list_all_attendees()
+    for attendee in attendees:
+        doc.add_paragraph(create_docx_paragraph_text(attendee))
     doc.save(f"{directory}")
     return directory
 
 
-def get_attendees_list_format_xlsx(directory=None):
+def get_attendees_list_format_xlsx(directory=None, streaming=False,
+                                   progress_callback=None, attendees=None):
     """
     Takes in a directory with the 'to-be-created' filename.
     Creates an excel document (*.xlsx) with a list of attendees.
     Returns the directory with the created file.
+
+    With streaming=True the attendees are read from the database in
+    batches and written in xlsxwriter's constant memory mode, so memory
+    use does not grow with the guest list (see xlsx_file_add_rows).
+    progress_callback is then called with the number of attendees written
+    so far (see report_progress). If it raises OperationCancelled, or
+    the export fails, no file is left behind.
+
+    attendees, if given, is an iterable of Attendee records exported
+    instead of the ones in PostgreSQL (e.g. from a storage.StorageEngine).
     """
     if directory is None:
         return None
 
+    import xlsxwriter
+
+    if streaming:
+        xlsx_file = xlsxwriter.Workbook(directory, {
+            "constant_memory": True,
+            "default_date_format": XLSX_DATE_FORMAT,
+        })
+        if attendees is None:
+            attendees = iterate_all_attendees()
+        attendees = report_progress(attendees, progress_callback)
+        try:
+            xlsx_file_add_rows(attendees, xlsx_file, XLSX_COLUMN_TITLES)
+            xlsx_file.close()
+        except BaseException:
+            # An error while closing must not hide the one being raised
+            with suppress(Exception):
+                xlsx_file.close()
+            remove_unfinished_file(directory)
+            raise
+        return directory
+
     xlsx_file = xlsxwriter.Workbook(directory)
     worksheet = xlsx_file.add_worksheet()
 
-    attendees_list = get_list_all_attendees()
-
-    column_titles = [
-        "id",
-        "first name",
-        "last_name",
-        "city",
-        "company",
-        "email",
-        "phone number",
-        "date added",
-    ]
-    worksheet = xlsx_file_add_column_titles(column_titles, worksheet)
+    attendees_list = get_list_all_attendees() if attendees is None else attendees
+
+    worksheet = xlsx_file_add_column_titles(XLSX_COLUMN_TITLES, worksheet)
     xlsx_file_add_data(attendees_list, worksheet)
     xlsx_file.close()
     return directory
@@ -197,3 +692,138 @@ def xlsx_file_add_data(list_of_item_lists, worksheet):
         column = 0
         row += 1
     return worksheet
+
+
+def xlsx_file_add_rows(rows, workbook, column_titles, max_rows=XLSX_MAX_ROWS):
+    """
+    Takes in an iterable of item tuples, a workbook opened with
+    xlsxwriter module and a list with column titles. Writes every
+    tuple as one row, in order, so it works with constant memory mode.
+    Dates are written as excel dates. Every worksheet starts with the
+    column titles; when one holds max_rows rows, the next one is added.
+    Returns the workbook.
+    """
+    worksheet = None
+    row = max_rows
+    for item_list in rows:
+        if row == max_rows:
+            worksheet = workbook.add_worksheet()
+            worksheet.write_row(0, 0, column_titles)
+            row = 1
+        worksheet.write_row(row, 0, item_list)
+        row += 1
+    if worksheet is None:
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, column_titles)
+    return workbook
+
+
+class ProgressFile:
+    """
+    Wraps a binary file and reports the number of lines written
+    to it, less the header line, the same way report_progress does.
+    """
+    def __init__(self, output_file, progress_callback, every=STREAM_BATCH_SIZE):
+        self.output_file = output_file
+        self.progress_callback = progress_callback
+        self.every = every
+        self.lines = 0
+
+    def write(self, data):
+        self.output_file.write(data)
+        lines = self.lines + data.count(b"\n")
+        if lines // self.every > self.lines // self.every:
+            self.progress_callback(max(lines - 1, 0))
+        self.lines = lines
+
+    def finish(self):
+        """Reports the final number of rows."""
+        self.progress_callback(max(self.lines - 1, 0))
+
+
+def get_attendees_list_format_csv(directory, streaming=True, progress_callback=None,
+                                  attendees=None):
+    """
+    Takes in a directory with the 'to-be-created' filename.
+    Creates a csv file with a list of attendees, with a header row
+    of column names. Returns the directory with the created file.
+
+    The rows are written by PostgreSQL (COPY ... TO STDOUT) straight
+    into the file, with no Python objects created per attendee; the
+    file is always streamed, streaming is only taken for the same
+    arguments as the other exports. progress_callback and attendees
+    work like in get_attendees_list_format_docx.
+    """
+    columns = ", ".join(ATTENDEE_COLUMNS)
+    try:
+        if attendees is not None:
+            attendees = report_progress(attendees, progress_callback)
+            with open(directory, "w", newline="") as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(ATTENDEE_COLUMNS)
+                writer.writerows(attendees)
+            return directory
+
+        sql = f"""COPY (SELECT {columns} FROM guestlist ORDER BY guest_id)
+                  TO STDOUT WITH (FORMAT csv, HEADER)"""
+        with open(directory, "wb") as csv_file:
+            if progress_callback is None:
+                copy_to_file(sql, csv_file)
+            else:
+                progress_file = ProgressFile(csv_file, progress_callback)
+                copy_to_file(sql, progress_file)
+                progress_file.finish()
+        return directory
+    except BaseException:
+        remove_unfinished_file(directory)
+        raise
+
+
+def parquet_schema():
+    """Returns the pyarrow schema of the parquet export."""
+    import pyarrow as pa
+
+    return pa.schema(
+        [pa.field("guest_id", pa.int64())]
+        + [pa.field(column, pa.string()) for column in GUESTLIST_COLUMNS[:-1]]
+        + [pa.field("date_added", pa.timestamp("us"))])
+
+
+def get_attendees_list_format_parquet(directory, streaming=True, progress_callback=None,
+                                      attendees=None):
+    """
+    Takes in a directory with the 'to-be-created' filename.
+    Creates a parquet file with a list of attendees. Returns
+    the directory with the created file.
+
+    The attendees are read from the database in batches and every
+    PARQUET_BATCH_SIZE of them are turned into columns and written as
+    one row group, so memory use does not grow with the guest list.
+    The file is always streamed, streaming is only taken for the same
+    arguments as the other exports. progress_callback and attendees
+    work like in get_attendees_list_format_docx. Needs pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if attendees is None:
+        attendees = iterate_all_attendees()
+    attendees = report_progress(attendees, progress_callback)
+    schema = parquet_schema()
+    writer = pq.ParquetWriter(directory, schema)
+    try:
+        while True:
+            batch = list(itertools.islice(attendees, PARQUET_BATCH_SIZE))
+            if not batch:
+                break
+            arrays = [pa.array(column, type=field.type)
+                      for column, field in zip(zip(*batch), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        writer.close()
+    except BaseException:
+        # An error while closing must not hide the one being raised
+        with suppress(Exception):
+            writer.close()
+        remove_unfinished_file(directory)
+        raise
+    return directory
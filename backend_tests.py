@@ -1,24 +1,41 @@
+import csv
 import docx
 import os
 import pandas as pd
+import subprocess
+import sys
 import unittest
 import xlsxwriter
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from backend import (
+    Attendee,
+    OperationCancelled,
     base_query,
     create_text_version_list_of_all_attendees,
+    escape_like_pattern,
+    get_attendee,
+    get_attendees_list_format_csv,
     get_attendees_list_format_docx,
+    get_attendees_list_format_parquet,
     get_attendees_list_format_xlsx,
+    get_attendees_page,
     get_list_all_attendees,
     get_matching_attendees,
+    iterate_all_attendees,
     remove_attendee,
+    remove_attendees,
+    search_attendees,
+    select_attendee_columns,
     store_attendee_data_in_postgresql,
+    transaction,
     xlsx_file_add_column_titles,
-    xlsx_file_add_data
+    xlsx_file_add_data,
+    xlsx_file_add_rows
 )
-from config import get_database_configuration
+from config import get_cached_configuration, get_database_configuration
+from schema import extension_installed
 
 
 # Functions and variables that save code
@@ -58,6 +75,33 @@ class BackendTests(unittest.TestCase):
         self.assertEqual(test_database_config_data['password'],
                          os.environ['DB_PASS_CA'])
 
+    def test_get_cached_configuration(self):
+        """
+        Checks if the cached configuration matches the one read
+        directly from the file and if missing sections fall back to defaults.
+        """
+        self.assertEqual(
+            get_cached_configuration(filename="conference_attendees.ini"),
+            get_database_configuration(filename="conference_attendees.ini"))
+        self.assertEqual(
+            get_cached_configuration(filename="conference_attendees.ini",
+                                     section="no_such_section",
+                                     defaults={'test': '1'}),
+            {'test': '1'})
+
+    def test_base_query_reuses_connection(self):
+        """
+        Checks if two consecutive queries are served by the same
+        pooled connection instead of opening a new one.
+        """
+        @base_query
+        def test_func(cur):
+            cur.execute("SELECT pg_backend_pid();")
+            return cur, cur.fetchone()[0]
+        pid = test_func()
+        self.assertIsInstance(pid, int)
+        self.assertEqual(test_func(), pid)
+
     def test_base_query(self):
         """
         Checks if base_query is able to take in a specific test_func,
@@ -80,7 +124,8 @@ class BackendTests(unittest.TestCase):
         """Checks data types of all attendees attributes."""
         all_attendees = get_list_all_attendees()
         for attendee in all_attendees:
-            self.assertEqual(type(attendee), tuple)
+            self.assertEqual(type(attendee), Attendee)
+            self.assertIsInstance(attendee, tuple)
             for attribute in attendee:
                 if attribute == attendee[0]:
                     self.assertEqual(type(attribute), int)
@@ -89,6 +134,49 @@ class BackendTests(unittest.TestCase):
                 else:
                     self.assertEqual(type(attribute), str)
 
+    def test_get_attendees_page(self):
+        """
+        Checks if going through the pages one after another
+        gives every attendee once and if the filter is applied.
+        """
+        store_attendee_data_in_postgresql(test_attendee_data)
+        paged_attendees = []
+        page = get_attendees_page(0, 2)
+        while page:
+            self.assertLessEqual(len(page), 2)
+            paged_attendees += page
+            page = get_attendees_page(page[-1][0], 2)
+        filtered = get_attendees_page(0, 10, 'gildo verycompl')
+        all_attendees = get_list_all_attendees()
+        remove_test_attendee()
+
+        self.assertEqual(paged_attendees, all_attendees)
+        self.assertEqual([attendee[1] for attendee in filtered], ['Hermenegildo'])
+
+    def test_select_columns(self):
+        """
+        Checks if only the requested columns are read, as named fields
+        in the requested order, and if unknown columns are refused.
+        """
+        store_attendee_data_in_postgresql(test_attendee_data)
+        attendee = get_matching_attendees('Hermenegildo Verycomplicatedname')[0]
+        names = get_matching_attendees('Hermenegildo Verycomplicatedname',
+                                       columns=('last_name', 'guest_id'))
+        page = get_attendees_page(attendee.guest_id - 1, 1,
+                                  columns=('guest_id', 'first_name'))
+        single = get_attendee(attendee.guest_id, columns=['email'])
+        streamed = list(iterate_all_attendees(columns=('guest_id',)))
+        remove_test_attendee()
+
+        self.assertEqual(names, [('Verycomplicatedname', attendee.guest_id)])
+        self.assertEqual(names[0]._fields, ('last_name', 'guest_id'))
+        self.assertEqual(page[0].first_name, 'Hermenegildo')
+        self.assertEqual(len(page[0]), 2)
+        self.assertEqual(single.email, attendee.email)
+        self.assertIn((attendee.guest_id,), streamed)
+        with self.assertRaises(ValueError):
+            select_attendee_columns(('guest_id', 'password'))
+
     def test_remove_attendee(self):
         """
         Checks if the chosen attendee is removed from the database by:
@@ -103,6 +191,100 @@ class BackendTests(unittest.TestCase):
         remove_attendee(test_attendee[0][0])   # [0][0] gets the attendee's guest_id
         self.assertFalse(get_matching_attendees('Hermenegildo Verycomplicatedname'))
 
+    def test_document_libraries_imported_lazily(self):
+        """
+        Checks if importing backend (in a new process) does not load
+        the libraries that only the exports need.
+        """
+        loaded = subprocess.run(
+            [sys.executable, '-c',
+             'import sys, backend;'
+             ' print(sorted({"docx", "xlsxwriter", "pandas"} & set(sys.modules)))'],
+            capture_output=True, text=True, check=True).stdout.strip()
+        self.assertEqual(loaded, '[]')
+
+    def test_escape_like_pattern(self):
+        """Checks if LIKE wildcards are escaped."""
+        self.assertEqual(escape_like_pattern('50%_off\\'), '50\\%\\_off\\\\')
+
+    def test_search_attendees(self):
+        """
+        Checks if the attendee is found by a part of their name,
+        email or company and if the number of results is limited.
+        """
+        if not extension_installed('pg_trgm'):
+            self.skipTest('pg_trgm is not installed, run schema.migrate()')
+        store_attendee_data_in_postgresql(test_attendee_data)
+        by_name = search_attendees('gildo Verycompl')
+        by_email = search_attendees('JD@TESTERS')
+        limited = search_attendees('e', 1)
+        remove_test_attendee()
+
+        self.assertEqual(by_name[0][1:3], ('Hermenegildo', 'Verycomplicatedname'))
+        self.assertIn('Hermenegildo', [attendee[1] for attendee in by_email])
+        self.assertEqual(len(limited), 1)
+
+    def test_remove_attendees(self):
+        """
+        Checks if the attendees matching all the filters are removed
+        at once and returned, and if nothing is removed without filters.
+        """
+        for _ in range(3):
+            store_attendee_data_in_postgresql(test_attendee_data)
+        test_attendees = get_matching_attendees('Hermenegildo Verycomplicatedname')
+        guest_ids = [attendee[0] for attendee in test_attendees]
+
+        self.assertIsNone(remove_attendees())
+        removed_by_id = remove_attendees(guest_ids[:2])
+        self.assertEqual(sorted(removed_by_id), sorted(test_attendees[:2]))
+        self.assertEqual(remove_attendees(guest_ids[2:],
+                                          added_after=datetime(2011, 1, 1)), [])
+        removed_by_filter = remove_attendees(
+            guest_ids[2:],
+            company='Testers',
+            added_after=datetime(2010, 10, 10),
+            added_before=datetime(2010, 10, 11))
+        self.assertEqual(removed_by_filter, test_attendees[2:])
+        self.assertFalse(get_matching_attendees('Hermenegildo Verycomplicatedname'))
+
+    def test_transaction(self):
+        """
+        Checks if several operations inside a transaction share one
+        connection, see each other's changes and are committed together.
+        """
+        @base_query
+        def backend_pid(cur):
+            cur.execute("SELECT pg_backend_pid();")
+            return cur, cur.fetchone()[0]
+
+        with transaction():
+            guest_id = store_attendee_data_in_postgresql(test_attendee_data)
+            self.assertEqual(get_attendee(guest_id)[1:], test_attendee_data)
+            self.assertEqual(backend_pid(), backend_pid())
+            remove_attendee(guest_id)
+        self.assertIsNone(get_attendee(guest_id))
+
+    def test_transaction_rollback_and_savepoint(self):
+        """
+        Checks if an exception rolls back the whole transaction
+        and a failed savepoint only the operations made inside it.
+        """
+        with self.assertRaises(ZeroDivisionError):
+            with transaction():
+                store_attendee_data_in_postgresql(test_attendee_data)
+                1 / 0
+        self.assertFalse(get_matching_attendees('Hermenegildo Verycomplicatedname'))
+
+        with transaction() as session:
+            kept_id = store_attendee_data_in_postgresql(test_attendee_data)
+            with self.assertRaises(ValueError):
+                with session.savepoint():
+                    store_attendee_data_in_postgresql(test_attendee_data)
+                    raise ValueError()
+        attendees = get_matching_attendees('Hermenegildo Verycomplicatedname')
+        remove_test_attendee()
+        self.assertEqual([attendee[0] for attendee in attendees], [kept_id])
+
     def test_store_attendee_data_in_postgresql(self):
         """Checks if the chosen attendee is added to the database."""
         store_attendee_data_in_postgresql(test_attendee_data)
@@ -149,6 +331,54 @@ class BackendTests(unittest.TestCase):
                     paragraph)
         os.unlink('test.docx')  # cleanup
 
+    def test_get_attendees_list_format_docx_streaming(self):
+        """
+        Checks if the streamed docx file has the same paragraphs
+        as the one created with python-docx.
+        """
+        get_attendees_list_format_docx('test.docx')
+        get_attendees_list_format_docx('test_streaming.docx', streaming=True)
+        expected = [paragraph.text
+                    for paragraph in docx.Document('test.docx').paragraphs]
+        streamed = [paragraph.text
+                    for paragraph in docx.Document('test_streaming.docx').paragraphs]
+        self.assertEqual(streamed, expected)
+        os.unlink('test.docx')
+        os.unlink('test_streaming.docx')
+
+    def test_export_progress_and_cancellation(self):
+        """
+        Checks if the progress of a streamed export is reported
+        and if a cancelled export leaves no file behind.
+        """
+        reported = []
+        get_attendees_list_format_xlsx('test.xlsx', True, reported.append)
+        os.unlink('test.xlsx')
+        self.assertEqual(reported[-1], len(get_list_all_attendees()))
+
+        def cancel(count):
+            raise OperationCancelled()
+        for export in (get_attendees_list_format_docx,
+                       get_attendees_list_format_xlsx,
+                       get_attendees_list_format_csv):
+            with self.assertRaises(OperationCancelled):
+                export('test.file', True, cancel)
+            self.assertFalse(os.path.exists('test.file'))
+
+    def test_failed_export_leaves_no_file(self):
+        """Checks if an export that fails half-way leaves no file behind."""
+        def failing_attendees():
+            yield Attendee(1, 'Hermenegildo', 'Failname', 'New York', 'Testers',
+                           'jd@testers.com', '123456789', datetime(2019, 9, 13))
+            raise RuntimeError('the database went away')
+        for export in (get_attendees_list_format_docx,
+                       get_attendees_list_format_xlsx,
+                       get_attendees_list_format_csv,
+                       get_attendees_list_format_parquet):
+            with self.assertRaises(RuntimeError):
+                export('test.file', True, attendees=failing_attendees())
+            self.assertFalse(os.path.exists('test.file'))
+
     def test_get_attendees_list_format_xlsx_returns_none(self):
         """Checks if the function without any arguments returns None."""
         self.assertEqual(get_attendees_list_format_xlsx(), None)
@@ -158,6 +388,90 @@ class BackendTests(unittest.TestCase):
         self.assertEqual(get_attendees_list_format_xlsx('test.xlsx'), 'test.xlsx')
         os.unlink('test.xlsx')
 
+    def test_get_attendees_list_format_xlsx_streaming(self):
+        """
+        Checks if the streamed xlsx file contains every attendee
+        with the date added stored as a date.
+        """
+        get_attendees_list_format_xlsx('test.xlsx', streaming=True)
+        xlsx_file_check = pd.read_excel('test.xlsx')
+        attendees_list = get_list_all_attendees()
+
+        self.assertEqual(list(xlsx_file_check['id']),
+                         [attendee[0] for attendee in attendees_list])
+        for date_added, attendee in zip(xlsx_file_check['date added'],
+                                        attendees_list):
+            self.assertAlmostEqual(date_added.to_pydatetime(), attendee[7],
+                                   delta=timedelta(milliseconds=1))
+        os.unlink('test.xlsx')
+
+    def test_get_attendees_list_format_csv(self):
+        """
+        Checks if the csv file written by COPY, and the one written from
+        the given attendees, contain every attendee after a header row.
+        """
+        reported = []
+        attendees_list = get_list_all_attendees()
+        expected = [[str(value) for value in attendee] for attendee in attendees_list]
+        self.assertEqual(get_attendees_list_format_csv('test.csv', True, reported.append),
+                         'test.csv')
+        with open('test.csv', newline='') as csv_file:
+            rows = list(csv.reader(csv_file))
+        self.assertEqual(rows[0], list(Attendee._fields))
+        self.assertEqual([row[:7] for row in rows[1:]],
+                         [row[:7] for row in expected])
+        self.assertEqual(reported[-1], len(attendees_list))
+
+        get_attendees_list_format_csv('test.csv', attendees=iter(attendees_list))
+        with open('test.csv', newline='') as csv_file:
+            self.assertEqual(list(csv.reader(csv_file))[1:], expected)
+        os.unlink('test.csv')
+
+    def test_get_attendees_list_format_parquet(self):
+        """
+        Checks if the parquet file contains every attendee
+        with the guest_id and the date added kept as numbers and dates.
+        """
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        get_attendees_list_format_parquet('test.parquet')
+        table = pq.read_table('test.parquet')
+        self.assertEqual(table.column_names, list(Attendee._fields))
+        self.assertEqual([tuple(row.values()) for row in table.to_pylist()],
+                         [tuple(attendee) for attendee in get_list_all_attendees()])
+        os.unlink('test.parquet')
+
+    def test_iterate_all_attendees(self):
+        """
+        Checks if streaming the attendees in small batches gives
+        the same rows as fetching all of them at once.
+        """
+        self.assertEqual(list(iterate_all_attendees(batch_size=1)),
+                         get_list_all_attendees())
+
+    def test_xlsx_file_add_rows(self):
+        """
+        Checks if a new worksheet, starting with the column titles,
+        is added when the previous one is full.
+        """
+        row_data = ("test1", "test2", "test3")
+        multiple_rows = [row_data for _ in range(10)]
+
+        xlsx_file = xlsxwriter.Workbook('test.xlsx', {'constant_memory': True})
+        xlsx_file_add_rows(multiple_rows, xlsx_file, ['a', 'b', 'c'], max_rows=4)
+        xlsx_file.close()
+
+        sheets = pd.read_excel('test.xlsx', sheet_name=None)
+        self.assertEqual([len(sheet) for sheet in sheets.values()], [3, 3, 3, 1])
+        for sheet in sheets.values():
+            self.assertEqual(list(sheet.columns), ['a', 'b', 'c'])
+            for row in sheet.values:
+                self.assertEqual(tuple(row), row_data)
+
+        os.unlink('test.xlsx')
+
     def test_xlsx_file_add_column_titles(self):
         """
         Checks if the columns added to a newly created xlsx file
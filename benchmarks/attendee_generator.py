@@ -0,0 +1,51 @@
+import random
+from datetime import datetime, timedelta
+
+# Every synthetic attendee's email ends with this domain,
+# so they can be told apart from real attendees and removed
+BENCHMARK_EMAIL_DOMAIN = "benchmark.invalid"
+
+FIRST_NAMES = [
+    "Adam", "Agnieszka", "Aleksander", "Alicja", "Anna", "Antoni", "Barbara",
+    "Bartosz", "Daniel", "Dominika", "Ewa", "Filip", "Hanna", "Igor", "Jakub",
+    "Jan", "Joanna", "Julia", "Kacper", "Karolina", "Katarzyna", "Krzysztof",
+    "Lena", "Magdalena", "Maja", "Marek", "Maria", "Mateusz", "Michał",
+    "Natalia", "Oliwia", "Paweł", "Piotr", "Szymon", "Tomasz", "Weronika",
+    "Wiktor", "Zofia", "John", "Mary", "James", "Linda", "Robert", "Emma",
+]
+LAST_NAME_PARTS = [
+    "Now", "Kowal", "Wiśn", "Wójc", "Kamiń", "Lewand", "Zieliń", "Szyman",
+    "Woźniak", "Dąbrow", "Kozłow", "Jankow", "Mazur", "Kwiat", "Krawcz",
+    "Piotrow", "Grabow", "Pawłow", "Michal", "Król", "Wiecz", "Jabłoń",
+]
+LAST_NAME_ENDINGS = ["ak", "ski", "ska", "ewicz", "czyk", "ek", "owski", "iec"]
+CITIES = [
+    "Warszawa", "Kraków", "Łódź", "Wrocław", "Poznań", "Gdańsk", "Szczecin",
+    "Bydgoszcz", "Lublin", "Katowice", "Berlin", "Prague", "Vienna", "London",
+]
+COMPANIES = [
+    "Coders", "Testers", "GDF", "Datacorp", "Cloudworks", "Netsoft", "Bitfield",
+    "Logicore", "Quantix", "Streamline", "Polysoft", "Ironbyte", "Sunbeam",
+]
+
+
+def generate_attendee(index, seed=0):
+    """
+    Returns the data of the index-th synthetic attendee as a tuple in
+    the backend.GUESTLIST_COLUMNS order. The same index and seed always
+    give the same attendee, no matter in which order they are generated.
+    """
+    rng = random.Random((seed << 32) | index)
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAME_PARTS) + rng.choice(LAST_NAME_ENDINGS)
+    company = rng.choice(COMPANIES)
+    email = f"{first}.{last}.{index}@{company}.{BENCHMARK_EMAIL_DOMAIN}".lower()
+    phone = str(rng.randrange(100000000, 1000000000))
+    date_added = datetime(2019, 9, 1) + timedelta(seconds=index * 7)
+    return first, last, rng.choice(CITIES), company, email, phone, date_added
+
+
+def generate_attendees(count, seed=0, start=0):
+    """Yields count synthetic attendees, starting with the start-th one."""
+    for index in range(start, start + count):
+        yield generate_attendee(index, seed)
@@ -0,0 +1,100 @@
+"""
+Measures how attendee lookups scale with the size of the guest list.
+
+Synthetic attendees are added to the database described in the given
+configuration file and removed at the end. Use a scratch database:
+
+    python -m benchmarks.search_benchmark --config benchmark.ini
+"""
+import argparse
+import random
+import statistics
+import time
+
+from backend import base_query, get_matching_attendees, search_attendees
+from benchmarks.attendee_generator import (
+    BENCHMARK_EMAIL_DOMAIN,
+    generate_attendee,
+    generate_attendees,
+)
+from bulk_ingest import ingest_attendees
+from connection_pool import set_configuration_file
+
+DEFAULT_SIZES = "1000,10000,100000"
+
+
+@base_query
+def remove_benchmark_attendees(cur):
+    """Deletes every synthetic attendee from the database."""
+    sql = """DELETE FROM guestlist WHERE email LIKE %s;"""
+    cur.execute(sql, ("%@%." + BENCHMARK_EMAIL_DOMAIN,))
+    return cur, cur.rowcount
+
+
+@base_query
+def analyze_guestlist(cur):
+    """Refreshes the planner statistics after the table has grown."""
+    cur.execute("""ANALYZE guestlist;""")
+    return cur, None
+
+
+def lookup_queries(size, count, seed):
+    """
+    Returns count parts of names of attendees that are in the table,
+    e.g. 'ia Kowal', like the ones typed at the check-in desk.
+    """
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        first, last = generate_attendee(rng.randrange(size), seed)[:2]
+        queries.append(f"{first[-2:]} {last[:5]}")
+    return queries
+
+
+def measure(function, queries):
+    """Runs the function for every query. Returns the timings in milliseconds."""
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        function(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--config", required=True,
+                        help="configuration file of a scratch database")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="comma separated numbers of synthetic attendees")
+    parser.add_argument("--lookups", type=int, default=50,
+                        help="lookups measured at every size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    set_configuration_file(args.config)
+    lookups = {
+        "get_matching_attendees": lambda query: get_matching_attendees(f"%{query}%"),
+        "search_attendees": search_attendees,
+    }
+
+    print(f"{'attendees':>10} {'function':<24} {'median ms':>10} {'p95 ms':>10}")
+    loaded = 0
+    try:
+        for size in sorted(int(size) for size in args.sizes.split(",")):
+            ingest_attendees(generate_attendees(size - loaded, args.seed, loaded))
+            loaded = size
+            analyze_guestlist()
+            queries = lookup_queries(size, args.lookups, args.seed)
+            for name, function in lookups.items():
+                function(queries[0])    # warm up
+                timings = measure(function, queries)
+                p95 = statistics.quantiles(timings, n=20)[-1]
+                print(f"{size:>10} {name:<24}"
+                      f" {statistics.median(timings):>10.2f} {p95:>10.2f}")
+    finally:
+        remove_benchmark_attendees()
+
+
+if __name__ == "__main__":
+    main()
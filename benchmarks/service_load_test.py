@@ -0,0 +1,176 @@
+"""
+Measures the requests per second and latency of the HTTP service.
+
+Synthetic attendees are added to the database described in the given
+configuration file, the service (http_service.py) is started on it and
+many simulated desks send searches, page reads and single attendee reads
+at the same time. Use a scratch database:
+
+    python -m benchmarks.service_load_test --config benchmark.ini
+    python -m benchmarks.service_load_test --config benchmark.ini --desks 200
+
+With --url, an already running service is used and no attendees are added.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+
+from benchmarks.attendee_generator import generate_attendees
+from benchmarks.search_benchmark import lookup_queries, remove_benchmark_attendees
+from bulk_ingest import ingest_attendees
+from connection_pool import set_configuration_file
+
+# Seconds to wait for the started service to answer
+STARTUP_TIMEOUT = 30
+
+
+def free_port():
+    """Returns a TCP port nobody listens on."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+async def wait_until_ready(session, url):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        try:
+            async with session.get(f"{url}/status") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"the service at {url} did not start")
+        await asyncio.sleep(0.1)
+
+
+def make_requests(guest_ids, queries, rng):
+    """
+    Returns a function that returns the next (kind, path, parameters)
+    to request: mostly searches, like at the check-in desks, then reads
+    of single attendees and of pages of the list.
+    """
+    def next_request():
+        choice = rng.random()
+        if choice < 0.6:
+            return "search", "/search", {"q": rng.choice(queries)}
+        if choice < 0.8:
+            return "get", f"/attendees/{rng.choice(guest_ids)}", {}
+        return "list", "/attendees", {"after": rng.choice(guest_ids), "limit": 100}
+    return next_request
+
+
+async def desk(session, url, next_request, deadline, timings, errors):
+    """Sends one request after another until the deadline."""
+    while time.monotonic() < deadline:
+        kind, path, parameters = next_request()
+        start = time.perf_counter()
+        try:
+            async with session.get(f"{url}{path}", params=parameters) as response:
+                await response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+                    continue
+        except aiohttp.ClientError as error:
+            errors.append(str(error))
+            continue
+        timings.setdefault(kind, []).append((time.perf_counter() - start) * 1000)
+
+
+async def run_load(url, queries, desks, duration, seed):
+    """
+    Runs the desks for duration seconds. Returns the timings in
+    milliseconds by kind of request, the errors, the seconds it took
+    and the service's status at the end.
+    """
+    timings, errors = {}, []
+    connector = aiohttp.TCPConnector(limit=desks)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_until_ready(session, url)
+        async with session.get(f"{url}/attendees", params={"limit": 1000,
+                                                           "columns": "guest_id"}) as response:
+            guest_ids = [attendee["guest_id"] for attendee in await response.json()]
+        next_request = make_requests(guest_ids or [0], queries, random.Random(seed))
+        deadline = time.monotonic() + duration
+        start = time.perf_counter()
+        await asyncio.gather(*[desk(session, url, next_request, deadline, timings, errors)
+                               for _ in range(desks)])
+        elapsed = time.perf_counter() - start
+        async with session.get(f"{url}/status") as response:
+            status = await response.json()
+    return timings, errors, elapsed, status
+
+
+def percentile(timings, fraction):
+    return statistics.quantiles(timings, n=100)[int(fraction * 100) - 1] \
+        if len(timings) > 1 else timings[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--config", help="configuration file of a scratch database")
+    parser.add_argument("--url", help="address of a running service,"
+                                      " e.g. http://127.0.0.1:8080")
+    parser.add_argument("--size", type=int, default=10000,
+                        help="synthetic attendees added before the test")
+    parser.add_argument("--desks", type=int, default=50,
+                        help="clients sending requests at the same time")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="seconds the requests are sent for")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if not args.config and not args.url:
+        parser.error("either --config or --url is required")
+
+    service, url = None, args.url
+    queries = lookup_queries(args.size, 200, args.seed)
+    if url is None:
+        set_configuration_file(args.config)
+        ingest_attendees(generate_attendees(args.size, args.seed))
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        service = subprocess.Popen(
+            [sys.executable, "-m", "http_service", "--config", args.config,
+             "--port", str(port)],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdout=subprocess.DEVNULL)
+    try:
+        timings, errors, elapsed, status = asyncio.run(run_load(
+            url, queries, args.desks, args.duration, args.seed))
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+            remove_benchmark_attendees()
+
+    every_timing = [timing for kind_timings in timings.values() for timing in kind_timings]
+    print(f"{'requests':<10} {'count':>8} {'per second':>11}"
+          f" {'median ms':>10} {'p99 ms':>10}")
+    for kind, kind_timings in sorted(timings.items()) + [("all", every_timing)]:
+        if not kind_timings:
+            continue
+        print(f"{kind:<10} {len(kind_timings):>8} {len(kind_timings) / elapsed:>11.0f}"
+              f" {statistics.median(kind_timings):>10.2f}"
+              f" {percentile(kind_timings, 0.99):>10.2f}")
+    print(f"{args.desks} desks, {elapsed:.1f} s, {len(errors)} errors,"
+          f" {status['searches_shared']} of"
+          f" {status['searches_shared'] + status['searches_run']} searches coalesced,"
+          f" {status['pool_size']} database connections")
+    if errors:
+        error, count = Counter(errors).most_common(1)[0]
+        print(f"most common error ({count} times): {error}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
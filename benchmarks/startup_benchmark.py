@@ -0,0 +1,116 @@
+"""
+Measures how quickly the app starts: the import time of its modules
+and the time until the main window is first painted.
+
+Every measurement runs in a new Python process, so nothing is imported
+beforehand. The window is opened offscreen when no display is set:
+
+    python -m benchmarks.startup_benchmark --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_MODULES = "backend,cli,gui"
+
+# Run in a new process: imports the module and prints the time it took.
+# Results are printed on a line starting with RESULT, as the app may print too
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+print("RESULT", (time.perf_counter() - start) * 1000)
+"""
+
+# Run in a new process: opens the main window and prints, as JSON, the time
+# spent importing gui and the time until the window was first painted
+FIRST_PAINT_SCRIPT = """
+import time
+start = time.perf_counter()
+import json, os, sys
+import gui
+imported = time.perf_counter()
+from PyQt5.QtCore import QEvent, QObject
+from PyQt5.QtWidgets import QApplication
+
+class FirstPaint(QObject):
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint and watched is menu:
+            painted = time.perf_counter()
+            print("RESULT", json.dumps({"import_ms": (imported - start) * 1000,
+                              "first_paint_ms": (painted - start) * 1000}))
+            sys.stdout.flush()
+            # Skips waiting for the database warm-up started by the window
+            os._exit(0)
+        return False
+
+app = QApplication(sys.argv)
+first_paint = FirstPaint()
+app.installEventFilter(first_paint)
+menu = gui.GUIMenu()
+app.exec_()
+"""
+
+
+def run_script(script, environment):
+    """
+    Runs the script in a new Python process in the project's directory.
+    Returns the result it printed and the wall time of the whole process
+    in milliseconds.
+    """
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=environment, check=True, timeout=60)
+    process_ms = (time.perf_counter() - start) * 1000
+    for line in completed.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return line[len("RESULT "):], process_ms
+    raise RuntimeError(f"no result printed:\n{completed.stdout}{completed.stderr}")
+
+
+def summary(name, timings):
+    """Returns a line of the results table."""
+    return (f"{name:<28} {statistics.median(timings):>10.1f}"
+            f" {min(timings):>10.1f} {max(timings):>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5,
+                        help="processes started for every measurement")
+    parser.add_argument("--modules", default=DEFAULT_MODULES,
+                        help="comma separated modules whose import is timed")
+    parser.add_argument("--no-window", action="store_true",
+                        help="skip the time to first paint")
+    args = parser.parse_args(argv)
+
+    environment = dict(os.environ)
+    if not environment.get("DISPLAY") and not environment.get("WAYLAND_DISPLAY"):
+        environment.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    print(f"{'measurement':<28} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    for module in args.modules.split(","):
+        timings = [float(run_script(IMPORT_SCRIPT.format(module=module),
+                                    environment)[0])
+                   for _ in range(args.runs)]
+        print(summary(f"import {module}", timings))
+
+    if args.no_window:
+        return
+    results = []
+    for _ in range(args.runs):
+        output, process_ms = run_script(FIRST_PAINT_SCRIPT, environment)
+        results.append(dict(json.loads(output), process_ms=process_ms))
+    print(summary("window: import gui", [r["import_ms"] for r in results]))
+    print(summary("window: first paint", [r["first_paint_ms"] for r in results]))
+    print(summary("window: whole process", [r["process_ms"] for r in results]))
+
+
+if __name__ == "__main__":
+    main()
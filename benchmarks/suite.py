@@ -0,0 +1,245 @@
+"""
+Measures how searching, listing, exporting and adding attendees scale
+with the size of the guest list, and compares the results with a baseline.
+
+Synthetic attendees (see attendee_generator.py) are added to the chosen
+storage engine: a scratch PostgreSQL database described in a configuration
+file, or a temporary SQLite file or memory (see storage.py). Every
+benchmark records its wall time, throughput and the peak resident memory
+of the process while it ran:
+
+    python -m benchmarks.suite --engine sqlite --sizes 1000,100000
+    python -m benchmarks.suite --engine postgresql --config benchmark.ini
+    python -m benchmarks.suite --engine sqlite --save-baseline
+
+With a baseline, benchmarks slower than it by more than the tolerance
+are reported and the exit code is 1.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from backend import (
+    create_text_version_list_of_all_attendees,
+    get_attendees_list_format_docx,
+    get_attendees_list_format_xlsx,
+)
+from benchmarks.attendee_generator import generate_attendees
+from benchmarks.search_benchmark import lookup_queries, remove_benchmark_attendees
+from connection_pool import set_configuration_file
+from storage import create_engine
+
+DEFAULT_SIZES = "1000,100000"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+# A benchmark slower than its baseline by more than this fraction is a regression
+DEFAULT_TOLERANCE = 0.25
+# Attendees added one by one in the single inserts benchmark
+SINGLE_INSERTS = 500
+# Seconds between samples of the resident memory
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+def current_rss():
+    """
+    Returns the resident memory of the process in bytes, or None
+    where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class PeakRss:
+    """
+    Context manager that samples the resident memory on a background
+    thread; peak holds the highest value seen inside the with block.
+    Without /proc, the peak of the whole process so far is used.
+    """
+    def __enter__(self):
+        self.peak = current_rss() or 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stopped.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, current_rss() or 0)
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss() or 0)
+        if not self.peak:
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak = maxrss if sys.platform == "darwin" else maxrss * 1024
+        return False
+
+
+def measure(operations, function, *args):
+    """
+    Runs function(*args), which does the given number of operations
+    (e.g. rows written). Returns a dictionary with the wall time
+    in seconds, the operations per second and the peak RSS in MB.
+    """
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        function(*args)
+        seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "per_second": operations / seconds if seconds else float("inf"),
+        "peak_rss_mb": rss.peak / 2 ** 20,
+    }
+
+
+def run_lookups(engine, queries):
+    """Looks up every query like the info dialog does."""
+    for query in queries:
+        engine.get_matching_attendees(f"%{query}%")
+
+
+def run_single_inserts(engine, first_index, count, seed, guest_ids):
+    """
+    Adds count synthetic attendees one by one, each in its own transaction.
+    Appends their guest_ids to the given list.
+    """
+    for attendee in generate_attendees(count, seed, first_index):
+        guest_ids.append(engine.store_attendee_data(list(attendee)))
+
+
+def run_benchmarks(engine, size, loaded, seed, lookups, directory):
+    """
+    Grows the guest list to size attendees and runs every benchmark.
+    Returns a dictionary of results keyed by the benchmark's name.
+    """
+    results = {}
+    new_attendees = list(generate_attendees(size - loaded, seed, loaded))
+    results["bulk_insert"] = measure(
+        len(new_attendees), engine.store_many_attendees_data, new_attendees)
+    del new_attendees
+
+    queries = lookup_queries(size, lookups, seed)
+    results["get_matching_attendees"] = measure(
+        len(queries), run_lookups, engine, queries)
+
+    all_attendees = engine.get_list_all_attendees()
+    rows = len(all_attendees)
+    results["get_list_all_attendees"] = measure(rows, engine.get_list_all_attendees)
+    results["create_text_version_list_of_all_attendees"] = measure(
+        rows, create_text_version_list_of_all_attendees, all_attendees)
+    del all_attendees
+
+    for name, export_function, extension in (
+            ("get_attendees_list_format_xlsx", get_attendees_list_format_xlsx, "xlsx"),
+            ("get_attendees_list_format_docx", get_attendees_list_format_docx, "docx")):
+        filename = os.path.join(directory, f"attendees_{size}.{extension}")
+        results[name] = measure(
+            rows, lambda: export_function(filename, streaming=True,
+                                          attendees=engine.iterate_all_attendees()))
+        os.unlink(filename)
+
+    # Run last and removed afterwards, so the others see exactly size attendees
+    guest_ids = []
+    results["single_inserts"] = measure(
+        SINGLE_INSERTS, run_single_inserts, engine, size, SINGLE_INSERTS, seed,
+        guest_ids)
+    engine.remove_attendees(guest_ids=guest_ids)
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Returns a list of messages about the benchmarks that took longer
+    than their baseline by more than the tolerance.
+    """
+    regressions = []
+    for size, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            expected = baseline.get(size, {}).get(name)
+            if expected and result["seconds"] > expected["seconds"] * (1 + tolerance):
+                regressions.append(
+                    f"{name} with {size} attendees: {result['seconds']:.3f} s,"
+                    f" baseline {expected['seconds']:.3f} s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--engine", choices=("postgresql", "sqlite", "memory"),
+                        default="sqlite")
+    parser.add_argument("--config",
+                        help="configuration file of a scratch PostgreSQL database")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="comma separated numbers of synthetic attendees,"
+                             " e.g. 1000,100000,1000000")
+    parser.add_argument("--lookups", type=int, default=50,
+                        help="lookups measured at every size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="JSON file with the results to compare with")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown against the baseline, e.g. 0.25")
+    args = parser.parse_args(argv)
+    if args.engine == "postgresql" and not args.config:
+        parser.error("--config is required for the postgresql engine")
+
+    directory = tempfile.mkdtemp(prefix="attendees_benchmark_")
+    if args.engine == "postgresql":
+        set_configuration_file(args.config)
+    engine = create_engine(args.engine, os.path.join(directory, "guestlist.sqlite3"))
+
+    print(f"{'attendees':>10} {'benchmark':<44} {'seconds':>9}"
+          f" {'per second':>12} {'peak RSS MB':>12}")
+    results = {}
+    loaded = 0
+    try:
+        for size in sorted(int(size) for size in args.sizes.split(",")):
+            results[str(size)] = run_benchmarks(
+                engine, size, loaded, args.seed, args.lookups, directory)
+            loaded = size
+            for name, result in results[str(size)].items():
+                print(f"{size:>10} {name:<44} {result['seconds']:>9.3f}"
+                      f" {result['per_second']:>12.0f} {result['peak_rss_mb']:>12.1f}")
+    finally:
+        if args.engine == "postgresql":
+            remove_benchmark_attendees()
+        engine.close()
+        shutil.rmtree(directory)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baselines = json.load(baseline_file)
+    if args.save_baseline:
+        baselines[args.engine] = results
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if args.engine not in baselines:
+        print(f"no {args.engine} baseline in {args.baseline}; use --save-baseline")
+        return 0
+
+    regressions = compare_with_baseline(results, baselines[args.engine], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"no regressions against {args.baseline}"
+              f" (tolerance {args.tolerance:.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
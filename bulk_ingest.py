@@ -0,0 +1,216 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+from psycopg2 import extras
+
+from backend import GUESTLIST_COLUMNS, base_query
+
+CHUNK_SIZE = 5000
+
+TEXT_COLUMNS = GUESTLIST_COLUMNS[:-1]
+
+# Column titles that other files (e.g. our own xlsx export) use for guestlist columns
+COLUMN_ALIASES = {
+    "first": "first_name",
+    "last": "last_name",
+    "phone_number": "phone",
+    "date": "date_added",
+}
+
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+PHONE_PATTERN = r"^\+?\d{3,20}$"
+
+
+def read_attendee_records(source, chunk_size=CHUNK_SIZE):
+    """
+    Takes in a path to a csv or xlsx file, or an iterable of records.
+    A record is either a dictionary keyed by column names or a sequence
+    in the GUESTLIST_COLUMNS order (date_added may be left out).
+    Yields pandas DataFrames with up to chunk_size records each.
+    """
+    if isinstance(source, str):
+        if source.lower().endswith((".xlsx", ".xls")):
+            frame = pd.read_excel(source, dtype=str)
+            for start in range(0, len(frame), chunk_size):
+                yield frame.iloc[start:start + chunk_size]
+        else:
+            yield from pd.read_csv(source, dtype=str, chunksize=chunk_size,
+                                   keep_default_na=False)
+        return
+
+    batch = []
+    for record in source:
+        if not isinstance(record, dict):
+            record = dict(zip(GUESTLIST_COLUMNS, record))
+        batch.append(record)
+        if len(batch) == chunk_size:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
+
+
+def normalize_column_titles(frame):
+    """
+    Takes in a DataFrame read from a file. Renames its columns to
+    guestlist column names and adds the missing ones as empty.
+    Returns a DataFrame with exactly the GUESTLIST_COLUMNS.
+    """
+    titles = {}
+    for title in frame.columns:
+        name = str(title).strip().lower().replace(" ", "_")
+        titles[title] = COLUMN_ALIASES.get(name, name)
+    frame = frame.rename(columns=titles)
+    for column in GUESTLIST_COLUMNS:
+        if column not in frame.columns:
+            frame[column] = None
+    return frame.loc[:, list(GUESTLIST_COLUMNS)].copy()
+
+
+def normalize_attendee_records(frame, first_record_number=1):
+    """
+    Takes in a DataFrame with attendee records. Strips the text fields,
+    lower-cases emails, removes separators from phone numbers and
+    sets date_added to the current time where it is missing.
+    Every column is processed at once for the whole batch.
+    Returns the valid records and a list of (record number, error) tuples
+    for the rejected ones. Records are numbered from first_record_number.
+    """
+    frame = normalize_column_titles(frame)
+    frame.index = range(first_record_number, first_record_number + len(frame))
+
+    for column in TEXT_COLUMNS:
+        frame[column] = frame[column].fillna("").astype(str).str.strip()
+    frame["email"] = frame["email"].str.lower()
+    frame["phone"] = frame["phone"].str.replace(r"[\s\-().]", "", regex=True)
+
+    date_given = (frame["date_added"].notna()
+                  & (frame["date_added"].astype(str).str.strip() != ""))
+    dates = pd.to_datetime(frame["date_added"].where(date_given), errors="coerce")
+
+    problems = [
+        (frame["first_name"] == "", "first name is missing"),
+        (frame["last_name"] == "", "last name is missing"),
+        ((frame["email"] != "") & ~frame["email"].str.match(EMAIL_PATTERN),
+         "email is not valid"),
+        ((frame["phone"] != "") & ~frame["phone"].str.match(PHONE_PATTERN),
+         "phone number is not valid"),
+        (date_given & dates.isna(), "date added is not a valid date"),
+    ]
+    errors = []
+    rejected = pd.Series(False, index=frame.index)
+    for mask, message in problems:
+        for record_number in frame.index[mask]:
+            errors.append((record_number, message))
+        rejected |= mask
+
+    frame["date_added"] = dates.fillna(pd.Timestamp(datetime.now()))
+    errors.sort()
+    return frame[~rejected], errors
+
+
+@base_query
+def copy_attendee_records(cur, frame):
+    """
+    Loads a DataFrame of normalized records into guestlist
+    with COPY FROM STDIN. Returns the number of records loaded.
+    """
+    buffer = io.StringIO()
+    frame.to_csv(buffer, header=False, index=False,
+                 date_format="%Y-%m-%d %H:%M:%S.%f")
+    buffer.seek(0)
+    columns = ", ".join(GUESTLIST_COLUMNS)
+    text_columns = ", ".join(TEXT_COLUMNS)
+    sql = f"""COPY guestlist({columns})
+              FROM STDIN
+              WITH (FORMAT csv, FORCE_NOT_NULL ({text_columns}))"""
+    cur.copy_expert(sql, buffer)
+    return cur, len(frame)
+
+
+@base_query
+def insert_attendee_records(cur, frame):
+    """
+    Loads a DataFrame of normalized records into guestlist
+    with multi-row INSERT statements. Returns the number of records loaded.
+    """
+    columns = ", ".join(GUESTLIST_COLUMNS)
+    sql = f"""INSERT INTO guestlist({columns}) VALUES %s"""
+    extras.execute_values(cur, sql, dataframe_rows(frame), page_size=1000)
+    return cur, len(frame)
+
+
+@base_query
+def insert_attendee_records_one_by_one(cur, frame):
+    """
+    Inserts the records one at a time, each behind its own savepoint,
+    so that one bad record does not reject the rest of the batch.
+    Returns the number of records loaded and a list of
+    (record number, error) tuples for the ones the database refused.
+    """
+    columns = ", ".join(GUESTLIST_COLUMNS)
+    placeholders = ", ".join(["%s"] * len(GUESTLIST_COLUMNS))
+    sql = f"""INSERT INTO guestlist({columns}) VALUES ({placeholders});"""
+    inserted, errors = 0, []
+    for record_number, row in zip(frame.index, dataframe_rows(frame)):
+        cur.execute("SAVEPOINT attendee_record;")
+        try:
+            cur.execute(sql, row)
+        except Exception as error:
+            cur.execute("ROLLBACK TO SAVEPOINT attendee_record;")
+            errors.append((record_number, str(error).strip()))
+        else:
+            cur.execute("RELEASE SAVEPOINT attendee_record;")
+            inserted += 1
+    return cur, (inserted, errors)
+
+
+def dataframe_rows(frame):
+    """
+    Takes in a DataFrame of normalized records. Returns a list of tuples
+    in the GUESTLIST_COLUMNS order with date_added as datetime objects.
+    """
+    dates = frame["date_added"].dt.to_pydatetime()
+    return [
+        row[:-1] + (date,)
+        for row, date in zip(frame.itertuples(index=False, name=None), dates)
+    ]
+
+
+def ingest_attendees(source, chunk_size=CHUNK_SIZE, method="copy"):
+    """
+    Takes in a csv or xlsx file path or an iterable of records
+    (see read_attendee_records). Validates and normalizes the records
+    in batches of chunk_size and loads every batch in its own transaction,
+    using COPY (method="copy") or multi-row INSERTs (method="insert").
+    If the database refuses a batch, its records are inserted one by one
+    so that only the faulty ones are left out.
+    Returns a dictionary with the number of inserted records and a list
+    of (record number, error) tuples. Records are numbered from 1.
+    """
+    load_records = {
+        "copy": copy_attendee_records,
+        "insert": insert_attendee_records,
+    }[method]
+
+    report = {"inserted": 0, "errors": []}
+    record_number = 1
+    for chunk in read_attendee_records(source, chunk_size):
+        frame, errors = normalize_attendee_records(chunk, record_number)
+        record_number += len(chunk)
+        report["errors"] += errors
+        if frame.empty:
+            continue
+
+        inserted = load_records(frame)
+        if inserted is None:
+            result = insert_attendee_records_one_by_one(frame)
+            if result is None:
+                report["errors"] += [(number, "record could not be saved")
+                                     for number in frame.index]
+                continue
+            inserted, errors = result
+            report["errors"] += errors
+        report["inserted"] += inserted
+    return report
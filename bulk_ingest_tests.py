@@ -0,0 +1,72 @@
+import os
+import unittest
+
+import pandas as pd
+
+from datetime import datetime
+
+from backend import base_query, get_matching_attendees
+from bulk_ingest import (
+    ingest_attendees,
+    normalize_attendee_records,
+    read_attendee_records,
+)
+
+
+@base_query
+def remove_bulk_test_attendees(cur):
+    sql = """DELETE FROM
+                    guestlist
+            WHERE
+                    last_name = 'Bulkloadedname';"""
+    cur.execute(sql, )
+    return cur, None
+
+
+test_records = [
+    ('Hermenegildo', 'Bulkloadedname', 'New York', 'Testers',
+     'JD@Testers.com ', '111 222 333', datetime(2010, 10, 10, 10, 10, 10)),
+    (' Bonifacy ', 'Bulkloadedname', 'Boston', 'Testers',
+     'bb@testers.com', '444-555-666'),
+    ('', 'Bulkloadedname', 'Boston', 'Testers',
+     'not an email', '777888999'),
+]
+
+
+class BulkIngestTests(unittest.TestCase):
+    def test_normalize_attendee_records(self):
+        """
+        Checks if the fields are normalized, missing dates are filled in
+        and invalid records are reported with their numbers.
+        """
+        frame = next(read_attendee_records(test_records))
+        valid, errors = normalize_attendee_records(frame)
+
+        self.assertEqual(list(valid.index), [1, 2])
+        self.assertEqual(valid.loc[1, 'email'], 'jd@testers.com')
+        self.assertEqual(valid.loc[1, 'phone'], '111222333')
+        self.assertEqual(valid.loc[2, 'first_name'], 'Bonifacy')
+        self.assertEqual(valid.loc[1, 'date_added'],
+                         pd.Timestamp(2010, 10, 10, 10, 10, 10))
+        self.assertFalse(pd.isna(valid.loc[2, 'date_added']))
+        self.assertEqual(errors, [(3, 'email is not valid'),
+                                  (3, 'first name is missing')])
+
+    def test_ingest_attendees(self):
+        """
+        Checks if the valid records from a csv file are added to
+        the database and the invalid ones are reported.
+        """
+        pd.DataFrame(test_records, columns=[
+            'first name', 'last_name', 'city', 'company',
+            'email', 'phone number', 'date added']).to_csv('test.csv', index=False)
+
+        report = ingest_attendees('test.csv', chunk_size=2)
+        attendees = get_matching_attendees('%Bulkloadedname%')
+        remove_bulk_test_attendees()
+        os.unlink('test.csv')
+
+        self.assertEqual(report['inserted'], 2)
+        self.assertEqual([error[0] for error in report['errors']], [3, 3])
+        self.assertEqual(sorted(attendee[1] for attendee in attendees),
+                         ['Bonifacy', 'Hermenegildo'])
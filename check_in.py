@@ -0,0 +1,287 @@
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+from psycopg2 import extras
+
+from backend import base_query, stream_query, transaction
+
+# Check-ins saved in the database in one statement
+CHECK_IN_BATCH_SIZE = 500
+
+# Seconds between saving the check-ins made in the meantime
+FLUSH_INTERVAL = 1.0
+
+# Seconds to wait before the first retry after a failed save;
+# every next failure doubles it, up to MAX_RETRY_DELAY
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+
+# Seconds of check-ins the throughput is computed from
+THROUGHPUT_WINDOW = 60
+
+BADGE_CODE_PREFIX = "CA"
+
+# Result of CheckInDesk.check_in
+CheckInResult = namedtuple(
+    "CheckInResult", ("guest_id", "name", "checked_in_at", "already_checked_in"))
+
+
+def badge_check_digit(guest_id):
+    """Returns the Luhn check digit of the guest_id."""
+    total = 0
+    for position, digit in enumerate(reversed(str(guest_id))):
+        digit = int(digit)
+        if position % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return (10 - total % 10) % 10
+
+
+def badge_code(guest_id):
+    """
+    Returns the code printed on an attendee's badge, e.g. 'CA-123-0':
+    the guest_id and a check digit, so a misread code is not taken
+    for another attendee's.
+    """
+    return f"{BADGE_CODE_PREFIX}-{guest_id}-{badge_check_digit(guest_id)}"
+
+
+def parse_badge_code(code):
+    """
+    Returns the guest_id in a scanned badge code (see badge_code),
+    or None if it is not a valid code.
+    """
+    parts = code.strip().upper().split("-")
+    if len(parts) != 3 or parts[0] != BADGE_CODE_PREFIX:
+        return None
+    guest_id, check_digit = parts[1], parts[2]
+    if not guest_id.isdigit() or not check_digit.isdigit():
+        return None
+    if badge_check_digit(int(guest_id)) != int(check_digit):
+        return None
+    return int(guest_id)
+
+
+def iterate_check_in_working_set():
+    """
+    Yields (guest_id, full name, lowercased email, checked_in_at) tuples
+    of all attendees, reading them in batches (see backend.stream_query).
+    """
+    sql = """SELECT guest_id, first_name || ' ' || last_name, lower(email), checked_in_at
+             FROM guestlist ORDER BY guest_id;"""
+    return stream_query(sql)
+
+
+@base_query
+def find_attendee_for_check_in(cur, guest_id=None, email=None):
+    """
+    Returns a (guest_id, full name, lowercased email, checked_in_at) tuple
+    of the attendee with the guest_id or the email, or None if there is none.
+    """
+    sql = """SELECT guest_id, first_name || ' ' || last_name, lower(email), checked_in_at
+             FROM guestlist
+             WHERE guest_id = %s OR lower(email) = lower(%s)
+             ORDER BY guest_id LIMIT 1;"""
+    cur.execute(sql, (guest_id, email))
+    return cur, cur.fetchone()
+
+
+@base_query
+def save_check_ins(cur, check_ins):
+    """
+    Takes in a list of (guest_id, checked_in_at) tuples. Saves them in
+    one statement; attendees already checked in (e.g. at another desk)
+    keep their first check-in time. Returns a list of the guest_ids
+    that were checked in now.
+    """
+    sql = """UPDATE guestlist SET checked_in_at = data.checked_in_at
+             FROM (VALUES %s) AS data(guest_id, checked_in_at)
+             WHERE guestlist.guest_id = data.guest_id
+             AND guestlist.checked_in_at IS NULL
+             RETURNING guestlist.guest_id"""
+    saved = extras.execute_values(cur, sql, check_ins,
+                                  template="(%s, %s::timestamp)",
+                                  page_size=len(check_ins), fetch=True)
+    return cur, [row[0] for row in saved]
+
+
+@base_query
+def get_check_in_times(cur, guest_ids):
+    """
+    Takes in a list of guest_ids. Returns a dictionary: guest_id ->
+    the attendee's saved check-in time, for those checked in.
+    """
+    sql = """SELECT guest_id, checked_in_at FROM guestlist
+             WHERE guest_id = ANY(%s) AND checked_in_at IS NOT NULL;"""
+    cur.execute(sql, (list(guest_ids),))
+    return cur, dict(cur.fetchall())
+
+
+class CheckInDesk(threading.Thread):
+    """
+    Checks attendees in by guest_id, email or scanned badge code.
+
+    load() reads every attendee's guest_id, name, email and check-in time
+    once; after that a check-in is a dictionary lookup. Check-ins are
+    saved in the database by a background thread every flush_interval
+    seconds, batch_size at a time, retrying with a doubling delay when
+    that fails. Attendees added after load() are looked up in the
+    database the first time they come to the desk.
+    Needs PostgreSQL with the 0007_check_in migration applied.
+    """
+    def __init__(self, batch_size=CHECK_IN_BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        super().__init__(name="check-in-flusher", daemon=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.last_error = None
+        self.checked_in_elsewhere = 0
+        self._names = {}
+        self._by_email = {}
+        self._checked_in = {}
+        self._pending = []
+        self._recent = deque()
+        self._opened_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _add(self, row):
+        guest_id, name, email, checked_in_at = row
+        self._names[guest_id] = name
+        if email:
+            self._by_email[email] = guest_id
+        if checked_in_at is not None:
+            self._checked_in[guest_id] = checked_in_at
+
+    def load(self):
+        """
+        Reads the attendees into memory, replacing the ones read before.
+        Returns their number.
+        """
+        with self._lock:
+            self._names.clear()
+            self._by_email.clear()
+            self._checked_in.clear()
+            for row in iterate_check_in_working_set():
+                self._add(row)
+            return len(self._names)
+
+    def find(self, key):
+        """
+        Takes in a guest_id, an email or a scanned badge code.
+        Returns the attendee's guest_id, or None if there is no such attendee.
+        """
+        guest_id, email = None, None
+        if isinstance(key, int):
+            guest_id = key
+        else:
+            key = key.strip()
+            if "@" in key:
+                email = key.lower()
+            elif key.isdigit():
+                guest_id = int(key)
+            else:
+                guest_id = parse_badge_code(key)
+                if guest_id is None:
+                    return None
+        with self._lock:
+            if email is not None and email in self._by_email:
+                return self._by_email[email]
+            if guest_id in self._names:
+                return guest_id
+        row = find_attendee_for_check_in(guest_id, email)
+        if row is None:
+            return None
+        with self._lock:
+            self._add(row)
+        return row[0]
+
+    def check_in(self, key):
+        """
+        Takes in a guest_id, an email or a scanned badge code. Checks the
+        attendee in, unless they already are. Returns a CheckInResult,
+        or None if there is no such attendee.
+        """
+        guest_id = self.find(key)
+        if guest_id is None:
+            return None
+        with self._lock:
+            name = self._names[guest_id]
+            if guest_id in self._checked_in:
+                return CheckInResult(guest_id, name, self._checked_in[guest_id], True)
+            checked_in_at = datetime.now()
+            self._checked_in[guest_id] = checked_in_at
+            self._pending.append((guest_id, checked_in_at))
+            self._recent.append(time.monotonic())
+        return CheckInResult(guest_id, name, checked_in_at, False)
+
+    def flush(self):
+        """
+        Saves the check-ins made so far in the database, batch after
+        batch. Attendees who turn out to be checked in at another desk
+        get their first check-in time back, so the next check_in shows it.
+        Database errors are raised; the check-ins not saved stay
+        pending. Returns the number of check-ins saved.
+        """
+        saved = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._pending[:self.batch_size]
+                if not batch:
+                    return saved
+                with transaction():
+                    checked_in = set(save_check_ins(batch))
+                    elsewhere = [guest_id for guest_id, _ in batch
+                                 if guest_id not in checked_in]
+                    first_check_ins = get_check_in_times(elsewhere) if elsewhere else {}
+                with self._lock:
+                    del self._pending[:len(batch)]
+                    self.checked_in_elsewhere += len(elsewhere)
+                    self._checked_in.update(first_check_ins)
+                saved += len(batch)
+
+    def status(self):
+        """
+        Returns a dictionary with the number of attendees, how many of
+        them are checked in, the check-ins not saved yet, the check-ins
+        per hour over the last THROUGHPUT_WINDOW seconds and the last
+        error of the background saves (None after a successful one).
+        """
+        now = time.monotonic()
+        window = min(THROUGHPUT_WINDOW, max(now - self._opened_at, 1.0))
+        with self._lock:
+            while self._recent and self._recent[0] < now - window:
+                self._recent.popleft()
+            return {
+                "attendees": len(self._names),
+                "checked_in": len(self._checked_in),
+                "pending": len(self._pending),
+                "per_hour": len(self._recent) * 3600 / window,
+                "checked_in_elsewhere": self.checked_in_elsewhere,
+                "last_error": self.last_error,
+            }
+
+    def stop(self, timeout=5.0):
+        """Stops the thread, then tries to save the remaining check-ins once."""
+        self._stopped.set()
+        if self.is_alive():
+            self.join(timeout)
+        return self.flush()
+
+    def run(self):
+        delay = RETRY_DELAY
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as error:
+                self.last_error = str(error).strip()
+                self._stopped.wait(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+            self.last_error = None
+            delay = RETRY_DELAY
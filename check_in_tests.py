@@ -0,0 +1,111 @@
+import unittest
+
+from backend import base_query, remove_attendees, store_attendee_data_in_postgresql
+from check_in import CheckInDesk, badge_code, parse_badge_code
+from schema import migrate
+
+test_attendee_data = ['Hermenegildo', 'Checkinname', 'New York',
+                      'Check-in Testers', 'JD@checkin.com', '123456789']
+
+
+@base_query
+def check_in_column_exists(cur):
+    cur.execute("""SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'guestlist' AND column_name = 'checked_in_at';""")
+    return cur, cur.fetchone() is not None
+
+
+@base_query
+def get_checked_in_at(cur, guest_id):
+    cur.execute("""SELECT checked_in_at FROM guestlist WHERE guest_id = %s;""",
+                (guest_id,))
+    return cur, cur.fetchone()[0]
+
+
+class BadgeCodeTests(unittest.TestCase):
+    def test_badge_code(self):
+        """Checks if a badge code gives back its guest_id and a misread one nothing."""
+        self.assertEqual(badge_code(123), 'CA-123-0')
+        for guest_id in (1, 79, 123, 98765):
+            self.assertEqual(parse_badge_code(badge_code(guest_id)), guest_id)
+        self.assertEqual(parse_badge_code(' ca-123-0 '), 123)
+        self.assertIsNone(parse_badge_code('CA-132-0'))
+        self.assertIsNone(parse_badge_code('CA-123'))
+        self.assertIsNone(parse_badge_code('XY-123-0'))
+
+
+class CheckInDeskTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        migrate()
+        if not check_in_column_exists():
+            raise unittest.SkipTest('the 0007_check_in migration is not applied')
+
+    def setUp(self):
+        self.guest_id = store_attendee_data_in_postgresql(test_attendee_data)
+        self.desk = CheckInDesk()
+        self.desk.load()
+
+    def tearDown(self):
+        remove_attendees(company='Check-in Testers')
+
+    def test_check_in(self):
+        """
+        Checks if attendees are checked in by guest_id, email or badge code,
+        only once, and if the check-ins are saved by flush().
+        """
+        result = self.desk.check_in('jd@CHECKIN.com')
+        self.assertEqual(result.guest_id, self.guest_id)
+        self.assertEqual(result.name, 'Hermenegildo Checkinname')
+        self.assertFalse(result.already_checked_in)
+        self.assertTrue(self.desk.check_in(badge_code(self.guest_id)).already_checked_in)
+        self.assertTrue(self.desk.check_in(self.guest_id).already_checked_in)
+        self.assertIsNone(self.desk.check_in('nobody@checkin.com'))
+        self.assertIsNone(self.desk.check_in('CA-1-1'))
+
+        status = self.desk.status()
+        self.assertEqual(status['pending'], 1)
+        self.assertGreater(status['per_hour'], 0)
+        self.assertIsNone(get_checked_in_at(self.guest_id))
+
+        self.assertEqual(self.desk.flush(), 1)
+        self.assertEqual(get_checked_in_at(self.guest_id), result.checked_in_at)
+        self.assertEqual(self.desk.status()['pending'], 0)
+
+    def test_checked_in_elsewhere(self):
+        """
+        Checks if an attendee checked in at another desk keeps the first
+        check-in time, and if a new desk knows they are checked in.
+        """
+        other_desk = CheckInDesk()
+        other_desk.load()
+        first = other_desk.check_in(self.guest_id)
+        self.desk.check_in(self.guest_id)
+        other_desk.flush()
+        self.desk.flush()
+        self.assertEqual(get_checked_in_at(self.guest_id), first.checked_in_at)
+        self.assertEqual(self.desk.status()['checked_in_elsewhere'], 1)
+        again = self.desk.check_in(self.guest_id)
+        self.assertTrue(again.already_checked_in)
+        self.assertEqual(again.checked_in_at, first.checked_in_at)
+
+        new_desk = CheckInDesk()
+        new_desk.load()
+        self.assertTrue(new_desk.check_in(self.guest_id).already_checked_in)
+
+    def test_added_after_load(self):
+        """Checks if an attendee added after load() is found in the database."""
+        loaded = self.desk.status()['attendees']
+        guest_id = store_attendee_data_in_postgresql(
+            ['Anna'] + test_attendee_data[1:4] + ['anna@checkin.com', '1'])
+        self.assertEqual(self.desk.check_in(str(guest_id)).name, 'Anna Checkinname')
+        self.assertEqual(self.desk.status()['attendees'], loaded + 1)
+
+    def test_background_save(self):
+        """Checks if the thread saves the check-ins and stop() saves the rest."""
+        desk = CheckInDesk(flush_interval=0.01)
+        desk.load()
+        desk.start()
+        desk.check_in(self.guest_id)
+        desk.stop()
+        self.assertIsNotNone(get_checked_in_at(self.guest_id))
@@ -0,0 +1,512 @@
+import argparse
+import csv
+import json
+import shlex
+import sys
+from datetime import datetime
+
+import instrumentation
+from backend import (
+    ATTENDEE_COLUMNS,
+    GUESTLIST_COLUMNS,
+    SEARCH_LIMIT,
+    get_attendees_list_format_csv,
+    get_attendees_list_format_docx,
+    get_attendees_list_format_parquet,
+    get_attendees_list_format_xlsx,
+)
+from check_in import CheckInDesk
+from dedup import (
+    DEDUP_COLUMNS,
+    MAX_BLOCK_SIZE,
+    DuplicateFinder,
+    find_possible_duplicates,
+    merge_duplicates,
+)
+from delta_export import (
+    CHANGES_WRITERS,
+    DEFAULT_WATERMARK_FILE,
+    append_changes_to_csv,
+    export_changes,
+)
+from export_cache import with_export_cache
+from export_scheduler import (
+    DEFAULT_FILE_PREFIX,
+    PARTITION_COLUMNS,
+    RENDERERS,
+    make_jobs,
+    run_export_jobs,
+)
+from schema import migrate
+from storage import get_engine
+
+# Commands that can be given in a batch (see batch_command)
+BATCH_COMMANDS = ("add", "search", "remove", "list", "export")
+
+EXPORT_FUNCTIONS = {
+    "docx": with_export_cache(get_attendees_list_format_docx, "docx"),
+    "xlsx": with_export_cache(get_attendees_list_format_xlsx, "xlsx"),
+    "csv": with_export_cache(get_attendees_list_format_csv, "csv"),
+    "parquet": with_export_cache(get_attendees_list_format_parquet, "parquet"),
+}
+
+
+def json_value(value):
+    """Converts values json does not know, e.g. dates, to text."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def write_records(records, output_format, output=None):
+    """
+    Takes in an iterable of Attendee records, 'json' or 'csv'
+    and a text stream (stdout by default). Writes the records one by one,
+    as a JSON array of objects or as CSV rows with a header.
+    Returns the number of records written.
+    """
+    output = output or sys.stdout
+    count = 0
+    writer = None
+    for record in records:
+        if output_format == "csv":
+            if writer is None:
+                writer = csv.writer(output)
+                writer.writerow(record._fields)
+            writer.writerow(record)
+        else:
+            output.write("[\n" if count == 0 else ",\n")
+            output.write(json.dumps(record._asdict(), default=json_value))
+        count += 1
+    if output_format == "json":
+        output.write("\n]\n" if count else "[]\n")
+    return count
+
+
+def add_command(args):
+    """
+    Adds one attendee and prints their data. The attendees that look
+    like the same person are printed to stderr; with --skip-duplicates
+    the attendee is then not added. Returns the exit code.
+    """
+    attendee_data = [getattr(args, column) for column in GUESTLIST_COLUMNS[:-1]]
+    engine = get_engine()
+    duplicates = find_possible_duplicates(attendee_data, engine)
+    if duplicates is None:
+        print("could not check for duplicates, run migrate", file=sys.stderr)
+        duplicates = []
+    for attendee, reason in duplicates:
+        print(f"possible duplicate ({reason}): {attendee.guest_id}"
+              f" {attendee.first_name} {attendee.last_name}, {attendee.email}",
+              file=sys.stderr)
+    if duplicates and args.skip_duplicates:
+        print("not added", file=sys.stderr)
+        return 1
+    guest_id = engine.store_attendee_data(attendee_data)
+    write_records([engine.get_attendee(guest_id)], args.format)
+    return 0
+
+
+def search_command(args):
+    """
+    Prints the attendees whose full name contains the query, or with
+    --ranked the best matches by name, email or company (see
+    backend.search_attendees). Returns the exit code.
+    """
+    engine = get_engine()
+    if args.ranked:
+        attendees = engine.search_attendees(args.query, args.limit)
+    else:
+        # The first page of the matches, so only --limit of them are read
+        attendees = engine.get_attendees_page(0, args.limit, args.query)
+    write_records(attendees, args.format)
+    return 0
+
+
+def remove_command(args):
+    """
+    Removes the attendees matching every given filter and prints
+    their data. Returns the exit code.
+    """
+    removed_attendees = get_engine().remove_attendees(
+        guest_ids=args.guest_ids or None, company=args.company,
+        added_after=args.added_after, added_before=args.added_before)
+    write_records(removed_attendees, args.format)
+    return 0
+
+
+def list_command(args):
+    """
+    Prints all the attendees, reading them from the database in batches
+    (see storage.StorageEngine.iterate_all_attendees). Returns the exit code.
+    """
+    write_records(get_engine().iterate_all_attendees(columns=args.columns),
+                  args.format)
+    return 0
+
+
+def export_command(args):
+    """
+    Exports the guest list to a docx, xlsx, csv or parquet file. With
+    --changes only the attendees added, updated and removed since the
+    previous --changes export are saved; with --append an existing csv
+    export is brought up to date (see delta_export.py). Returns the exit code.
+    """
+    if args.changes or args.append:
+        if get_engine().name != "postgresql":
+            print("--changes and --append need the postgresql storage engine",
+                  file=sys.stderr)
+            return 2
+        if args.append:
+            if args.file_format != "csv":
+                print("--append works only with --file-format csv", file=sys.stderr)
+                return 2
+            print(append_changes_to_csv(args.filename))
+        else:
+            if args.file_format not in CHANGES_WRITERS:
+                print(f"--changes does not support {args.file_format} files",
+                      file=sys.stderr)
+                return 2
+            print(export_changes(args.filename, args.file_format, args.watermark))
+        return 0
+    export_function = EXPORT_FUNCTIONS[args.file_format]
+    print(export_function(args.filename, streaming=True,
+                          attendees=get_engine().attendees_to_export()))
+    return 0
+
+
+def export_jobs_command(args):
+    """
+    Exports the guest list to every given format, whole or split by
+    company or city, rendering the files in parallel (see
+    export_scheduler.run_export_jobs). Prints the time every file took.
+    Returns the exit code: 1 if any file failed.
+    """
+    jobs = make_jobs(args.formats, [None if column == "all" else column
+                                    for column in args.partition_by])
+    report = run_export_jobs(jobs, args.directory, args.prefix, workers=args.workers)
+    exit_code = 0
+    for result in report.jobs:
+        if result.error is not None:
+            print(f"{result.path}: failed: {result.error}", file=sys.stderr)
+            exit_code = 1
+        else:
+            print(f"{result.path}: {result.rows} attendees in {result.seconds:.2f} s")
+    print(f"{len(report.jobs)} files, guest list read once in {report.read_seconds:.2f} s,"
+          f" {report.seconds:.2f} s altogether")
+    return exit_code
+
+
+def batch_command(args):
+    """
+    Reads commands from a file (or stdin), one per line, written the same
+    way as on the command line, e.g. 'remove --company Testers'. Empty
+    lines and lines starting with # are skipped. All the commands run
+    in one transaction: if any of them fails, none of their changes
+    are kept. Returns the exit code.
+    """
+    batch_file = sys.stdin if args.file == "-" else open(args.file)
+    try:
+        lines = [line.strip() for line in batch_file]
+    finally:
+        if batch_file is not sys.stdin:
+            batch_file.close()
+
+    parser = create_parser()
+    commands = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line or line.startswith("#"):
+            continue
+        try:
+            command_args = parser.parse_args(shlex.split(line))
+        except (SystemExit, ValueError):
+            print(f"line {line_number}: cannot be parsed, nothing was run",
+                  file=sys.stderr)
+            return 2
+        if command_args.command not in BATCH_COMMANDS:
+            print(f"line {line_number}: '{command_args.command}' cannot be used"
+                  " in a batch", file=sys.stderr)
+            return 2
+        commands.append(command_args)
+
+    try:
+        with get_engine().transaction():
+            for command_args in commands:
+                command_args.handler(command_args)
+    except Exception as error:
+        print(f"batch failed, no changes were kept: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def import_command(args):
+    """
+    Loads attendees from every file given on the command line.
+    Prints the rejected records to stderr. Returns the exit code.
+    """
+    # Imported here, as it loads pandas, which the other commands do not need
+    from bulk_ingest import CHUNK_SIZE, ingest_attendees
+
+    exit_code = 0
+    for filename in args.files:
+        report = ingest_attendees(filename, chunk_size=args.chunk_size or CHUNK_SIZE,
+                                  method=args.method)
+        for record_number, error in report["errors"]:
+            print(f"{filename}: record {record_number}: {error}", file=sys.stderr)
+        print(f"{filename}: {report['inserted']} attendees added,"
+              f" {len(report['errors'])} rejected")
+        if report["errors"]:
+            exit_code = 1
+    return exit_code
+
+
+def check_in_command(args):
+    """
+    Checks in the attendees given by guest_id, email or badge code, or,
+    without any, the ones read from stdin one per line, e.g. from
+    a barcode scanner (see check_in.CheckInDesk). Prints every result
+    and, at the end, the check-in status. Returns the exit code:
+    1 if any attendee was not found.
+    """
+    if get_engine().name != "postgresql":
+        print("checkin needs the postgresql storage engine", file=sys.stderr)
+        return 2
+    desk = CheckInDesk()
+    desk.load()
+    desk.start()
+    exit_code = 0
+    try:
+        for key in args.keys or sys.stdin:
+            key = key.strip()
+            if not key:
+                continue
+            result = desk.check_in(key)
+            if result is None:
+                print(f"not found: {key}")
+                exit_code = 1
+            elif result.already_checked_in:
+                print(f"already checked in: {result.guest_id} {result.name}"
+                      f" at {result.checked_in_at:%Y-%m-%d %H:%M:%S}")
+            else:
+                print(f"checked in: {result.guest_id} {result.name}")
+    finally:
+        desk.stop()
+    status = desk.status()
+    print(f"{status['checked_in']} of {status['attendees']} attendees checked in,"
+          f" {status['per_hour']:.0f} per hour")
+    return exit_code
+
+
+def duplicates_command(args):
+    """
+    Prints the groups of attendees that look like one person (see
+    dedup.DuplicateFinder); with --merge every group is merged into its
+    first record, all in one transaction. Returns the exit code.
+    """
+    engine = get_engine()
+    if args.merge and engine.name != "postgresql":
+        print("--merge needs the postgresql storage engine", file=sys.stderr)
+        return 2
+    finder = DuplicateFinder(args.max_block_size)
+    clusters = finder.add_all(engine.iterate_all_attendees(columns=DEDUP_COLUMNS)).clusters()
+    for cluster in clusters:
+        print(f"{len(cluster.guest_ids)} records ({', '.join(cluster.reasons)}):")
+        for guest_id in cluster.guest_ids:
+            attendee = engine.get_attendee(guest_id)
+            if attendee is not None:
+                print(f"  {attendee.guest_id} {attendee.first_name} {attendee.last_name},"
+                      f" {attendee.company}, {attendee.city}, {attendee.email},"
+                      f" {attendee.phone}")
+    if args.merge and clusters:
+        merged = 0
+        try:
+            with engine.transaction():
+                for cluster in clusters:
+                    if merge_duplicates(cluster.guest_ids) is not None:
+                        merged += 1
+        except Exception as error:
+            print(f"merge failed, nothing was merged: {error}", file=sys.stderr)
+            return 1
+        print(f"merged {merged} groups of duplicates")
+        if merged < len(clusters):
+            print(f"{len(clusters) - merged} groups were removed in the meantime",
+                  file=sys.stderr)
+    else:
+        print(f"{len(clusters)} groups of possible duplicates among"
+              f" {finder.attendees} attendees")
+    if finder.skipped_blocks:
+        print(f"{finder.skipped_blocks} groups of more than {args.max_block_size}"
+              " similar names were not compared", file=sys.stderr)
+    return 0
+
+
+def migrate_command(args):
+    """Applies the pending database migrations. Returns the exit code."""
+    for name in migrate():
+        print(f"applied {name}")
+    return 0
+
+
+def column_list(text):
+    """Parses a comma separated list of guestlist columns."""
+    columns = tuple(column.strip() for column in text.split(",") if column.strip())
+    unknown = [column for column in columns if column not in ATTENDEE_COLUMNS]
+    if unknown or not columns:
+        raise argparse.ArgumentTypeError(
+            f"choose from: {', '.join(ATTENDEE_COLUMNS)}")
+    return columns
+
+
+def choice_list(choices):
+    """Returns a parser of a comma separated list of the given choices."""
+    def parse(text):
+        values = [value.strip() for value in text.split(",") if value.strip()]
+        if not values or any(value not in choices for value in values):
+            raise argparse.ArgumentTypeError(f"choose from: {', '.join(choices)}")
+        return values
+    return parse
+
+
+def create_parser():
+    """Creates the command line parser with all the commands."""
+    parser = argparse.ArgumentParser(
+        description="Manage the conference guest list from the command line.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    output_options = argparse.ArgumentParser(add_help=False)
+    output_options.add_argument("--format", choices=("json", "csv"), default="json",
+                                help="how the attendees are printed")
+
+    add_parser = commands.add_parser(
+        "add", parents=[output_options], help="add an attendee")
+    for column in GUESTLIST_COLUMNS[:-1]:
+        add_parser.add_argument(column)
+    add_parser.add_argument("--skip-duplicates", action="store_true",
+                            help="do not add the attendee if they look like"
+                                 " someone already on the list")
+    add_parser.set_defaults(handler=add_command)
+
+    search_parser = commands.add_parser(
+        "search", parents=[output_options], help="find attendees by name")
+    search_parser.add_argument("query", help="a part of the attendee's name")
+    search_parser.add_argument("--ranked", action="store_true",
+                               help="also match email and company, best first")
+    search_parser.add_argument("--limit", type=int, default=SEARCH_LIMIT,
+                               help="maximum number of attendees printed")
+    search_parser.set_defaults(handler=search_command)
+
+    remove_parser = commands.add_parser(
+        "remove", parents=[output_options],
+        help="remove the attendees matching all the given filters")
+    remove_parser.add_argument("guest_ids", nargs="*", type=int,
+                               help="guest_ids of the attendees")
+    remove_parser.add_argument("--company", help="exact company name")
+    remove_parser.add_argument("--added-after", type=datetime.fromisoformat,
+                               help="added at or after this date (ISO format)")
+    remove_parser.add_argument("--added-before", type=datetime.fromisoformat,
+                               help="added before this date (ISO format)")
+    remove_parser.set_defaults(handler=remove_command)
+
+    list_parser = commands.add_parser(
+        "list", parents=[output_options], help="print all the attendees")
+    list_parser.add_argument("--columns", type=column_list, default=ATTENDEE_COLUMNS,
+                             help="comma separated columns to print")
+    list_parser.set_defaults(handler=list_command)
+
+    export_parser = commands.add_parser(
+        "export", help="save the guest list to a docx, xlsx, csv or parquet file")
+    export_parser.add_argument("filename")
+    export_parser.add_argument("--file-format", choices=tuple(EXPORT_FUNCTIONS),
+                               default="xlsx")
+    changes_options = export_parser.add_mutually_exclusive_group()
+    changes_options.add_argument(
+        "--changes", action="store_true",
+        help="save only the attendees added, updated and removed since the last"
+             " --changes export")
+    changes_options.add_argument(
+        "--append", action="store_true",
+        help="update an existing csv export with the changes since it was saved")
+    export_parser.add_argument("--watermark", default=DEFAULT_WATERMARK_FILE,
+                               help="file where --changes remembers the last export")
+    export_parser.set_defaults(handler=export_command)
+
+    export_jobs_parser = commands.add_parser(
+        "export-jobs", help="save the guest list to many formats, whole or split"
+                            " by company or city, in parallel")
+    export_jobs_parser.add_argument("directory", help="where the files are saved")
+    export_jobs_parser.add_argument(
+        "--formats", type=choice_list(tuple(RENDERERS)), default=["docx", "xlsx", "csv"],
+        help="comma separated file formats (default: docx,xlsx,csv)")
+    export_jobs_parser.add_argument(
+        "--partition-by", type=choice_list(("all",) + PARTITION_COLUMNS[1:]),
+        default=["all"],
+        help="comma separated: all (one file), company, city (a file for each)")
+    export_jobs_parser.add_argument("--prefix", default=DEFAULT_FILE_PREFIX,
+                                    help="beginning of the file names")
+    export_jobs_parser.add_argument("--workers", type=int,
+                                    help="processes rendering files (default: one per CPU)")
+    export_jobs_parser.set_defaults(handler=export_jobs_command)
+
+    batch_parser = commands.add_parser(
+        "batch", help="run commands from a file or stdin in one transaction")
+    batch_parser.add_argument("file", nargs="?", default="-",
+                              help="file with one command per line (default: stdin)")
+    batch_parser.set_defaults(handler=batch_command)
+
+    import_parser = commands.add_parser(
+        "import", help="add attendees from csv or xlsx files")
+    import_parser.add_argument("files", nargs="+",
+                               help="csv or xlsx files with attendees")
+    import_parser.add_argument("--chunk-size", type=int,
+                               help="number of records saved per transaction")
+    import_parser.add_argument("--method", choices=("copy", "insert"),
+                               default="copy",
+                               help="load with COPY or with multi-row INSERTs")
+    import_parser.set_defaults(handler=import_command)
+
+    check_in_parser = commands.add_parser(
+        "checkin", help="check attendees in by guest_id, email or badge code")
+    check_in_parser.add_argument(
+        "keys", nargs="*",
+        help="guest_ids, emails or badge codes (default: one per line from stdin)")
+    check_in_parser.set_defaults(handler=check_in_command)
+
+    duplicates_parser = commands.add_parser(
+        "duplicates", help="report (or merge) attendees registered more than once")
+    duplicates_parser.add_argument(
+        "--merge", action="store_true",
+        help="keep the first record of every group, filled in from the others")
+    duplicates_parser.add_argument(
+        "--max-block-size", type=int, default=MAX_BLOCK_SIZE,
+        help="larger groups of similar names are not compared")
+    duplicates_parser.set_defaults(handler=duplicates_command)
+
+    migrate_parser = commands.add_parser(
+        "migrate", help="create or update the database tables and indexes")
+    migrate_parser.set_defaults(handler=migrate_command)
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs the command given on the command line. Never imports Qt,
+    so it works without a display, e.g. in scheduled jobs.
+    add, search, remove, list and export run in a transaction, so their
+    database errors are reported on stderr with exit code 1.
+    Returns the exit code.
+    """
+    args = create_parser().parse_args(argv)
+    instrumentation.configure()
+    if args.command not in BATCH_COMMANDS:
+        return args.handler(args)
+    try:
+        with get_engine().transaction():
+            return args.handler(args)
+    except Exception as error:
+        print(f"{args.command} failed: {error}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import backend
+from backend import get_matching_attendees
+from cli import main
+from storage import MemoryEngine, set_engine
+
+test_attendee_arguments = ['Hermenegildo', 'Clitestname', 'New York',
+                           'Testers', 'jd@testers.com', '123456789']
+
+
+def run_cli(*argv, stdin=''):
+    """Runs the command line tool. Returns its exit code, stdout and stderr."""
+    output, errors = io.StringIO(), io.StringIO()
+    old_stdin, sys.stdin = sys.stdin, io.StringIO(stdin)
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(errors):
+            exit_code = main(list(argv))
+    finally:
+        sys.stdin = old_stdin
+    return exit_code, output.getvalue(), errors.getvalue()
+
+
+class CliTests(unittest.TestCase):
+    def tearDown(self):
+        for attendee in get_matching_attendees('%Clitestname%'):
+            run_cli('remove', str(attendee.guest_id))
+
+    def test_add_search_remove(self):
+        """
+        Checks if an attendee added from the command line can be found
+        and removed, with the data printed as JSON.
+        """
+        exit_code, output, _ = run_cli('add', *test_attendee_arguments)
+        self.assertEqual(exit_code, 0)
+        added = json.loads(output)[0]
+        self.assertEqual(added['last_name'], 'Clitestname')
+
+        _, output, _ = run_cli('search', 'gildo clitest')
+        self.assertEqual([attendee['guest_id'] for attendee in json.loads(output)],
+                         [added['guest_id']])
+
+        _, output, _ = run_cli('remove', str(added['guest_id']), '--format', 'csv')
+        rows = list(csv.reader(io.StringIO(output)))
+        self.assertEqual(rows[0][:2], ['guest_id', 'first_name'])
+        self.assertEqual(rows[1][0], str(added['guest_id']))
+        self.assertFalse(get_matching_attendees('%Clitestname%'))
+
+    def test_search_limit(self):
+        """Checks if search prints at most --limit attendees, the first ones added."""
+        added = [json.loads(run_cli('add', *test_attendee_arguments)[1])[0]['guest_id']
+                 for _ in range(3)]
+        _, output, _ = run_cli('search', 'clitestname', '--limit', '2')
+        self.assertEqual([attendee['guest_id'] for attendee in json.loads(output)],
+                         added[:2])
+
+    def test_list_columns(self):
+        """Checks if list prints only the chosen columns."""
+        run_cli('add', *test_attendee_arguments)
+        exit_code, output, _ = run_cli('list', '--columns', 'guest_id,last_name',
+                                       '--format', 'csv')
+        rows = list(csv.reader(io.StringIO(output)))
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(rows[0], ['guest_id', 'last_name'])
+        self.assertIn('Clitestname', [row[1] for row in rows[1:]])
+
+    def test_batch(self):
+        """
+        Checks if a batch is run in one transaction: all of it,
+        or nothing when one of its commands fails.
+        """
+        add = 'add ' + ' '.join(f"'{argument}'" for argument in test_attendee_arguments)
+        exit_code, _, _ = run_cli('batch', stdin=f"# two attendees\n{add}\n\n{add}\n")
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(len(get_matching_attendees('%Clitestname%')), 2)
+
+        exit_code, _, errors = run_cli(
+            'batch', stdin=f"{add}\nremove --company Testers --added-after nonsense\n")
+        self.assertEqual(exit_code, 2)
+        exit_code, _, errors = run_cli('batch', stdin=f"{add}\nremove\n")
+        self.assertEqual(exit_code, 1)
+        self.assertIn('no changes were kept', errors)
+        self.assertEqual(len(get_matching_attendees('%Clitestname%')), 2)
+
+    def test_export(self):
+        """Checks if export creates the file and prints its name."""
+        exit_code, output, _ = run_cli('export', 'test_cli_export.xlsx')
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(output.strip(), 'test_cli_export.xlsx')
+        self.assertTrue(os.path.exists('test_cli_export.xlsx'))
+        os.unlink('test_cli_export.xlsx')
+        exit_code, _, errors = run_cli('export', 'test_cli_export.xlsx', '--append')
+        self.assertEqual(exit_code, 2)
+        self.assertIn('--file-format csv', errors)
+
+    def test_export_csv_uses_copy(self):
+        """Checks if the csv export of PostgreSQL is written by COPY, not row by row."""
+        run_cli('add', *test_attendee_arguments)
+        with mock.patch('export_cache.get_export_cache', return_value=None), \
+                mock.patch('backend.copy_to_file', wraps=backend.copy_to_file) as copy_to_file:
+            exit_code, _, _ = run_cli('export', 'test_cli_export.csv', '--file-format', 'csv')
+        self.assertEqual(exit_code, 0)
+        copy_to_file.assert_called_once()
+        with open('test_cli_export.csv') as csv_file:
+            self.assertIn('Clitestname', csv_file.read())
+        os.unlink('test_cli_export.csv')
+
+    def test_no_qt(self):
+        """
+        Checks if the command line tool (run in a new process)
+        works without importing Qt.
+        """
+        finished = subprocess.run(
+            [sys.executable, '-c',
+             'import sys, cli;'
+             ' cli.main(["list"]);'
+             ' sys.exit("PyQt5" in sys.modules)'],
+            capture_output=True, text=True)
+        self.assertEqual(finished.returncode, 0, finished.stderr)
+
+
+class MemoryEngineCliTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = MemoryEngine()
+        self.previous_engine = set_engine(self.engine)
+
+    def tearDown(self):
+        set_engine(self.previous_engine)
+        self.engine.close()
+
+    def test_memory_engine(self):
+        """Checks if the commands work with an engine other than PostgreSQL."""
+        exit_code, _, _ = run_cli('add', *test_attendee_arguments)
+        self.assertEqual(exit_code, 0)
+        _, output, _ = run_cli('list', '--format', 'csv')
+        rows = list(csv.reader(io.StringIO(output)))
+        self.assertEqual([row[2] for row in rows[1:]], ['Clitestname'])
+        self.assertEqual(len(self.engine.get_matching_attendees('%Clitestname%')), 1)
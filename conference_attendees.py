@@ -6,14 +6,26 @@
 # - remove an existing attendee (based on a database)
 # - display information on an attendee
 # - list all of the attendees -> output it to a docx or xlsx file
+#
+# Run without arguments to open the window. With arguments it works
+# as the command line tool (see cli.py) and never imports Qt, e.g.
+#   python conference_attendees.py list --format csv
 
 import sys
 
-from gui import GUIMenu
-from PyQt5.QtWidgets import QApplication
+import instrumentation
 
 
 def main():
+    if len(sys.argv) > 1:
+        import cli
+        sys.exit(cli.main(sys.argv[1:]))
+
+    # Qt is imported only when the window is opened
+    from gui import GUIMenu
+    from PyQt5.QtWidgets import QApplication
+
+    instrumentation.configure()
     app = QApplication(sys.argv)
     menu = GUIMenu()
     sys.exit(app.exec_())
@@ -1,3 +1,5 @@
+import os
+
 from configparser import ConfigParser
 
 def get_database_configuration(filename='database.ini', section ='postgresql'):
@@ -12,4 +14,33 @@ def get_database_configuration(filename='database.ini', section ='postgresql'):
 	else:
 		raise Exception('Section {0} not found in the {1} file'.format(section, filename))
 
-	return database
\ No newline at end of file
+	return database
+
+
+_parsed_files = {}
+
+
+def get_cached_configuration(filename='database.ini', section='postgresql', defaults=None):
+	"""
+	Works like get_database_configuration, but the file is parsed only
+	once and parsed again only when its modification time changes.
+	If the section is missing and defaults are given, returns the defaults
+	instead of raising. Returns a new dictionary on every call.
+	"""
+	modified = os.path.getmtime(filename)
+	cached = _parsed_files.get(filename)
+	if cached is None or cached[0] != modified:
+		parser = ConfigParser()
+		parser.read(filename)
+		sections = {name: dict(parser.items(name)) for name in parser.sections()}
+		cached = (modified, sections)
+		_parsed_files[filename] = cached
+
+	sections = cached[1]
+	if section in sections:
+		configuration = dict(defaults or {})
+		configuration.update(sections[section])
+		return configuration
+	if defaults is not None:
+		return dict(defaults)
+	raise Exception('Section {0} not found in the {1} file'.format(section, filename))
\ No newline at end of file
@@ -0,0 +1,197 @@
+import atexit
+import threading
+import time
+
+import psycopg2 as pg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+from config import get_cached_configuration
+
+CONFIGURATION_FILE = "conference_attendees.ini"
+
+DEFAULT_POOL_SETTINGS = {
+    "minconn": "1",
+    "maxconn": "10",
+    "health_check_interval": "30",
+    "timeout": "30",
+}
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections. Keeps up to maxconn
+    connections open and hands them out one caller at a time. When all
+    of them are in use, get_connection waits up to timeout seconds for
+    one to be released. A connection that has been idle for longer than
+    health_check_interval seconds is checked with 'SELECT 1' before it
+    is handed out; broken connections are dropped and replaced.
+    """
+    def __init__(self, parameters, minconn=1, maxconn=10,
+                 health_check_interval=30.0, timeout=30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise PoolError("minconn must be between 0 and maxconn")
+        self.parameters = dict(parameters)
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.closed = False
+        self._idle = []     # (connection, time it was released)
+        self._opened = 0
+        self._condition = threading.Condition()
+
+        for _ in range(minconn):
+            self._opened += 1
+            self._idle.append((self._open_connection(), time.monotonic()))
+
+    def _open_connection(self):
+        """
+        Opens a new connection. Gives the reserved slot back
+        if the connection cannot be opened.
+        """
+        try:
+            return pg2.connect(**self.parameters)
+        except Exception:
+            with self._condition:
+                self._opened -= 1
+                self._condition.notify()
+            raise
+
+    def _is_healthy(self, conn, last_used):
+        """Checks if the connection can still be used."""
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.close()
+            conn.rollback()
+            return True
+        except pg2.Error:
+            return False
+
+    def _discard(self, conn):
+        """Closes the connection and frees its slot in the pool."""
+        try:
+            conn.close()
+        except pg2.Error:
+            pass
+        with self._condition:
+            self._opened -= 1
+            self._condition.notify()
+
+    def get_connection(self):
+        """
+        Returns a healthy connection from the pool. Opens a new one
+        if none is idle and the pool is not full yet.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._condition:
+                while True:
+                    if self.closed:
+                        raise PoolError("connection pool is closed")
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._opened < self.maxconn:
+                        self._opened += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolError("timed out waiting for a free connection")
+                    self._condition.wait(remaining)
+
+            if conn is None:
+                return self._open_connection()
+            if self._is_healthy(conn, last_used):
+                return conn
+            self._discard(conn)
+
+    def release_connection(self, conn):
+        """
+        Takes back a connection obtained with get_connection.
+        Rolls back whatever was left uncommitted on it.
+        """
+        if self.closed or conn.closed:
+            self._discard(conn)
+            return
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except pg2.Error:
+                self._discard(conn)
+                return
+        with self._condition:
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    def close(self):
+        """
+        Closes all idle connections. Connections that are in use
+        are closed when they are released.
+        """
+        with self._condition:
+            self.closed = True
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+            self._condition.notify_all()
+        for conn, _ in idle:
+            conn.close()
+
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+
+def set_configuration_file(filename):
+    """
+    Makes the pool connect to the database described in another
+    configuration file, e.g. a scratch database for benchmarks.
+    """
+    global CONFIGURATION_FILE
+    CONFIGURATION_FILE = filename
+
+
+def get_pool(filename=None):
+    """
+    Returns the pool for the database described in the configuration file
+    (CONFIGURATION_FILE by default). The pool is created on first use
+    and replaced when the connection or pool settings in the file change.
+    """
+    global _pool, _pool_key
+    if filename is None:
+        filename = CONFIGURATION_FILE
+    parameters = get_cached_configuration(filename=filename, section="postgresql")
+    settings = get_cached_configuration(filename=filename, section="pool",
+                                        defaults=DEFAULT_POOL_SETTINGS)
+    key = (sorted(parameters.items()), sorted(settings.items()))
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(
+                parameters,
+                minconn=int(settings["minconn"]),
+                maxconn=int(settings["maxconn"]),
+                health_check_interval=float(settings["health_check_interval"]),
+                timeout=float(settings["timeout"]),
+            )
+            _pool_key = key
+        return _pool
+
+
+def close_pool():
+    """Closes the current pool, if there is one."""
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool, _pool_key = None, None
+
+
+atexit.register(close_pool)
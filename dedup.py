@@ -0,0 +1,319 @@
+import re
+import unicodedata
+from collections import namedtuple
+
+from backend import (
+    ATTENDEE_COLUMNS,
+    base_query,
+    make_attendees,
+    select_attendee_columns,
+    transaction,
+)
+from storage import get_engine, similarity
+
+# Name similarity (see storage.similarity) from which two attendees
+# of the same company or city are taken for one person
+NAME_SIMILARITY = 0.6
+
+# Name similarity from which two attendees with the same phone number
+# are taken for one person (colleagues can share a switchboard number)
+PHONE_NAME_SIMILARITY = 0.3
+
+# Phone numbers are compared by their last digits, so the same number
+# written with and without the country code matches
+PHONE_KEY_DIGITS = 9
+MIN_PHONE_DIGITS = 6
+
+# Blocks with more attendees than this are not compared pair by pair
+# (e.g. a name key shared by thousands); see DuplicateFinder
+MAX_BLOCK_SIZE = 500
+
+# Attendees read by the insert-time check at most
+MAX_CANDIDATES = 200
+
+# The same expressions as in the indexes of the 0008_duplicate_check_indexes
+# migration, so that the insert-time check can use them
+EMAIL_KEY_SQL = r"regexp_replace(lower(btrim(email)), '\+[^@]*@', '@')"
+PHONE_KEY_SQL = r"right(regexp_replace(phone, '\D', '', 'g'), 9)"
+
+# Columns the duplicates are found by
+DEDUP_COLUMNS = ("guest_id", "first_name", "last_name", "city", "company", "email", "phone")
+
+# Normalized data of an attendee, compared by match_reason
+DedupKey = namedtuple("DedupKey", ("guest_id", "name", "email", "phone", "company", "city"))
+
+# Result of find_possible_duplicates: an attendee already on the list
+# and why they look like the new one ('email', 'phone' or 'name')
+PossibleDuplicate = namedtuple("PossibleDuplicate", ("attendee", "reason"))
+
+# Result of DuplicateFinder.clusters: guest_ids of attendees that look
+# like one person and the reasons they were joined for
+DuplicateCluster = namedtuple("DuplicateCluster", ("guest_ids", "reasons"))
+
+_NOT_ALPHANUMERIC = re.compile(r"[\W_]+")
+_NOT_DIGITS = re.compile(r"\D")
+_EMAIL_TAG = re.compile(r"\+[^@]*@")
+
+
+def normalize_name(text):
+    """
+    Returns the text lowercased, without accents and with every run
+    of other characters than letters and digits replaced by one space.
+    """
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _NOT_ALPHANUMERIC.sub(" ", text.lower()).strip()
+
+
+def normalize_email(email):
+    """
+    Returns the email lowercased and without a '+tag' in front of the @,
+    or None if it is not an email. Works like EMAIL_KEY_SQL.
+    """
+    if not email or "@" not in email:
+        return None
+    return _EMAIL_TAG.sub("@", email.strip(" ").lower(), count=1)
+
+
+def normalize_phone(phone):
+    """
+    Returns the last PHONE_KEY_DIGITS digits of the phone number, or None
+    if it has fewer than MIN_PHONE_DIGITS. Works like PHONE_KEY_SQL.
+    """
+    digits = _NOT_DIGITS.sub("", phone or "")
+    if len(digits) < MIN_PHONE_DIGITS:
+        return None
+    return digits[-PHONE_KEY_DIGITS:]
+
+
+def normalize_attendee(guest_id, first_name, last_name, city, company, email, phone):
+    """Returns the DedupKey of an attendee's data."""
+    return DedupKey(
+        guest_id,
+        normalize_name(f"{first_name} {last_name}"),
+        normalize_email(email),
+        normalize_phone(phone),
+        normalize_name(company),
+        normalize_name(city),
+    )
+
+
+def blocking_keys(key):
+    """
+    Returns the keys of the blocks the attendee is put in: attendees
+    are compared only with the ones sharing a block. The name keys are
+    the first letter of one part of the name and the first three of
+    the other, both ways round, so typos further in and swapped first
+    and last names still share a block.
+    """
+    keys = []
+    if key.email:
+        keys.append(("email", key.email))
+    if key.phone:
+        keys.append(("phone", key.phone))
+    words = key.name.split()
+    if len(words) >= 2:
+        first, last = words[0], "".join(words[1:])
+        keys.append(("name", first[0] + last[:3]))
+        keys.append(("name", last[0] + first[:3]))
+    return keys
+
+
+def match_reason(key, other):
+    """
+    Takes in two DedupKeys. Returns why the attendees look like one person:
+    'email' for the same email, 'phone' for the same phone number and
+    a similar name, 'name' for a very similar name and the same company
+    or city. Returns None if they do not.
+    """
+    if key.email and key.email == other.email:
+        return "email"
+    name_similarity = similarity(key.name, other.name)
+    if key.phone and key.phone == other.phone and name_similarity >= PHONE_NAME_SIMILARITY:
+        return "phone"
+    if name_similarity >= NAME_SIMILARITY and (
+            (key.company and key.company == other.company)
+            or (key.city and key.city == other.city)):
+        return "name"
+    return None
+
+
+def attendee_key(attendee):
+    """Returns the DedupKey of an Attendee record."""
+    return normalize_attendee(attendee.guest_id, attendee.first_name, attendee.last_name,
+                              attendee.city, attendee.company, attendee.email,
+                              attendee.phone)
+
+
+class DuplicateFinder:
+    """
+    Finds groups of attendees that look like one person without comparing
+    every attendee with every other one: each attendee is put in a few
+    blocks (see blocking_keys) and compared only within them, so the
+    work grows with the size of the list, not with its square.
+    Attendees with the same email are joined without comparing them.
+    Blocks larger than max_block_size are skipped and counted in
+    skipped_blocks. Only the normalized data is kept in memory.
+    """
+    def __init__(self, max_block_size=MAX_BLOCK_SIZE):
+        self.max_block_size = max_block_size
+        self.skipped_blocks = 0
+        self.attendees = 0
+        self._blocks = {}
+
+    def add(self, attendee):
+        """Takes in an Attendee record (with at least DEDUP_COLUMNS)."""
+        key = attendee_key(attendee)
+        self.attendees += 1
+        for block_key in blocking_keys(key):
+            self._blocks.setdefault(block_key, []).append(key)
+
+    def add_all(self, attendees):
+        """Takes in an iterable of Attendee records. Returns self."""
+        for attendee in attendees:
+            self.add(attendee)
+        return self
+
+    def clusters(self):
+        """Returns a list of DuplicateClusters, ordered by their first guest_id."""
+        parents = {}
+        reasons = {}
+
+        def find(guest_id):
+            root = guest_id
+            while parents.get(root, root) != root:
+                root = parents[root]
+            while guest_id != root:
+                parents[guest_id], guest_id = root, parents[guest_id]
+            return root
+
+        def join(guest_id, other_id, reason):
+            parents.setdefault(guest_id, guest_id)
+            parents.setdefault(other_id, other_id)
+            root, other_root = find(guest_id), find(other_id)
+            if root != other_root:
+                root, other_root = min(root, other_root), max(root, other_root)
+                parents[other_root] = root
+                reasons.setdefault(root, set()).update(reasons.pop(other_root, ()))
+            reasons.setdefault(root, set()).add(reason)
+
+        self.skipped_blocks = 0
+        for (kind, _value), keys in self._blocks.items():
+            if len(keys) < 2:
+                continue
+            if kind == "email":
+                for key in keys[1:]:
+                    join(keys[0].guest_id, key.guest_id, "email")
+                continue
+            if len(keys) > self.max_block_size:
+                self.skipped_blocks += 1
+                continue
+            for position, key in enumerate(keys):
+                for other in keys[position + 1:]:
+                    if find(key.guest_id) == find(other.guest_id):
+                        continue
+                    reason = match_reason(key, other)
+                    if reason is not None:
+                        join(key.guest_id, other.guest_id, reason)
+
+        members = {}
+        for guest_id in parents:
+            members.setdefault(find(guest_id), []).append(guest_id)
+        return sorted(
+            (DuplicateCluster(sorted(guest_ids), sorted(reasons[root]))
+             for root, guest_ids in members.items() if len(guest_ids) > 1),
+            key=lambda cluster: cluster.guest_ids[0])
+
+
+def find_duplicate_clusters(attendees=None, max_block_size=MAX_BLOCK_SIZE):
+    """
+    Takes in an iterable of Attendee records (by default all the attendees,
+    read in batches). Returns a list of DuplicateClusters.
+    """
+    if attendees is None:
+        attendees = get_engine().iterate_all_attendees(columns=DEDUP_COLUMNS)
+    return DuplicateFinder(max_block_size).add_all(attendees).clusters()
+
+
+@base_query
+def get_duplicate_candidates(cur, email_key, phone_key, name,
+                             limit=MAX_CANDIDATES, columns=ATTENDEE_COLUMNS):
+    """
+    Returns a list of the attendees with the normalized email or phone
+    number, or with a name similar to the given one (pg_trgm's % operator),
+    using the indexes on the three.
+    """
+    selected, record_type = select_attendee_columns(columns)
+    sql = f"""SELECT {selected} FROM guestlist
+              WHERE {EMAIL_KEY_SQL} = %(email_key)s
+              OR {PHONE_KEY_SQL} = %(phone_key)s
+              OR (first_name || ' ' || last_name) %% %(name)s
+              ORDER BY guest_id LIMIT %(limit)s;"""
+    cur.execute(sql, {"email_key": email_key, "phone_key": phone_key,
+                      "name": name, "limit": limit})
+    return cur, make_attendees(cur.fetchall(), record_type)
+
+
+def find_possible_duplicates(attendee_data, engine=None):
+    """
+    Takes in a list of a new attendee's data (first name, last name,
+    city, company, email, phone). Returns a list of PossibleDuplicates:
+    the attendees already on the list that look like the same person.
+    In PostgreSQL only a few candidates are read, by index; other engines
+    are read whole. Returns None if the database could not be read.
+    """
+    engine = engine or get_engine()
+    first_name, last_name, city, company, email, phone = attendee_data[:6]
+    key = normalize_attendee(None, first_name, last_name, city, company, email, phone)
+    if engine.name == "postgresql":
+        # In its own transaction (or savepoint), so a failed check
+        # does not stop the attendee from being added
+        try:
+            with transaction():
+                candidates = get_duplicate_candidates(key.email, key.phone,
+                                                      f"{first_name} {last_name}")
+        except Exception:
+            return None
+    else:
+        candidates = engine.iterate_all_attendees()
+    if candidates is None:
+        return None
+    duplicates = []
+    for attendee in candidates:
+        reason = match_reason(key, attendee_key(attendee))
+        if reason is not None:
+            duplicates.append(PossibleDuplicate(attendee, reason))
+    return duplicates
+
+
+@base_query
+def merge_duplicates(cur, guest_ids):
+    """
+    Takes in a list of guest_ids of one person's records. Keeps the first
+    one added, filling its empty city, company, email and phone from the
+    others and its check-in time with the earliest one, and removes the
+    others. Returns the guest_id kept, or None if none of the records
+    is on the list any more (e.g. removed since the duplicates were found).
+    Needs PostgreSQL with the 0007_check_in migration applied.
+    """
+    cur.execute("""SELECT guest_id, city, company, email, phone FROM guestlist
+                   WHERE guest_id = ANY(%s) ORDER BY date_added, guest_id FOR UPDATE;""",
+                (list(guest_ids),))
+    rows = cur.fetchall()
+    if not rows:
+        return cur, None
+    kept_id = rows[0][0]
+    if len(rows) == 1:
+        return cur, kept_id
+    merged = [next((row[column] for row in rows if row[column]), rows[0][column])
+              for column in range(1, 5)]
+    cur.execute("""UPDATE guestlist SET city = %s, company = %s, email = %s, phone = %s,
+                          checked_in_at = (SELECT min(checked_in_at) FROM guestlist
+                                           WHERE guest_id = ANY(%s))
+                   WHERE guest_id = %s;""",
+                merged + [list(guest_ids), kept_id])
+    cur.execute("""DELETE FROM guestlist WHERE guest_id = ANY(%s) AND guest_id <> %s;""",
+                (list(guest_ids), kept_id))
+    return cur, kept_id
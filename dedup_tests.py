@@ -0,0 +1,145 @@
+import unittest
+
+from backend import base_query, get_attendee, remove_attendees, store_attendee_data_in_postgresql
+from dedup import (
+    EMAIL_KEY_SQL,
+    PHONE_KEY_SQL,
+    DuplicateFinder,
+    find_duplicate_clusters,
+    find_possible_duplicates,
+    merge_duplicates,
+    normalize_email,
+    normalize_name,
+    normalize_phone,
+)
+from schema import extension_installed, migrate
+from storage import PostgresEngine, create_engine
+
+test_attendees_data = [
+    ['Józef', 'Dedupname', 'Kraków', 'Dedup Testers', 'Jozef+conf@Dedup.com', '+48 600 100 200'],
+    ['Jozef', 'Dedupnam', 'Krakow', 'Dedup Testers', '', ''],
+    ['Dedupname', 'Józef', 'Gdańsk', 'Dedup Others', 'jozef@dedup.com', ''],
+    ['Anna', 'Phonename', 'Warsaw', 'Dedup Testers', '', '600-100-200'],
+    ['Anna', 'Otherperson', 'Lisbon', 'Dedup Elsewhere', 'anna@dedup.com', '700100200'],
+]
+
+
+@base_query
+def normalized_in_database(cur, email, phone):
+    cur.execute(f"""SELECT {EMAIL_KEY_SQL}, {PHONE_KEY_SQL}
+                    FROM (VALUES (%s, %s)) AS data(email, phone);""", (email, phone))
+    return cur, cur.fetchone()
+
+
+@base_query
+def dedup_indexes_exist(cur):
+    cur.execute("""SELECT count(*) FROM pg_indexes
+                   WHERE indexname IN ('guestlist_email_key_idx', 'guestlist_phone_key_idx');""")
+    return cur, cur.fetchone()[0] == 2
+
+
+class NormalizationTests(unittest.TestCase):
+    def test_normalize(self):
+        """Checks if names, emails and phone numbers are compared without their noise."""
+        self.assertEqual(normalize_name('  Józef-MARIA  O\'Brien '), 'jozef maria o brien')
+        self.assertEqual(normalize_name(None), '')
+        self.assertEqual(normalize_email(' Jozef+conf@Dedup.com'), 'jozef@dedup.com')
+        self.assertIsNone(normalize_email('not an email'))
+        self.assertEqual(normalize_phone('+48 600 100 200'), '600100200')
+        self.assertEqual(normalize_phone('(600) 100-200'), '600100200')
+        self.assertIsNone(normalize_phone('12-34'))
+
+
+class DuplicateFinderTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('memory')
+        for attendee_data in test_attendees_data:
+            self.engine.store_attendee_data(attendee_data)
+
+    def tearDown(self):
+        self.engine.close()
+
+    def test_clusters(self):
+        """
+        Checks if the records of one person are found by email and by
+        a similar name in the same company, and if colleagues sharing
+        a phone number are not joined.
+        """
+        clusters = find_duplicate_clusters(self.engine.iterate_all_attendees())
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0].guest_ids, [1, 2, 3])
+        self.assertEqual(clusters[0].reasons, ['email', 'name'])
+
+    def test_large_blocks_skipped(self):
+        """Checks if name blocks larger than the limit are not compared."""
+        finder = DuplicateFinder(max_block_size=1)
+        clusters = finder.add_all(self.engine.iterate_all_attendees()).clusters()
+        self.assertEqual([cluster.guest_ids for cluster in clusters], [[1, 3]])
+        self.assertGreater(finder.skipped_blocks, 0)
+
+    def test_possible_duplicates(self):
+        """Checks if a new attendee is compared with the ones on the list."""
+        duplicates = find_possible_duplicates(
+            ['Józef', 'Dedupname', 'Kraków', 'Dedup Testers', 'JOZEF@dedup.com', ''],
+            self.engine)
+        self.assertEqual([(attendee.guest_id, reason) for attendee, reason in duplicates],
+                         [(1, 'email'), (2, 'name'), (3, 'email')])
+        duplicates = find_possible_duplicates(
+            ['Anna', 'Phonenam', 'Porto', 'Nobody', '', '600 100 200'], self.engine)
+        self.assertEqual([(attendee.guest_id, reason) for attendee, reason in duplicates],
+                         [(4, 'phone')])
+        self.assertEqual(find_possible_duplicates(
+            ['Someone', 'Else', 'Porto', 'Nobody', 'else@dedup.com', ''], self.engine), [])
+
+
+class PostgresDuplicateTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        migrate()
+        if not dedup_indexes_exist():
+            raise unittest.SkipTest('the 0008_duplicate_check_indexes migration is not applied')
+
+    def setUp(self):
+        self.guest_ids = [store_attendee_data_in_postgresql(list(attendee_data))
+                          for attendee_data in test_attendees_data]
+
+    def tearDown(self):
+        for company in ('Dedup Testers', 'Dedup Others', 'Dedup Elsewhere'):
+            remove_attendees(company=company)
+
+    def test_normalized_like_the_indexes(self):
+        """Checks if the Python normalization gives the same keys as the indexed SQL."""
+        for email, phone in (('Jozef+conf@Dedup.com', '+48 600 100 200'),
+                             ('a+b+c@x.com', '12 34 56')):
+            self.assertEqual(normalized_in_database(email, phone),
+                             (normalize_email(email), normalize_phone(phone)))
+
+    def test_possible_duplicates(self):
+        """Checks if the insert-time check finds the same person by index."""
+        if not extension_installed('pg_trgm'):
+            self.skipTest('pg_trgm is not installed, run schema.migrate()')
+        duplicates = find_possible_duplicates(
+            ['Anna', 'Phonenam', 'Porto', 'Nobody', '', '(600) 100 200'], PostgresEngine())
+        self.assertEqual([(attendee.guest_id, reason) for attendee, reason in duplicates],
+                         [(self.guest_ids[3], 'phone')])
+
+    def test_merge_duplicates(self):
+        """
+        Checks if merged records keep the first one, filled in
+        from the others, and remove the rest.
+        """
+        kept_id = merge_duplicates(self.guest_ids[1:3])
+        self.assertEqual(kept_id, self.guest_ids[1])
+        kept = get_attendee(kept_id)
+        self.assertEqual(kept.first_name, 'Jozef')
+        self.assertEqual(kept.email, 'jozef@dedup.com')
+        self.assertIsNone(get_attendee(self.guest_ids[2]))
+
+    def test_merge_removed_duplicates(self):
+        """Checks if a group removed since it was found is skipped."""
+        remove_attendees(guest_ids=self.guest_ids[1:3])
+        self.assertIsNone(merge_duplicates(self.guest_ids[1:3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
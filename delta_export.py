@@ -0,0 +1,335 @@
+import csv
+import itertools
+import json
+import os
+from collections import namedtuple
+from datetime import datetime
+
+from backend import (
+    ATTENDEE_COLUMNS,
+    XLSX_COLUMN_TITLES,
+    XLSX_DATE_FORMAT,
+    Attendee,
+    OperationCancelled,
+    base_query,
+    copy_to_file,
+    create_docx_paragraph_text,
+    remove_unfinished_file,
+    report_progress,
+    stream_query,
+    transaction,
+    xlsx_file_add_rows,
+)
+from docx_stream import write_docx_paragraphs
+
+# Watermark of the delta exports, when no other file is given
+DEFAULT_WATERMARK_FILE = "export_watermark.json"
+
+# Column with the kind of change in the csv delta file
+CHANGE_COLUMN = "change"
+
+# How far the previous export got: the highest guest_id and date_added
+# and the last removal (guestlist_tombstones) seen, and the oldest
+# transaction still running then (txid, see get_current_watermark)
+Watermark = namedtuple("Watermark", ("guest_id", "date_added", "tombstone_id", "txid"))
+
+# An attendee removed from the guest list, recorded by the guestlist_tombstones
+# trigger (see the 0005_guestlist_tombstones migration)
+Tombstone = namedtuple("Tombstone", ("guest_id", "removed_at"))
+
+
+def load_watermark(filename):
+    """
+    Returns the Watermark saved in the json file,
+    or None if there is no such file. Watermarks saved before
+    the 0009_change_transaction_ids migration have no txid (None).
+    """
+    try:
+        with open(filename) as watermark_file:
+            saved = json.load(watermark_file)
+    except FileNotFoundError:
+        return None
+    date_added = saved["date_added"]
+    return Watermark(saved["guest_id"],
+                     datetime.fromisoformat(date_added) if date_added else None,
+                     saved["tombstone_id"], saved.get("txid"))
+
+
+def save_watermark(filename, watermark):
+    """
+    Saves the Watermark in the json file. The file is replaced
+    in one step, so it is never left half-written.
+    """
+    saved = watermark._asdict()
+    if watermark.date_added is not None:
+        saved["date_added"] = watermark.date_added.isoformat()
+    with open(f"{filename}.tmp", "w") as watermark_file:
+        json.dump(saved, watermark_file)
+    os.replace(f"{filename}.tmp", filename)
+
+
+@base_query
+def get_current_watermark(cur):
+    """
+    Returns a Watermark with the highest guest_id and date_added
+    in guestlist, the id of the last tombstone and the id of the oldest
+    transaction still running (the xmin of the current snapshot).
+
+    Every transaction with a lower id has ended, and the ones that
+    have not started yet get higher ids, so the changes made by
+    transactions with ids below txid are final. guest_ids do not give
+    that: a transaction can commit after another one that got a higher
+    guest_id, and its attendee would be skipped.
+    The other way round, the changes of a long transaction, and of the
+    ones that started after it, wait for the export after it ends.
+    """
+    sql = """SELECT (SELECT coalesce(max(guest_id), 0) FROM guestlist),
+                    (SELECT max(date_added) FROM guestlist),
+                    (SELECT coalesce(max(tombstone_id), 0) FROM guestlist_tombstones),
+                    txid_snapshot_xmin(txid_current_snapshot());"""
+    cur.execute(sql)
+    return cur, Watermark(*cur.fetchone())
+
+
+def changes_condition(txid_column, previous_txid, current_txid, id_column, previous_id):
+    """
+    Takes in the column with the id of the transaction that made a change,
+    the txids of two Watermarks, the column with the change's id and its
+    value in the previous Watermark. Returns the condition of a WHERE
+    clause for the changes made by the transactions that ended between
+    the two. Without a previous txid (a Watermark saved before the
+    0009_change_transaction_ids migration, or before the first export)
+    the changes after the previous id are taken instead.
+    """
+    if previous_txid is None:
+        return f"{id_column} > {previous_id:d} AND {txid_column} < {current_txid:d}"
+    return f"{txid_column} >= {previous_txid:d} AND {txid_column} < {current_txid:d}"
+
+
+def added_condition(previous, current):
+    """Returns changes_condition for the attendees added between the Watermarks."""
+    return changes_condition("inserted_txid", previous.txid, current.txid,
+                             "guest_id", previous.guest_id)
+
+
+def updated_condition(previous, current):
+    """
+    Returns the condition of a WHERE clause for the attendees added before
+    the previous Watermark whose data was changed between the two (e.g. by
+    dedup.merge_duplicates; updated_txid is set by the guestlist_updates
+    trigger of the 0011_update_transaction_ids migration). Without a
+    previous txid no update can be told apart, so there are none.
+    """
+    if previous.txid is None:
+        return "false"
+    return (f"updated_txid >= {previous.txid:d} AND updated_txid < {current.txid:d}"
+            f" AND inserted_txid < {previous.txid:d}")
+
+
+@base_query
+def get_removed_attendees(cur, previous, current):
+    """
+    Takes in two Watermarks. Returns a list of Tombstones of the attendees
+    removed after the previous one and up to the current one,
+    in the order they were removed.
+    """
+    condition = changes_condition("removed_txid", previous.txid, current.txid,
+                                  "tombstone_id", previous.tombstone_id)
+    sql = f"""SELECT guest_id, removed_at FROM guestlist_tombstones
+              WHERE {condition}
+              ORDER BY tombstone_id;"""
+    cur.execute(sql)
+    return cur, [Tombstone._make(row) for row in cur.fetchall()]
+
+
+def iterate_added_attendees(previous, current):
+    """
+    Takes in two Watermarks. Yields Attendee records of the attendees
+    added after the previous one and up to the current one, ordered
+    by guest_id, reading them in batches (see backend.stream_query).
+    They are found by the transaction that added them (inserted_txid),
+    not by guest_id or date_added, so an attendee whose transaction
+    commits late is in the next export instead of being skipped.
+    """
+    condition = added_condition(previous, current)
+    sql = f"""SELECT {", ".join(ATTENDEE_COLUMNS)} FROM guestlist
+              WHERE {condition}
+              ORDER BY guest_id;"""
+    return map(Attendee._make, stream_query(sql))
+
+
+@base_query
+def get_updated_attendees(cur, previous, current):
+    """
+    Takes in two Watermarks. Returns a list of Attendee records, with
+    their current data, of the attendees added before the previous one
+    and changed after it and up to the current one, ordered by guest_id.
+    """
+    sql = f"""SELECT {", ".join(ATTENDEE_COLUMNS)} FROM guestlist
+              WHERE {updated_condition(previous, current)}
+              ORDER BY guest_id;"""
+    cur.execute(sql)
+    return cur, [Attendee._make(row) for row in cur.fetchall()]
+
+
+def write_changes_xlsx(directory, added, updated, removed):
+    """
+    Writes the added Attendee records to the first worksheet, the updated
+    ones to the 'updated' worksheet and the removed attendees' Tombstones
+    to the 'removed' worksheet.
+    """
+    import xlsxwriter
+
+    xlsx_file = xlsxwriter.Workbook(directory, {
+        "constant_memory": True,
+        "default_date_format": XLSX_DATE_FORMAT,
+    })
+    try:
+        xlsx_file_add_rows(added, xlsx_file, XLSX_COLUMN_TITLES)
+        worksheet = xlsx_file.add_worksheet("updated")
+        worksheet.write_row(0, 0, XLSX_COLUMN_TITLES)
+        for row, attendee in enumerate(updated, 1):
+            worksheet.write_row(row, 0, attendee)
+        worksheet = xlsx_file.add_worksheet("removed")
+        worksheet.write_row(0, 0, ["id", "removed at"])
+        for row, tombstone in enumerate(removed, 1):
+            worksheet.write_row(row, 0, tombstone)
+    finally:
+        xlsx_file.close()
+
+
+def write_changes_docx(directory, added, updated, removed):
+    """
+    Writes a paragraph for every added Attendee record (like
+    get_attendees_list_format_docx), one for every updated one
+    and one for every removed attendee.
+    """
+    updated_paragraphs = (f"Updated: {create_docx_paragraph_text(attendee)}"
+                          for attendee in updated)
+    removed_paragraphs = (
+        f"Removed: id {tombstone.guest_id}"
+        f" ({tombstone.removed_at:%Y-%m-%d %H:%M:%S})" for tombstone in removed)
+    write_docx_paragraphs(directory, itertools.chain(
+        (create_docx_paragraph_text(attendee) for attendee in added),
+        updated_paragraphs, removed_paragraphs))
+
+
+def write_changes_csv(directory, added, updated, removed):
+    """
+    Writes a row for every added and updated Attendee record and one
+    with only the guest_id for every removed attendee, after a header row.
+    The first column says which change it is: 'added', 'updated' or 'removed'.
+    """
+    empty_columns = [""] * (len(ATTENDEE_COLUMNS) - 1)
+    with open(directory, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow((CHANGE_COLUMN,) + ATTENDEE_COLUMNS)
+        writer.writerows(("added",) + attendee for attendee in added)
+        writer.writerows(("updated",) + attendee for attendee in updated)
+        writer.writerows(["removed", tombstone.guest_id] + empty_columns
+                         for tombstone in removed)
+
+
+CHANGES_WRITERS = {
+    "xlsx": write_changes_xlsx,
+    "docx": write_changes_docx,
+    "csv": write_changes_csv,
+}
+
+
+def export_changes(directory, file_format="xlsx", watermark_file=DEFAULT_WATERMARK_FILE,
+                   progress_callback=None):
+    """
+    Takes in a directory with the 'to-be-created' filename.
+    Creates a file (xlsx, docx or csv) with only the attendees added,
+    updated and removed since the previous export_changes with the same
+    watermark_file, and moves the watermark forward. The first time, when there is no
+    watermark yet, every attendee is exported. Returns the directory
+    with the created file.
+
+    The work grows with the number of changes, not with the guest list.
+    progress_callback is called with the number of added attendees
+    written so far (see backend.report_progress); if it raises
+    OperationCancelled, no file is left and the watermark stays where it was.
+    Needs PostgreSQL with the 0011_update_transaction_ids migration applied;
+    database errors are raised.
+    """
+    write_changes = CHANGES_WRITERS[file_format]
+    with transaction():
+        current = get_current_watermark()
+        previous = load_watermark(watermark_file) \
+            or Watermark(0, None, current.tombstone_id, None)
+        added = report_progress(iterate_added_attendees(previous, current),
+                                progress_callback)
+        updated = get_updated_attendees(previous, current)
+        removed = get_removed_attendees(previous, current)
+        try:
+            write_changes(directory, added, updated, removed)
+        except OperationCancelled:
+            remove_unfinished_file(directory)
+            raise
+    save_watermark(watermark_file, current)
+    return directory
+
+
+def drop_rows(directory, guest_ids):
+    """
+    Takes in the directory of a csv file with the guest list and a set
+    of guest_ids. Copies the file without the rows of those attendees,
+    then puts the copy in its place.
+    """
+    with open(directory, newline="") as csv_file, \
+            open(f"{directory}.tmp", "w", newline="") as kept_file:
+        rows = csv.reader(csv_file)
+        writer = csv.writer(kept_file)
+        writer.writerow(next(rows))
+        writer.writerows(row for row in rows if int(row[0]) not in guest_ids)
+    os.replace(f"{directory}.tmp", directory)
+
+
+def append_changes_to_csv(directory, watermark_file=None):
+    """
+    Takes in the directory of a csv file with the guest list, like the one
+    created by backend.get_attendees_list_format_csv. Brings it up to date:
+    the attendees added since the last call are appended by PostgreSQL
+    (COPY ... TO STDOUT), the rows of removed attendees are dropped and
+    the rows of updated ones are dropped and appended with their new data.
+    If the file or its watermark (by default the directory with
+    '.watermark.json' added) does not exist, the whole list is written.
+    Returns the directory with the updated file.
+
+    Without removals and updates only the new rows are written; otherwise
+    the file is copied once without the removed and updated rows, which
+    still needs no database reads. Updated attendees, and those whose
+    transaction commits late, are appended out of the guest_id order.
+    Needs PostgreSQL with the 0011_update_transaction_ids migration applied;
+    database errors are raised.
+    """
+    if watermark_file is None:
+        watermark_file = f"{directory}.watermark.json"
+    previous = load_watermark(watermark_file)
+    columns = ", ".join(ATTENDEE_COLUMNS)
+    with transaction():
+        current = get_current_watermark()
+        if previous is None or not os.path.exists(directory):
+            sql = f"""COPY (SELECT {columns} FROM guestlist
+                            WHERE inserted_txid < {current.txid:d} ORDER BY guest_id)
+                      TO STDOUT WITH (FORMAT csv, HEADER)"""
+            with open(directory, "wb") as csv_file:
+                copy_to_file(sql, csv_file)
+            save_watermark(watermark_file, current)
+            return directory
+        removed = {tombstone.guest_id
+                   for tombstone in get_removed_attendees(previous, current)}
+        updated = {attendee.guest_id
+                   for attendee in get_updated_attendees(previous, current)}
+        sql = f"""COPY (SELECT {columns} FROM guestlist
+                        WHERE ({added_condition(previous, current)})
+                        OR ({updated_condition(previous, current)})
+                        ORDER BY guest_id) TO STDOUT WITH (FORMAT csv)"""
+        if removed or updated:
+            drop_rows(directory, removed | updated)
+        with open(directory, "ab") as csv_file:
+            copy_to_file(sql, csv_file)
+    save_watermark(watermark_file, current)
+    return directory
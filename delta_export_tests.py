@@ -0,0 +1,170 @@
+import csv
+import os
+import unittest
+from datetime import datetime
+
+import pandas as pd
+
+from backend import (
+    OperationCancelled,
+    base_query,
+    get_list_all_attendees,
+    remove_attendees,
+    store_attendee_data_in_postgresql,
+)
+from connection_pool import get_pool
+from delta_export import (
+    append_changes_to_csv,
+    export_changes,
+    load_watermark,
+)
+from schema import migrate, trigger_installed
+
+WATERMARK_FILE = 'test_watermark.json'
+
+test_attendee_data = ['Hermenegildo', 'Deltaname', 'New York',
+                      'Delta Testers', 'jd@testers.com', '123456789']
+
+
+@base_query
+def update_test_attendee(cur, guest_id, **values):
+    assignments = ", ".join(f"{column} = %({column})s" for column in values)
+    cur.execute(f"""UPDATE guestlist SET {assignments} WHERE guest_id = %(guest_id)s;""",
+                dict(values, guest_id=guest_id))
+    return cur, None
+
+
+def read_csv(filename):
+    with open(filename, newline='') as csv_file:
+        return list(csv.reader(csv_file))
+
+
+def remove_files(*filenames):
+    for filename in filenames:
+        if os.path.exists(filename):
+            os.unlink(filename)
+
+
+class DeltaExportTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        migrate()
+        if not trigger_installed('guestlist_tombstones'):
+            raise unittest.SkipTest('the 0005_guestlist_tombstones migration'
+                                    ' is not applied')
+
+    def setUp(self):
+        self.guest_id = store_attendee_data_in_postgresql(test_attendee_data)
+
+    def tearDown(self):
+        remove_attendees(company='Delta Testers')
+        remove_files(WATERMARK_FILE, 'test.csv', 'test.xlsx', 'test.docx',
+                     'test.csv.watermark.json')
+
+    def test_export_changes(self):
+        """
+        Checks if the first export has every attendee and the next ones
+        only the attendees added and removed since the previous export.
+        """
+        export_changes('test.csv', 'csv', WATERMARK_FILE)
+        first = read_csv('test.csv')
+        self.assertEqual(len(first) - 1, len(get_list_all_attendees()))
+        self.assertEqual(load_watermark(WATERMARK_FILE).guest_id,
+                         max(int(row[1]) for row in first[1:]))
+
+        added_id = store_attendee_data_in_postgresql(['Anna'] + test_attendee_data[1:])
+        remove_attendees(guest_ids=[self.guest_id])
+        export_changes('test.csv', 'csv', WATERMARK_FILE)
+        changes = read_csv('test.csv')
+        self.assertEqual([row[:3] for row in changes[1:]],
+                         [['added', str(added_id), 'Anna'],
+                          ['removed', str(self.guest_id), '']])
+
+        export_changes('test.csv', 'csv', WATERMARK_FILE)
+        self.assertEqual(len(read_csv('test.csv')), 1)
+
+    def test_updates(self):
+        """
+        Checks if an attendee whose data changed is exported as updated,
+        with the new data, and if a check-in is not taken for an update.
+        """
+        export_changes('test.csv', 'csv', WATERMARK_FILE)
+        update_test_attendee(self.guest_id, city='Boston')
+        export_changes('test.csv', 'csv', WATERMARK_FILE)
+        self.assertEqual([row[:5] for row in read_csv('test.csv')[1:]],
+                         [['updated', str(self.guest_id), 'Hermenegildo', 'Deltaname',
+                           'Boston']])
+
+        update_test_attendee(self.guest_id, checked_in_at=datetime.now())
+        export_changes('test.csv', 'csv', WATERMARK_FILE)
+        self.assertEqual(len(read_csv('test.csv')), 1)
+
+    def test_late_commit_not_skipped(self):
+        """
+        Checks if an attendee whose transaction got a lower guest_id, but
+        commits after an export that saw a higher one, is in the next
+        export, and no attendee is exported twice.
+        """
+        export_changes('test.csv', 'csv', WATERMARK_FILE)
+        pool = get_pool()
+        conn = pool.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""SELECT nextval(pg_get_serial_sequence('guestlist', 'guest_id'));""")
+            late_id = cur.fetchone()[0]
+            early_id = store_attendee_data_in_postgresql(['Early'] + test_attendee_data[1:])
+            cur.execute("""INSERT INTO guestlist(guest_id, first_name, last_name, company,
+                                                 date_added)
+                           VALUES (%s, 'Late', 'Deltaname', 'Delta Testers', now());""",
+                        (late_id,))
+
+            export_changes('test.csv', 'csv', WATERMARK_FILE)
+            self.assertEqual([row[:3] for row in read_csv('test.csv')[1:]],
+                             [['added', str(early_id), 'Early']])
+            conn.commit()
+        finally:
+            pool.release_connection(conn)
+
+        export_changes('test.csv', 'csv', WATERMARK_FILE)
+        self.assertEqual([row[:3] for row in read_csv('test.csv')[1:]],
+                         [['added', str(late_id), 'Late']])
+        export_changes('test.csv', 'csv', WATERMARK_FILE)
+        self.assertEqual(len(read_csv('test.csv')), 1)
+
+    def test_export_changes_xlsx_and_docx(self):
+        """Checks if the xlsx delta lists the removed attendees on their own sheet."""
+        export_changes('test.docx', 'docx', WATERMARK_FILE)
+        remove_attendees(guest_ids=[self.guest_id])
+        export_changes('test.xlsx', 'xlsx', WATERMARK_FILE)
+        self.assertTrue(pd.read_excel('test.xlsx').empty)
+        removed = pd.read_excel('test.xlsx', sheet_name='removed')
+        self.assertEqual(list(removed['id']), [self.guest_id])
+
+    def test_cancelled_export_keeps_watermark(self):
+        """Checks if a cancelled export leaves no file and does not move the watermark."""
+        def cancel(count):
+            raise OperationCancelled()
+        with self.assertRaises(OperationCancelled):
+            export_changes('test.xlsx', 'xlsx', WATERMARK_FILE, cancel)
+        self.assertFalse(os.path.exists('test.xlsx'))
+        self.assertIsNone(load_watermark(WATERMARK_FILE))
+
+    def test_append_changes_to_csv(self):
+        """
+        Checks if the csv file, after new attendees are appended, the
+        removed ones dropped and the updated ones replaced, has the same
+        rows as the guest list.
+        """
+        updated_id = store_attendee_data_in_postgresql(['Jan'] + test_attendee_data[1:])
+        append_changes_to_csv('test.csv')
+        store_attendee_data_in_postgresql(['Anna'] + test_attendee_data[1:])
+        remove_attendees(guest_ids=[self.guest_id])
+        update_test_attendee(updated_id, city='Boston')
+        append_changes_to_csv('test.csv')
+
+        rows = read_csv('test.csv')
+        expected = [[str(value) for value in attendee]
+                    for attendee in get_list_all_attendees()]
+        self.assertEqual(rows[0][0], 'guest_id')
+        self.assertEqual(sorted((row[:7] for row in rows[1:]), key=lambda row: int(row[0])),
+                         [row[:7] for row in expected])
@@ -0,0 +1,91 @@
+import os
+import re
+import zipfile
+
+DOCUMENT_PART = "word/document.xml"
+
+# Number of paragraphs rendered before they are written to the file
+WRITE_BATCH_SIZE = 1000
+
+# Characters that are not allowed in XML 1.0 documents
+_INVALID_XML_CHARACTERS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_RUN_SEPARATORS = re.compile("([\t\n\r])")
+_RUN_SEPARATOR_XML = {"\t": "<w:tab/>", "\n": "<w:br/>", "\r": "<w:br/>"}
+
+
+def default_docx_template():
+    """Returns the path of the empty document python-docx starts from."""
+    import docx
+
+    return os.path.join(os.path.dirname(docx.__file__), "templates", "default.docx")
+
+
+def escape_xml_text(text):
+    """Escapes a string so that it can be placed inside an XML element."""
+    text = _INVALID_XML_CHARACTERS.sub("", text)
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def paragraph_xml(text):
+    """
+    Takes in the text of a paragraph. Returns its WordprocessingML,
+    the same as python-docx creates for doc.add_paragraph(text):
+    tabs become <w:tab/>, new lines become <w:br/>.
+    """
+    run = []
+    for piece in _RUN_SEPARATORS.split(str(text)):
+        if piece in _RUN_SEPARATOR_XML:
+            run.append(_RUN_SEPARATOR_XML[piece])
+        elif piece:
+            if piece[0].isspace() or piece[-1].isspace():
+                run.append(f'<w:t xml:space="preserve">{escape_xml_text(piece)}</w:t>')
+            else:
+                run.append(f"<w:t>{escape_xml_text(piece)}</w:t>")
+    if not run:
+        return "<w:p/>"
+    return f"<w:p><w:r>{''.join(run)}</w:r></w:p>"
+
+
+def split_document_body(document):
+    """
+    Takes in the text of a document.xml part with an empty body.
+    Returns the text before the paragraphs go and the text after them.
+    """
+    body_start = document.index("<w:body>") + len("<w:body>")
+    section_start = document.find("<w:sectPr", body_start)
+    if section_start == -1:
+        section_start = document.index("</w:body>", body_start)
+    return document[:body_start], document[section_start:]
+
+
+def write_docx_paragraphs(directory, paragraphs, template=None):
+    """
+    Takes in a directory with the 'to-be-created' filename and an iterable
+    of paragraph texts. Writes a word document (*.docx) with one paragraph
+    per text. The paragraphs are rendered and compressed straight into
+    the file in batches, so memory use does not depend on their number.
+    Every other part of the document is copied from the template.
+    Returns the directory with the created file.
+    """
+    if template is None:
+        template = default_docx_template()
+
+    with zipfile.ZipFile(template) as source, \
+            zipfile.ZipFile(directory, "w", zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            if item.filename != DOCUMENT_PART:
+                target.writestr(item, source.read(item), zipfile.ZIP_DEFLATED)
+                continue
+
+            head, tail = split_document_body(source.read(item).decode("utf-8"))
+            with target.open(DOCUMENT_PART, "w") as document:
+                document.write(head.encode("utf-8"))
+                batch = []
+                for paragraph in paragraphs:
+                    batch.append(paragraph_xml(paragraph))
+                    if len(batch) == WRITE_BATCH_SIZE:
+                        document.write("".join(batch).encode("utf-8"))
+                        batch = []
+                document.write("".join(batch).encode("utf-8"))
+                document.write(tail.encode("utf-8"))
+    return directory
@@ -0,0 +1,45 @@
+import os
+import unittest
+import zipfile
+
+import docx
+
+from docx_stream import DOCUMENT_PART, paragraph_xml, write_docx_paragraphs
+
+
+test_paragraphs = [
+    "[ ] id 1:\n\tJohn & Jane <Doe> from Łódź\n\tWorking at \"GDF\",",
+    "  leading and trailing spaces  ",
+    "",
+    "new line\r\nand\ttab",
+]
+
+
+class DocxStreamTests(unittest.TestCase):
+    def test_paragraph_xml(self):
+        """
+        Checks if the paragraphs are rendered the same way
+        python-docx renders them.
+        """
+        doc = docx.Document()
+        for text in test_paragraphs:
+            doc.add_paragraph(text)
+        doc.save('test.docx')
+        with zipfile.ZipFile('test.docx') as document:
+            expected = document.read(DOCUMENT_PART).decode('utf-8')
+        os.unlink('test.docx')
+
+        for text in test_paragraphs:
+            self.assertIn(paragraph_xml(text), expected)
+
+    def test_write_docx_paragraphs(self):
+        """
+        Checks if python-docx reads back the same paragraphs
+        that were written.
+        """
+        write_docx_paragraphs('test.docx', iter(test_paragraphs))
+        doc = docx.Document('test.docx')
+        # python-docx reads every line break back as a new line
+        self.assertEqual([paragraph.text for paragraph in doc.paragraphs],
+                         [text.replace('\r', '\n') for text in test_paragraphs])
+        os.unlink('test.docx')
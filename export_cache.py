@@ -0,0 +1,137 @@
+import functools
+import os
+import shutil
+import threading
+
+from config import get_cached_configuration
+import connection_pool
+from storage import get_engine
+
+DEFAULT_EXPORT_CACHE_SETTINGS = {
+    "enabled": "no",
+    "directory": "export_cache",
+    "max_size_mb": "200",
+}
+
+
+class ExportCache:
+    """
+    Directory with the files created by the exports, each named after
+    its format and the version of the guest list it was made from
+    (see storage.StorageEngine.table_version). While the guest list does
+    not change, the same export is served by copying the file. When the
+    files take more than max_bytes, the least recently used are deleted.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        """Returns the path of the cached file with the given key."""
+        return os.path.join(self.directory, key)
+
+    def get(self, key, destination):
+        """
+        Copies the cached file with the given key to the destination.
+        Returns True if there was one, False otherwise.
+        """
+        try:
+            shutil.copyfile(self.path(key), destination)
+        except FileNotFoundError:
+            return False
+        try:
+            # The modification time marks when a file was last used
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def put(self, key, filename):
+        """
+        Keeps a copy of the file under the given key, then deletes
+        the least recently used files over the size limit.
+        """
+        temporary = self.path(f"{key}.{threading.get_ident()}.tmp")
+        shutil.copyfile(filename, temporary)
+        os.replace(temporary, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """Deletes the least recently used files until they fit in max_bytes."""
+        with self._lock:
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def export(self, export_function, key, directory, *args, **kwargs):
+        """
+        Copies the cached file with the given key to the directory, or,
+        if there is none, runs export_function(directory, *args, **kwargs)
+        and keeps its file. Returns what the export function would.
+        """
+        if self.get(key, directory):
+            return directory
+        result = export_function(directory, *args, **kwargs)
+        if result is not None:
+            self.put(key, directory)
+        return result
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_export_cache(filename=None):
+    """
+    Returns the ExportCache set up in the [export_cache] section of the
+    configuration file (connection_pool.CONFIGURATION_FILE by default),
+    or None if it is not enabled.
+    """
+    global _cache
+    if filename is None:
+        filename = connection_pool.CONFIGURATION_FILE
+    settings = get_cached_configuration(filename=filename, section="export_cache",
+                                        defaults=DEFAULT_EXPORT_CACHE_SETTINGS)
+    if settings["enabled"].lower() not in ("yes", "true", "on", "1"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExportCache(settings["directory"],
+                                 int(float(settings["max_size_mb"]) * 2 ** 20))
+        return _cache
+
+
+def with_export_cache(export_function, file_format, engine=None):
+    """
+    Returns export_function (one of the get_attendees_list_format_*
+    functions of backend.py) with the export cache in front of it:
+    the file is created only if the guest list changed since the
+    last export to that format. The guest list is the one of the given
+    storage engine (the configured one by default, see storage.get_engine);
+    the attendees argument, if given, has to be that engine's whole list.
+    """
+    @functools.wraps(export_function)
+    def export(directory, streaming=False, progress_callback=None, attendees=None):
+        cache = get_export_cache()
+        exported_engine = engine or get_engine()
+        version = exported_engine.table_version() if cache is not None else None
+        if version is None:
+            return export_function(directory, streaming, progress_callback,
+                                   attendees=attendees)
+        key = f"{exported_engine.name}-{version}.{file_format}"
+        return cache.export(export_function, key, directory, streaming,
+                            progress_callback, attendees=attendees)
+    return export
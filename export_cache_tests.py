@@ -0,0 +1,117 @@
+import os
+import shutil
+import time
+import unittest
+
+import export_cache
+from backend import get_attendees_list_format_csv
+from export_cache import ExportCache, get_export_cache, with_export_cache
+from storage import MemoryEngine, set_engine
+
+CACHE_DIRECTORY = 'test_export_cache'
+
+test_attendee_data = ['Hermenegildo', 'Cachedname', 'New York',
+                      'Testers', 'jd@testers.com', '123456789']
+
+
+def write_file(filename, content):
+    with open(filename, 'w') as output:
+        output.write(content)
+
+
+def read_file(filename):
+    with open(filename) as input_file:
+        return input_file.read()
+
+
+class ExportCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = ExportCache(CACHE_DIRECTORY, max_bytes=10)
+
+    def tearDown(self):
+        shutil.rmtree(CACHE_DIRECTORY)
+        for filename in ('test_export.txt', 'test_copy.txt'):
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+    def test_get_and_put(self):
+        """Checks if a kept file is copied to the destination."""
+        self.assertFalse(self.cache.get('a.txt', 'test_copy.txt'))
+        write_file('test_export.txt', 'abc')
+        self.cache.put('a.txt', 'test_export.txt')
+        self.assertTrue(self.cache.get('a.txt', 'test_copy.txt'))
+        self.assertEqual(read_file('test_copy.txt'), 'abc')
+
+    def test_least_recently_used_evicted(self):
+        """Checks if the least recently used files go when over the size limit."""
+        write_file('test_export.txt', 'abcd')
+        for key in ('a.txt', 'b.txt'):
+            self.cache.put(key, 'test_export.txt')
+            time.sleep(0.01)
+        self.cache.get('a.txt', 'test_copy.txt')
+        time.sleep(0.01)
+        self.cache.put('c.txt', 'test_export.txt')
+        self.assertEqual(sorted(os.listdir(CACHE_DIRECTORY)), ['a.txt', 'c.txt'])
+
+    def test_export_runs_once(self):
+        """Checks if the export function runs only when the file is not kept."""
+        calls = []
+
+        def export(directory):
+            calls.append(directory)
+            write_file(directory, 'abc')
+            return directory
+        for _ in range(2):
+            self.assertEqual(self.cache.export(export, 'a.txt', 'test_export.txt'),
+                             'test_export.txt')
+        self.assertEqual(calls, ['test_export.txt'])
+        self.assertEqual(read_file('test_export.txt'), 'abc')
+
+
+class WithExportCacheTests(unittest.TestCase):
+    def setUp(self):
+        if get_export_cache() is None:
+            self.skipTest('the export cache is not enabled')
+        self.previous_cache = export_cache._cache
+        export_cache._cache = ExportCache(CACHE_DIRECTORY, max_bytes=2 ** 20)
+        self.engine = MemoryEngine()
+        self.previous_engine = set_engine(self.engine)
+
+    def tearDown(self):
+        set_engine(self.previous_engine)
+        self.engine.close()
+        export_cache._cache = self.previous_cache
+        shutil.rmtree(CACHE_DIRECTORY)
+        if os.path.exists('test_export.csv'):
+            os.unlink('test_export.csv')
+
+    def test_new_file_after_change(self):
+        """
+        Checks if an export of an unchanged guest list is served from
+        the cache and a changed one is exported again.
+        """
+        export = with_export_cache(get_attendees_list_format_csv, 'csv')
+        self.engine.store_attendee_data(test_attendee_data)
+        export('test_export.csv', True, attendees=self.engine.iterate_all_attendees())
+        self.assertEqual(len(os.listdir(CACHE_DIRECTORY)), 1)
+        export('test_export.csv', True, attendees=self.engine.iterate_all_attendees())
+        self.assertEqual(len(os.listdir(CACHE_DIRECTORY)), 1)
+
+        self.engine.store_attendee_data(['Anna'] + test_attendee_data[1:])
+        export('test_export.csv', True, attendees=self.engine.iterate_all_attendees())
+        self.assertEqual(len(os.listdir(CACHE_DIRECTORY)), 2)
+        self.assertIn('Anna', read_file('test_export.csv'))
+
+    def test_cached_by_the_given_engine(self):
+        """Checks if the file is kept by the version of the given engine's list."""
+        other_engine = MemoryEngine()
+        export = with_export_cache(get_attendees_list_format_csv, 'csv', other_engine)
+        try:
+            other_engine.store_attendee_data(test_attendee_data)
+            export('test_export.csv', True, attendees=other_engine.iterate_all_attendees())
+            other_engine.store_attendee_data(['Anna'] + test_attendee_data[1:])
+            export('test_export.csv', True, attendees=other_engine.iterate_all_attendees())
+        finally:
+            other_engine.close()
+        self.assertEqual(len(os.listdir(CACHE_DIRECTORY)), 2)
+        self.assertIn('Anna', read_file('test_export.csv'))
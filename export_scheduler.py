@@ -0,0 +1,160 @@
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from backend import (
+    get_attendees_list_format_csv,
+    get_attendees_list_format_docx,
+    get_attendees_list_format_parquet,
+    get_attendees_list_format_xlsx,
+    remove_unfinished_file,
+)
+from dedup import normalize_name
+from storage import get_engine
+
+# File formats the jobs can be rendered to: format -> export function
+RENDERERS = {
+    "docx": get_attendees_list_format_docx,
+    "xlsx": get_attendees_list_format_xlsx,
+    "csv": get_attendees_list_format_csv,
+    "parquet": get_attendees_list_format_parquet,
+}
+
+# Columns the guest list can be split by; None keeps it whole
+PARTITION_COLUMNS = (None, "company", "city")
+
+# Part of the file name of the attendees with no company (or city)
+UNKNOWN_PARTITION = "unknown"
+
+DEFAULT_FILE_PREFIX = "attendees"
+
+# One export: the file format and the column the guest list is split by
+ExportJob = namedtuple("ExportJob", ("file_format", "partition_by"))
+
+# Result of one file of a job: the number of attendees in it, the seconds
+# it took to render and the error message if it failed (no file is left then)
+JobResult = namedtuple(
+    "JobResult", ("file_format", "partition_by", "partition", "path", "rows",
+                  "seconds", "error"))
+
+# Result of run_export_jobs: the JobResults, the seconds it took to read
+# the guest list and the seconds it took altogether
+ExportReport = namedtuple("ExportReport", ("jobs", "read_seconds", "seconds"))
+
+
+def make_jobs(file_formats, partition_columns=(None,)):
+    """
+    Takes in a list of file formats and a list of partition columns
+    (None for the whole list). Returns a list of ExportJobs, one for
+    every pair. Raises ValueError for unknown formats or columns.
+    """
+    unknown = ([file_format for file_format in file_formats if file_format not in RENDERERS]
+               + [column for column in partition_columns if column not in PARTITION_COLUMNS])
+    if unknown:
+        raise ValueError(f"unknown export formats or partitions: {unknown}")
+    return [ExportJob(file_format, partition_by)
+            for partition_by in partition_columns for file_format in file_formats]
+
+
+def partition_name(value):
+    """
+    Returns the part of a file name for a company or a city: the value
+    normalized the way dedup.normalize_name does, with underscores for
+    spaces, so 'ACME Inc.' and 'Acme inc' end up in one file.
+    """
+    return normalize_name(value).replace(" ", "_") or UNKNOWN_PARTITION
+
+
+def read_partitions(attendees, partition_columns):
+    """
+    Takes in an iterable of Attendee records and the partition columns
+    of the jobs. Reads the attendees once and splits them for every
+    column. Returns a dictionary: column -> {partition name -> list of
+    attendees}; the whole list is under None -> {'': list}.
+    """
+    partitions = {column: {} for column in partition_columns}
+    everyone = []
+    for attendee in attendees:
+        everyone.append(attendee)
+        for column, parts in partitions.items():
+            if column is not None:
+                name = partition_name(getattr(attendee, column))
+                parts.setdefault(name, []).append(attendee)
+    if None in partitions:
+        partitions[None] = {"": everyone}
+    return partitions
+
+
+def export_file_name(prefix, job, partition):
+    """Returns the name of the file of one partition of the job."""
+    if job.partition_by is None:
+        return f"{prefix}.{job.file_format}"
+    return f"{prefix}-{job.partition_by}-{partition}.{job.file_format}"
+
+
+def render_export(file_format, attendees, path):
+    """
+    Runs in a worker process. Writes the attendees to a temporary file
+    next to path with the export function of the format, then moves
+    it to path, so path is either the complete file or not there.
+    Returns the seconds it took.
+    """
+    start = time.perf_counter()
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        RENDERERS[file_format](temporary, streaming=True, attendees=attendees)
+        os.replace(temporary, path)
+    except BaseException:
+        remove_unfinished_file(temporary)
+        raise
+    return time.perf_counter() - start
+
+
+def run_export_jobs(jobs, directory, prefix=DEFAULT_FILE_PREFIX, attendees=None,
+                    workers=None):
+    """
+    Takes in a list of ExportJobs and the directory for the files.
+    Reads the guest list once (by default from the storage engine, or
+    the given iterable of Attendee records) and renders every partition
+    of every job in parallel on a pool of workers processes (one per
+    CPU by default). A failed file is reported in its JobResult and does
+    not stop the others. Returns an ExportReport.
+
+    The guest list is kept in memory while the files are rendered, and
+    every worker gets a copy of the attendees of the files it renders.
+    """
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    if attendees is None:
+        attendees = get_engine().iterate_all_attendees()
+    partitions = read_partitions(attendees, {job.partition_by for job in jobs})
+    read_seconds = time.perf_counter() - start
+
+    results = []
+    # Workers are started fresh instead of forked, as the jobs may be
+    # run from a thread of the app (see gui_workers.BackgroundRunner)
+    context = multiprocessing.get_context("spawn")
+    tasks = [(job, partition, partition_attendees)
+             for job in jobs
+             for partition, partition_attendees in sorted(partitions[job.partition_by].items())]
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        # The largest files are started first, so that a big one
+        # is not left for the end with the other workers idle
+        futures = {}
+        for job, partition, partition_attendees in sorted(
+                tasks, key=lambda task: len(task[2]), reverse=True):
+            path = os.path.join(directory, export_file_name(prefix, job, partition))
+            futures[job, partition] = path, pool.submit(
+                render_export, job.file_format, partition_attendees, path)
+        for job, partition, partition_attendees in tasks:
+            path, future = futures[job, partition]
+            rows = len(partition_attendees)
+            try:
+                seconds, error = future.result(), None
+            except Exception as exception:
+                seconds, error = None, str(exception) or type(exception).__name__
+            results.append(JobResult(job.file_format, job.partition_by, partition, path,
+                                     rows, seconds, error))
+    return ExportReport(results, read_seconds, time.perf_counter() - start)
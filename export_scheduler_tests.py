@@ -0,0 +1,81 @@
+import csv
+import os
+import shutil
+import unittest
+
+import docx
+import pandas as pd
+
+from export_scheduler import make_jobs, partition_name, read_partitions, run_export_jobs
+from storage import MemoryEngine
+
+EXPORT_DIRECTORY = 'test_export_jobs'
+
+test_attendees_data = [
+    ['Hermenegildo', 'Jobname', 'New York', 'ACME Inc.', 'jd@acme.com', '123456789'],
+    ['Anna', 'Jobname', 'Boston', 'Acme inc', 'anna@acme.com', '123456780'],
+    ['Bob', 'Jobname', 'New York', '', 'bob@nowhere.com', '123456781'],
+]
+
+
+def read_csv(filename):
+    with open(filename, newline='') as csv_file:
+        return list(csv.reader(csv_file))
+
+
+class ExportSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = MemoryEngine()
+        for attendee_data in test_attendees_data:
+            self.engine.store_attendee_data(attendee_data)
+
+    def tearDown(self):
+        self.engine.close()
+        shutil.rmtree(EXPORT_DIRECTORY, ignore_errors=True)
+
+    def test_read_partitions(self):
+        """Checks if the attendees are read once and split by every column."""
+        partitions = read_partitions(self.engine.iterate_all_attendees(),
+                                     {None, 'company', 'city'})
+        self.assertEqual(len(partitions[None]['']), 3)
+        self.assertEqual({name: [attendee.first_name for attendee in attendees]
+                          for name, attendees in partitions['company'].items()},
+                         {'acme_inc': ['Hermenegildo', 'Anna'], 'unknown': ['Bob']})
+        self.assertEqual(sorted(partitions['city']), ['boston', 'new_york'])
+        self.assertEqual(partition_name(None), 'unknown')
+
+    def test_make_jobs(self):
+        """Checks if a job is made for every format and partition, and nothing unknown."""
+        self.assertEqual(len(make_jobs(['docx', 'csv'], [None, 'city'])), 4)
+        with self.assertRaises(ValueError):
+            make_jobs(['pdf'])
+        with self.assertRaises(ValueError):
+            make_jobs(['csv'], ['email'])
+
+    def test_run_export_jobs(self):
+        """
+        Checks if every partition of every job is rendered to its own
+        complete file, with its timing, and no temporary file is left.
+        """
+        report = run_export_jobs(make_jobs(['docx', 'xlsx', 'csv'], [None, 'company']),
+                                 EXPORT_DIRECTORY, attendees=self.engine.iterate_all_attendees(),
+                                 workers=2)
+        self.assertEqual(len(report.jobs), 9)
+        self.assertTrue(all(result.error is None and result.seconds >= 0
+                            for result in report.jobs))
+        self.assertEqual(sorted(os.listdir(EXPORT_DIRECTORY)), sorted(
+            f'attendees{part}.{file_format}'
+            for part in ('', '-company-acme_inc', '-company-unknown')
+            for file_format in ('docx', 'xlsx', 'csv')))
+
+        rows = read_csv(os.path.join(EXPORT_DIRECTORY, 'attendees-company-acme_inc.csv'))
+        self.assertEqual([row[1] for row in rows[1:]], ['Hermenegildo', 'Anna'])
+        document = docx.Document(os.path.join(EXPORT_DIRECTORY, 'attendees.docx'))
+        self.assertEqual(len(document.paragraphs), 3)
+        xlsx_file_check = pd.read_excel(
+            os.path.join(EXPORT_DIRECTORY, 'attendees-company-unknown.xlsx'))
+        self.assertEqual(list(xlsx_file_check['first name']), ['Bob'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,59 +1,155 @@
+import functools
 import re
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtWidgets import (
+    QDialog,
     QWidget,
     QGridLayout,
     QPushButton,
     QInputDialog,
     QMessageBox,
     QFileDialog,
-    QLineEdit,
+    QProgressDialog,
 )
 
+from attendee_cache import start_attendee_cache
 from backend import (
     create_text_version_list_of_all_attendees,
+    get_attendees_list_format_csv,
     get_attendees_list_format_docx,
+    get_attendees_list_format_parquet,
     get_attendees_list_format_xlsx,
-    get_list_all_attendees,
-    get_matching_attendees,
-    remove_attendee,
-    store_attendee_data_in_postgresql
 )
+from connection_pool import get_pool
+from dedup import find_possible_duplicates
+from export_cache import with_export_cache
+from export_scheduler import make_jobs, run_export_jobs
+from gui_attendee_picker import AttendeePickerDialog
+from gui_check_in import CheckInDialog
+from gui_live_search import LiveSearchDialog
+from gui_workers import BackgroundRunner
+from storage import get_engine
+from write_behind import (
+    queue_attendee,
+    start_write_behind,
+    stop_write_behind,
+    write_behind_status,
+)
+
+# Attendees listed by name in the message after a deletion
+MAX_ATTENDEES_SHOWN = 10
+
+WINDOW_TITLE = "CA System"
+
+# File formats the guest list can be exported to:
+# name shown to the user -> (export function, file extension)
+EXPORT_FORMATS = {
+    "Word Document": (with_export_cache(get_attendees_list_format_docx, "docx"), ".docx"),
+    "Excel Document": (with_export_cache(get_attendees_list_format_xlsx, "xlsx"), ".xlsx"),
+    "CSV File": (with_export_cache(get_attendees_list_format_csv, "csv"), ".csv"),
+    "Parquet File": (
+        with_export_cache(get_attendees_list_format_parquet, "parquet"), ".parquet"),
+}
+# Choice next to EXPORT_FORMATS that saves the list in all of these formats,
+# whole and split per company and per city (see export_scheduler.py)
+EXPORT_JOBS_CHOICE = "All formats, per company and city"
+EXPORT_JOBS = make_jobs(("docx", "xlsx", "csv"), (None, "company", "city"))
+
+# Milliseconds between updates of the write-behind backlog in the title
+BACKLOG_REFRESH_INTERVAL = 2000
 
 
 class GUIMenu(QWidget):
     """
-    Main window for the app. It has 4 functions:
+    Main window for the app. It has 5 functions:
     -add an attendee based on users input
     -get info about an attendee based on a part of their name
     -export a word or excel file with the list
-    -delete an attendee from the list.
+    -delete an attendee from the list
+    -check attendees in at the event.
+    Database operations run in the background (see gui_workers.py),
+    so the window keeps responding while they are in progress.
     """
     def __init__(self):
         super().__init__()
+        self.background = BackgroundRunner()
+        self.engine = get_engine()
         self.initialize_user_interface()
+        # Connecting to the database waits until the window is shown
+        QTimer.singleShot(0, self.warm_up)
+
+    def warm_up(self):
+        """
+        Opens the pooled database connections in the background
+        and starts the attendee cache, so the first operation
+        does not have to wait for them. Only needed when the attendees
+        are kept in PostgreSQL (see storage.py).
+        """
+        if self.engine.name != "postgresql":
+            return
+        self.background.run(get_pool, on_error=self.background_operation_show_error)
+        start_attendee_cache()
+        if start_write_behind():
+            self.backlog_timer = QTimer(self)
+            self.backlog_timer.timeout.connect(self.show_write_behind_backlog)
+            self.backlog_timer.start(BACKLOG_REFRESH_INTERVAL)
+
+    def show_write_behind_backlog(self):
+        """
+        Shows in the window title how many added attendees are still
+        waiting to be saved in the database, and how many the database
+        refused (see write_behind.py).
+        """
+        status = write_behind_status()
+        if not status or not (status["pending"] or status["rejected"]):
+            self.setWindowTitle(WINDOW_TITLE)
+            return
+        title = f"{WINDOW_TITLE} - {status['pending']} waiting to be saved"
+        if status["last_error"]:
+            title += f", retrying in {status['retry_in']:.0f} s"
+        if status["rejected"]:
+            title += f", {status['rejected']} rejected"
+        self.setWindowTitle(title)
+
+    def closeEvent(self, event):
+        """Stops the running exports and waits for the background operations."""
+        for worker in list(self.background.workers):
+            worker.cancel()
+        self.background.wait_for_all()
+        stop_write_behind()
+        event.accept()
+
+    def background_operation_show_error(self, error):
+        """Shows a message when an operation running in the background failed."""
+        QMessageBox.warning(
+            self, "Error", f"The operation failed:\n{error}", QMessageBox.Ok
+        )
 
     def initialize_user_interface(self):
         """
         Initializes the GUI."""
         grid = QGridLayout()
-        positions = [(i, j) for i in range(1, 3) for j in range(1, 3)]
+        positions = [(i, j) for i in range(1, 4) for j in range(1, 3)]
         names = [
             "Add an attendee",
             "Delete an attendee",
             "Get info on an attendee",
             "Get full list",
+            "Check-in",
         ]
         functions = [
             self.add_attendee_dialog,
             self.remove_attendee_dialog,
             self.get_attendee_info_dialog,
-            self.get_attendees_list_file_dialog
+            self.get_attendees_list_file_dialog,
+            self.check_in_dialog,
         ]
         tooltips = [
             "Adds an attendee based on your input",
-            "Deletes an attendee chosen from the list",
+            "Deletes the attendees chosen from the list",
             "Provides more information about an attendee based on your input",
-            "Exports a list of attendees in xlsx or docx format",
+            "Exports a list of attendees in docx, xlsx, csv or parquet format",
+            "Checks attendees in by id, email or scanned badge code",
         ]
 
         for position, name, function, tooltip in zip(
@@ -68,7 +164,7 @@ class GUIMenu(QWidget):
 
         self.setLayout(grid)
         self.setGeometry(200, 200, 200, 200)
-        self.setWindowTitle("CA System")
+        self.setWindowTitle(WINDOW_TITLE)
         self.show()
 
     def get_attendee_data_dialog(self, query_list):
@@ -124,69 +220,138 @@ class GUIMenu(QWidget):
         attendee_data = self.get_attendee_data_dialog(query_list)
         user_response = self.user_confirm_attendee_data_is_correct(attendee_data)
 
-        # If the data is correct, store it into PostgreSQL database
-        # and inform about the results
+        # If the data is correct, look for the same person on the list first
         if user_response == QMessageBox.Yes:
-            store_attendee_data_in_postgresql(attendee_data)
-            QMessageBox.information(
-                self, "Continue", "Attendee created", QMessageBox.Ok
+            self.background.run(
+                find_possible_duplicates, attendee_data, self.engine,
+                on_result=lambda duplicates: self.store_attendee_unless_duplicate(
+                    attendee_data, duplicates),
+                on_error=lambda _error: self.store_attendee(attendee_data),
             )
         else:
             QMessageBox.information(
                 self, "Interrupted", "Operation interrupted!", QMessageBox.Ok
             )
 
-    def user_choice_attendee_to_delete(self, attendee_list):
+    def store_attendee_unless_duplicate(self, attendee_data, duplicates):
+        """
+        Takes in a list with the attendee's data and the attendees that look
+        like the same person. Asks the user whether to add the attendee anyway
+        if there are any, then stores it.
+        """
+        if duplicates:
+            listed = "".join(
+                f"\n\t{attendee.guest_id}: {attendee.first_name} {attendee.last_name},"
+                f" {attendee.company}, {attendee.email} (same {reason})"
+                for attendee, reason in duplicates[:MAX_ATTENDEES_SHOWN])
+            message_reply = QMessageBox.question(
+                self,
+                "Possible duplicate",
+                f"This attendee may already be on the guest list:{listed}"
+                "\nDo you want to add them anyway?",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No,
+            )
+            if message_reply != QMessageBox.Yes:
+                QMessageBox.information(
+                    self, "Interrupted", "Operation interrupted!", QMessageBox.Ok
+                )
+                return
+        self.store_attendee(attendee_data)
+
+    def store_attendee(self, attendee_data):
+        """
+        Stores the attendee's data into PostgreSQL database (through
+        the write-behind journal, if it is enabled) and informs about the results.
+        """
+        self.background.run(
+            queue_attendee if self.engine.name == "postgresql"
+            else self.engine.store_attendee_data,
+            attendee_data,
+            on_result=self.attendee_created_show_information,
+            on_error=self.background_operation_show_error,
+        )
+
+    def attendee_created_show_information(self, _=None):
+        """Informs the user that the attendee was saved."""
+        QMessageBox.information(
+            self, "Continue", "Attendee created", QMessageBox.Ok
+        )
+
+    def user_choice_attendees_to_delete(self):
+        """
+        Shows a dialog with the list of attendees, read from the database
+        page by page while the user scrolls. User needs to choose which
+        attendees to delete (Ctrl or Shift selects more than one). Returns
+        a list of the chosen attendees' data tuples and confirmation that
+        'ok' was pressed.
+        """
+        dialog = AttendeePickerDialog("Delete attendees", self, multiple=True,
+                                      background=self.background)
+        ok_pressed = dialog.exec_() == QDialog.Accepted
+        return dialog.selected_attendees(), ok_pressed
+
+    def user_confirm_deletion(self, attendees_to_delete):
         """
-        Based on a list of attendee's provided shows a dialog to the user.
-        User needs to choose which attendee to delete. Returns the attendee
-        that is to be deleted and confirmation that 'ok' was pressed.
+        Asks the user to confirm deleting more than one attendee.
+        Returns True if the deletion should go on.
         """
-        attendee_to_delete, ok_pressed = QInputDialog.getItem(
+        if len(attendees_to_delete) == 1:
+            return True
+        message_reply = QMessageBox.question(
             self,
-            "Delete attendee",
-            "Which attendee do you want" "\nto remove from the list?",
-            attendee_list,
-            0,
-            False,
+            "Confirmation",
+            f"Do you want to delete {len(attendees_to_delete)} attendees?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
         )
-        return attendee_to_delete, ok_pressed
+        return message_reply == QMessageBox.Yes
 
-    def deletion_successful_show_information(self, who_deleted):
+    def deletion_successful_show_information(self, deleted_attendees):
         """
-        Takes in a string of information about who was deleted from the database
-        and shows a communicate to the user.
+        Takes in a list of tuples with the data of the attendees deleted
+        from the database and shows a communicate to the user.
         """
+        if not deleted_attendees:
+            return
+        who_deleted = create_text_version_list_of_all_attendees(
+            deleted_attendees[:MAX_ATTENDEES_SHOWN])
+        if len(deleted_attendees) > MAX_ATTENDEES_SHOWN:
+            who_deleted.append(
+                f"and {len(deleted_attendees) - MAX_ATTENDEES_SHOWN} more")
         QMessageBox.information(
             self,
             "Continue",
-            f"Attendee:\n{who_deleted}\nis now deleted",
+            "Attendee{}:\n{}\n{} now deleted".format(
+                "s" if len(deleted_attendees) > 1 else "",
+                "\n".join(who_deleted),
+                "are" if len(deleted_attendees) > 1 else "is",
+            ),
             QMessageBox.Ok,
         )
 
     def remove_attendee_dialog(self):
         """
-        Presents a dialog to the user. The user can choose which user
-        should be deleted.
+        Presents a dialog to the user. The user can choose which attendees
+        should be deleted. They are all deleted with a single statement.
         """
-        list_of_all_attendees = get_list_all_attendees()
-
-        text_version_list_of_all_attendees = \
-            create_text_version_list_of_all_attendees(list_of_all_attendees)
-
-        attendee_to_delete, ok_pressed = \
-            self.user_choice_attendee_to_delete(text_version_list_of_all_attendees)
+        attendees_to_delete, ok_pressed = self.user_choice_attendees_to_delete()
 
-        if ok_pressed and attendee_to_delete:
-            remove_attendee(re.search(r"\d+", attendee_to_delete).group())
-            self.deletion_successful_show_information(attendee_to_delete)
+        if ok_pressed and attendees_to_delete \
+                and self.user_confirm_deletion(attendees_to_delete):
+            self.background.run(
+                self.engine.remove_attendees,
+                [attendee.guest_id for attendee in attendees_to_delete],
+                on_result=self.deletion_successful_show_information,
+                on_error=self.background_operation_show_error,
+            )
 
     def user_choice_attendees_list_file_format(self):
         """
         Presents a dialog to the user. The user can choose which file format
         is preferred. Returns the choice and confirmation.
         """
-        available_formats = ("Word Document", "Excel Document")
+        available_formats = tuple(EXPORT_FORMATS) + (EXPORT_JOBS_CHOICE,)
         chosen_format, okPressed = QInputDialog.getItem(
             self, "File Format", "Format:", available_formats, 0, False
         )
@@ -199,17 +364,75 @@ class GUIMenu(QWidget):
         """
         chosen_format, confirmation = self.user_choice_attendees_list_file_format()
 
-        if confirmation and chosen_format:
-            if chosen_format == "Word Document":
-                directory = get_attendees_list_format_docx(
-                        self.get_attendees_list_save_file())
-                if directory:
-                    self.get_attendees_list_show_success(directory)
-            elif chosen_format == "Excel Document":
-                directory = get_attendees_list_format_xlsx(
-                        self.get_attendees_list_save_file(".xlsx"))
-                if directory:
-                    self.get_attendees_list_show_success(directory)
+        if confirmation and chosen_format == EXPORT_JOBS_CHOICE:
+            self.run_export_jobs(QFileDialog.getExistingDirectory(
+                self, "Where do you want to save the files?"))
+        elif confirmation and chosen_format:
+            export_function, extension = EXPORT_FORMATS[chosen_format]
+            self.export_attendees_list(
+                    export_function, self.get_attendees_list_save_file(extension))
+
+    def export_attendees_list(self, export_function, directory):
+        """
+        Runs the streaming export of the attendee's list to the directory
+        in the background. Shows its progress in a dialog where the user
+        can cancel it, and a success message once the file is ready.
+        """
+        if not directory:
+            return
+
+        progress_dialog = QProgressDialog(
+            "Exporting the guest list...", "Cancel", 0, 0, self)
+        progress_dialog.setWindowTitle("Exporting")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+
+        worker = self.background.run(
+            functools.partial(export_function,
+                              attendees=self.engine.attendees_to_export()),
+            directory,
+            True,
+            on_result=self.get_attendees_list_show_success,
+            on_error=self.background_operation_show_error,
+            report_progress=True,
+        )
+        worker.signals.progress.connect(
+            lambda done: progress_dialog.setLabelText(f"{done} attendees exported..."))
+        worker.signals.cancelled.connect(self.export_cancelled_show_information)
+        worker.signals.finished.connect(progress_dialog.reset)
+        progress_dialog.canceled.connect(worker.cancel)
+
+    def run_export_jobs(self, directory):
+        """
+        Saves the attendee's list in every format of EXPORT_JOBS to the
+        directory in the background, rendering the files in parallel.
+        Shows how long it took once the files are ready.
+        """
+        if not directory:
+            return
+        self.background.run(
+            functools.partial(run_export_jobs,
+                              attendees=self.engine.iterate_all_attendees()),
+            EXPORT_JOBS,
+            directory,
+            on_result=lambda report: self.export_jobs_show_report(directory, report),
+            on_error=self.background_operation_show_error,
+        )
+
+    def export_jobs_show_report(self, directory, report):
+        """Shows how many files were saved and the ones that failed."""
+        failed = [result for result in report.jobs if result.error is not None]
+        text = (f"{len(report.jobs) - len(failed)} files exported to:\n{directory}"
+                f"\nin {report.seconds:.1f} s")
+        for result in failed[:MAX_ATTENDEES_SHOWN]:
+            text += f"\nFailed: {result.path}: {result.error}"
+        QMessageBox.information(self, "Lists ready", text, QMessageBox.Ok)
+
+    def export_cancelled_show_information(self):
+        """Informs the user that the export was stopped and no file was saved."""
+        QMessageBox.information(
+            self, "Interrupted", "Export cancelled, no file was saved.", QMessageBox.Ok
+        )
 
     def get_attendees_list_save_file(self, format_=".docx"):
         """
@@ -222,7 +445,7 @@ class GUIMenu(QWidget):
             self,
             "Where do you want to save your file?",
             "",
-            f"Microsoft Office {format_} Files (*{format_});;All Files (*)",
+            f"{format_[1:].upper()} Files (*{format_});;All Files (*)",
             options=options,
         )
         # Check if correct file format_ is about to be created,
@@ -255,65 +478,18 @@ class GUIMenu(QWidget):
             QMessageBox.Ok,
         )
 
-    def user_input_attendees_name(self):
-        """Presents a dialog to a user. Returns the text input."""
-        user_input, _ = QInputDialog.getText(
-            self,
-            "Attendee info",
-            "Provide attendee's name (or its part)",
-            QLineEdit.Normal,
-            "",
-        )
-        return user_input
+    def check_in_dialog(self):
+        """Opens the check-in desk; it needs the attendees kept in PostgreSQL."""
+        if self.engine.name != "postgresql":
+            QMessageBox.information(
+                self, "Check-in", "Check-in needs the attendees kept in PostgreSQL.",
+                QMessageBox.Ok)
+            return
+        CheckInDialog(self, self.background).exec_()
 
     def get_attendee_info_dialog(self):
         """
-        Based on user's input (name and/or last name required)
-        returns complete information about an attendee.
-        """
-        user_input = self.user_input_attendees_name()
-        user_input = "%" + user_input + "%"
-
-        if user_input != "%%":
-            matching_attendees_list = get_matching_attendees(user_input)
-            if len(matching_attendees_list) >= 7:
-                self.too_many_matching_results_show_info()
-                self.get_attendee_info_dialog()
-            else:
-                self.get_attendee_info_present(matching_attendees_list)
-
-    def too_many_matching_results_show_info(self):
-        """
-        Shows an information message when
-        too many matching attendees were found.
+        Opens the live search, which shows complete information
+        about the attendees whose name contains the typed text.
         """
-        QMessageBox.information(
-            self,
-            "Try again",
-            "There are too many matching results!"
-            "\n\nTry more specified search :)"
-            * 500,
-            QMessageBox.Ok,
-        )
-
-    def get_attendee_info_present(self, matching_attendees_list):
-        """
-        Takes in a list of matching attendees, converts it to a string
-        format, presents it in an information window.
-        """
-        text = []
-        for attribute in matching_attendees_list:
-            text += [
-                f"id {attribute[0]}:"
-                f"\n\t{attribute[1]} {attribute[2]} from {attribute[3]}"
-                f"\n\tWorking at {attribute[4]},"
-                f"\n\temail: {attribute[5]},"
-                f"\n\tnumber: {attribute[6]}\n\n"
-            ]
-        if not text:
-            text_ready = "No matching results found. Try again!"
-        else:
-            text_ready = ''.join(text)
-        QMessageBox.information(self,
-                                "Matching attendees",
-                                f"{text_ready}", QMessageBox.Ok)
+        LiveSearchDialog(self, self.background).exec_()
@@ -0,0 +1,192 @@
+from functools import partial
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt, QTimer, pyqtSignal
+from PyQt5.QtWidgets import (
+    QAbstractItemView,
+    QDialog,
+    QDialogButtonBox,
+    QLabel,
+    QLineEdit,
+    QListView,
+    QVBoxLayout,
+)
+
+from backend import PAGE_SIZE, create_text_version_list_of_all_attendees
+from gui_workers import BackgroundRunner
+from storage import get_engine
+
+# Milliseconds to wait after the last key press before filtering the list
+FILTER_DELAY = 300
+
+# Columns read for the list, just enough to present an attendee
+# (see backend.create_text_version_list_of_all_attendees)
+PICKER_COLUMNS = ("guest_id", "first_name", "last_name", "city", "company")
+
+
+class LazyAttendeeListModel(QAbstractListModel):
+    """
+    List of attendees for Qt views that is read from the storage engine
+    one page at a time (see backend.get_attendees_page). A view asks
+    for the next page only when the user scrolls to the end of the
+    loaded ones, and an attendee's text is created only when the view
+    shows it. Only the given columns of guestlist are read.
+    Pages are read in the background (see gui_workers.BackgroundRunner)
+    and their rows are inserted when they arrive, so a slow database
+    does not freeze the window. When a page cannot be read, page_failed
+    is emitted with the error and the next scroll tries again.
+    """
+    page_failed = pyqtSignal(str)
+
+    def __init__(self, page_size=PAGE_SIZE, parent=None, columns=PICKER_COLUMNS,
+                 background=None):
+        super().__init__(parent)
+        self.page_size = page_size
+        self.columns = columns
+        self.background = background or BackgroundRunner()
+        self.name_filter = None
+        # Increased whenever the pages are forgotten, so that a page
+        # still being read for the old filter is thrown away
+        self._generation = 0
+        self.reset_pages()
+
+    def reset_pages(self):
+        """Forgets the loaded pages."""
+        self._generation += 1
+        self._attendees = []
+        self._texts = []
+        self._all_fetched = False
+        self._fetching = False
+
+    def set_name_filter(self, name_filter):
+        """Shows only the attendees whose full name contains name_filter."""
+        self.beginResetModel()
+        self.name_filter = name_filter or None
+        self.reset_pages()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._attendees)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            if self._texts[row] is None:
+                self._texts[row] = create_text_version_list_of_all_attendees(
+                    [self._attendees[row]])[0]
+            return self._texts[row]
+        if role == Qt.UserRole:
+            return self._attendees[row].guest_id
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._all_fetched and not self._fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._fetching:
+            return
+        self._fetching = True
+        generation = self._generation
+        last_guest_id = self._attendees[-1].guest_id if self._attendees else 0
+        self.background.run(
+            partial(get_engine().get_attendees_page, columns=self.columns),
+            last_guest_id, self.page_size, self.name_filter,
+            on_result=lambda page: self.add_page(generation, page),
+            on_error=lambda error: self.page_not_read(generation, error))
+
+    def add_page(self, generation, page):
+        """
+        Runs in the GUI thread when a page has been read (None if it
+        could not be, see backend.base_query). Inserts its rows, unless
+        the pages have been forgotten since it was asked for.
+        """
+        if page is None:
+            self.page_not_read(generation, "database error")
+            return
+        if generation != self._generation:
+            return
+        self._fetching = False
+        if len(page) < self.page_size:
+            self._all_fetched = True
+        if not page:
+            return
+
+        first_row = len(self._attendees)
+        self.beginInsertRows(QModelIndex(), first_row, first_row + len(page) - 1)
+        self._attendees += page
+        self._texts += [None] * len(page)
+        self.endInsertRows()
+
+    def page_not_read(self, generation, error):
+        """
+        Runs in the GUI thread when a page could not be read. Lets the
+        view ask for it again (see canFetchMore) and emits page_failed.
+        """
+        if generation != self._generation:
+            return
+        self._fetching = False
+        self.page_failed.emit(str(error))
+
+    def attendee(self, row):
+        """Returns the record with the data of the attendee in the given row."""
+        return self._attendees[row]
+
+
+class AttendeePickerDialog(QDialog):
+    """
+    Dialog with a filterable list of all attendees. The list is read
+    from the database page by page while the user scrolls through it.
+    With multiple=True more than one attendee can be selected. The pages
+    are read with the given BackgroundRunner (a new one by default).
+    """
+    def __init__(self, title, parent=None, multiple=False, background=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+
+        self.model = LazyAttendeeListModel(parent=self, background=background)
+        self.filter_line = QLineEdit()
+        self.filter_line.setPlaceholderText("Filter by name")
+        self.list_view = QListView()
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setModel(self.model)
+        if multiple:
+            self.list_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_DELAY)
+        self.filter_timer.timeout.connect(
+            lambda: self.model.set_name_filter(self.filter_line.text().strip()))
+        self.filter_line.textChanged.connect(self.filter_timer.start)
+        self.list_view.doubleClicked.connect(self.accept)
+        # Shown while the last page asked for could not be read
+        self.error_label = QLabel()
+        self.error_label.hide()
+        self.model.page_failed.connect(self.show_page_error)
+        self.model.rowsInserted.connect(self.error_label.hide)
+        self.model.modelReset.connect(self.error_label.hide)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.filter_line)
+        layout.addWidget(self.list_view)
+        layout.addWidget(self.error_label)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+        self.resize(420, 360)
+
+    def show_page_error(self, error):
+        self.error_label.setText(f"The attendees could not be read: {error}."
+                                 " Scroll down to try again.")
+        self.error_label.show()
+
+    def selected_attendees(self):
+        """Returns a list of records with the data of the selected attendees."""
+        rows = sorted(index.row()
+                      for index in self.list_view.selectionModel().selectedRows())
+        return [self.model.attendee(row) for row in rows]
@@ -0,0 +1,117 @@
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import (
+    QDialog,
+    QDialogButtonBox,
+    QLabel,
+    QLineEdit,
+    QMessageBox,
+    QVBoxLayout,
+)
+
+from check_in import CheckInDesk
+from gui_workers import BackgroundRunner
+
+# Milliseconds between refreshes of the check-in count and throughput
+STATUS_REFRESH_INTERVAL = 1000
+
+
+class CheckInDialog(QDialog):
+    """
+    Check-in desk: the guest_id, email or badge code typed or scanned
+    into the line is checked in when Enter is pressed (a barcode scanner
+    presses it after every code). The attendees are read into memory
+    when the dialog opens and the check-ins are saved in the background
+    (see check_in.CheckInDesk). Shows the number of attendees checked in
+    and the current check-ins per hour.
+    """
+    def __init__(self, parent=None, background=None):
+        super().__init__(parent)
+        self.setWindowTitle("Check-in")
+        self.background = background or BackgroundRunner()
+        self.desk = CheckInDesk()
+        self.closed = False
+
+        self.code_line = QLineEdit()
+        self.code_line.setPlaceholderText("guest_id, email or badge code")
+        self.code_line.setEnabled(False)
+        self.result_label = QLabel("Loading the guest list...")
+        self.status_label = QLabel()
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        self.code_line.returnPressed.connect(self.check_in)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.code_line)
+        layout.addWidget(self.result_label)
+        layout.addWidget(self.status_label)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+        self.resize(380, 160)
+
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.show_status)
+        self.background.run(self.desk.load, on_result=self.desk_loaded,
+                            on_error=self.show_error)
+
+    def desk_loaded(self, attendees):
+        """
+        Starts saving check-ins in the background and lets the user type,
+        unless the dialog was closed while the guest list was loading.
+        """
+        if self.closed:
+            return
+        self.desk.start()
+        self.status_timer.start(STATUS_REFRESH_INTERVAL)
+        self.code_line.setEnabled(True)
+        self.code_line.setFocus()
+        self.result_label.setText(f"Ready, {attendees} attendees on the list.")
+        self.show_status()
+
+    def check_in(self):
+        """Checks in the attendee whose code was typed, in the background."""
+        key = self.code_line.text().strip()
+        self.code_line.clear()
+        if key:
+            self.background.run(
+                self.desk.check_in, key,
+                on_result=lambda result: self.show_result(key, result),
+                on_error=self.show_error)
+
+    def show_result(self, key, result):
+        """Shows who was checked in, or why not."""
+        if result is None:
+            text = f"Not found: {key}"
+        elif result.already_checked_in:
+            text = (f"{result.name} (id {result.guest_id}) was already checked in"
+                    f" at {result.checked_in_at:%H:%M:%S}")
+        else:
+            text = f"Welcome, {result.name}! (id {result.guest_id})"
+        self.result_label.setText(text)
+        self.show_status()
+
+    def show_error(self, error):
+        self.result_label.setText(f"The operation failed: {error}")
+
+    def show_status(self):
+        """Shows the check-in count and throughput."""
+        status = self.desk.status()
+        text = (f"{status['checked_in']} of {status['attendees']} checked in,"
+                f" {status['per_hour']:.0f} per hour")
+        if status["pending"]:
+            text += f", {status['pending']} waiting to be saved"
+        if status["last_error"]:
+            text += f"\nSaving failed, retrying: {status['last_error']}"
+        self.status_label.setText(text)
+
+    def done(self, result):
+        """Saves the remaining check-ins before the dialog closes."""
+        self.closed = True
+        self.status_timer.stop()
+        try:
+            self.desk.stop()
+        except Exception as error:
+            QMessageBox.warning(
+                self, "Error",
+                f"{self.desk.status()['pending']} check-ins could not be saved:\n{error}",
+                QMessageBox.Ok)
+        super().done(result)
@@ -0,0 +1,161 @@
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import (
+    QDialog,
+    QDialogButtonBox,
+    QLabel,
+    QLineEdit,
+    QListWidget,
+    QListWidgetItem,
+    QVBoxLayout,
+)
+
+from gui_workers import BackgroundRunner
+from live_search import LIVE_SEARCH_LIMIT, PrefixResultCache, search_by_name
+
+# Milliseconds to wait after the last key press before asking the database
+SEARCH_DELAY = 150
+
+
+def attendee_details(attendee):
+    """Returns the text with the complete information about an attendee."""
+    return (
+        f"id {attendee.guest_id}:"
+        f"\n\t{attendee.first_name} {attendee.last_name} from {attendee.city}"
+        f"\n\tWorking at {attendee.company},"
+        f"\n\temail: {attendee.email},"
+        f"\n\tnumber: {attendee.phone}"
+    )
+
+
+class LiveSearchDialog(QDialog):
+    """
+    Dialog that shows the attendees whose name contains the typed text,
+    updated as the user types. Results already known are narrowed at once
+    (see live_search.PrefixResultCache); otherwise the database is asked
+    SEARCH_DELAY ms after the last key press, for at most LIVE_SEARCH_LIMIT
+    attendees. Only one query runs at a time: text typed in the meantime
+    waits for it, and only the latest text is searched next.
+    """
+    def __init__(self, parent=None, background=None, limit=LIVE_SEARCH_LIMIT):
+        super().__init__(parent)
+        self.setWindowTitle("Attendee info")
+        self.limit = limit
+        self.background = background or BackgroundRunner()
+        self.cache = PrefixResultCache(limit)
+        self.running_query = None
+        self.waiting_query = None
+
+        self.search_line = QLineEdit()
+        self.search_line.setPlaceholderText("Attendee's name (or its part)")
+        self.results_list = QListWidget()
+        self.status_label = QLabel()
+        self.details_label = QLabel()
+        self.details_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.search_in_database)
+        self.search_line.textChanged.connect(lambda _text: self.query_changed())
+        self.results_list.currentItemChanged.connect(self.show_details)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.search_line)
+        layout.addWidget(self.results_list)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.details_label)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+        self.resize(420, 420)
+
+    def query(self):
+        """Returns the text typed in the search line."""
+        return self.search_line.text().strip()
+
+    def query_changed(self, delay=True):
+        """
+        Shows the results of the typed text at once if they are known,
+        otherwise asks the database, after SEARCH_DELAY ms if delay is True.
+        """
+        query = self.query()
+        self.search_timer.stop()
+        if not query:
+            self.show_results(query, [])
+            return
+        cached = self.cache.get(query)
+        if cached is not None:
+            self.show_results(query, cached)
+            return
+        self.status_label.setText("Searching...")
+        if delay:
+            self.search_timer.start()
+        else:
+            self.search_in_database()
+
+    def search_in_database(self):
+        """
+        Runs search_by_name in the background for the typed text,
+        or, if a query is still running, leaves the text to be searched
+        when it is done.
+        """
+        query = self.query()
+        if not query:
+            return
+        if self.running_query is not None:
+            self.waiting_query = query
+            return
+        self.running_query = query
+        self.background.run(
+            search_by_name, query, self.limit,
+            on_result=lambda attendees: self.search_done(query, attendees),
+            on_error=self.search_failed,
+        )
+
+    def search_done(self, query, attendees):
+        """
+        Keeps the results; shows them if the text was not changed in the
+        meantime. Then searches the text typed while the query ran, if any.
+        """
+        self.running_query = None
+        if attendees is not None:
+            self.cache.put(query, attendees)
+        waiting_query, self.waiting_query = self.waiting_query, None
+        if query == self.query():
+            self.show_results(query, attendees or [])
+        elif waiting_query is not None:
+            self.query_changed(delay=False)
+
+    def search_failed(self, error):
+        """Informs the user that the search did not work."""
+        self.running_query = None
+        self.waiting_query = None
+        self.status_label.setText(f"Search failed: {error}")
+
+    def show_results(self, query, attendees):
+        """Fills the list with the attendees found for the query."""
+        self.results_list.clear()
+        for attendee in attendees[:self.limit]:
+            item = QListWidgetItem(f"{attendee.first_name} {attendee.last_name}"
+                                   f" ({attendee.company}, {attendee.city})")
+            item.setData(Qt.UserRole, attendee)
+            self.results_list.addItem(item)
+        if not query:
+            self.status_label.setText("")
+        elif not attendees:
+            self.status_label.setText("No matching results found.")
+        elif len(attendees) > self.limit:
+            self.status_label.setText(
+                f"Showing the first {self.limit} matches, keep typing to narrow them.")
+        else:
+            self.status_label.setText(f"{len(attendees)} matching attendee(s).")
+        if attendees:
+            self.results_list.setCurrentRow(0)
+        else:
+            self.details_label.setText("")
+
+    def show_details(self, item, _previous=None):
+        """Shows the complete information about the chosen attendee."""
+        self.details_label.setText(
+            attendee_details(item.data(Qt.UserRole)) if item is not None else "")
@@ -0,0 +1,92 @@
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from backend import OperationCancelled
+
+
+class WorkerSignals(QObject):
+    """
+    Signals of a BackendWorker. They are emitted from the worker's
+    thread and delivered to the slots in the GUI thread.
+    """
+    result = pyqtSignal(object)
+    error = pyqtSignal(object)
+    progress = pyqtSignal(int)
+    cancelled = pyqtSignal()
+    finished = pyqtSignal()
+
+
+class BackendWorker(QRunnable):
+    """
+    Runs a backend function with the given arguments on a thread
+    of a QThreadPool, so the window keeps responding in the meantime.
+    Its result is delivered with signals.result, an exception with
+    signals.error. With report_progress=True the function is also given
+    a progress_callback argument; its calls are delivered with
+    signals.progress, and after cancel() the next call stops the
+    function by raising OperationCancelled (signals.cancelled).
+    """
+    def __init__(self, function, *args, report_progress=False):
+        super().__init__()
+        self.function = function
+        self.args = args
+        self.kwargs = {}
+        if report_progress:
+            self.kwargs["progress_callback"] = self.report_progress
+        self.signals = WorkerSignals()
+        self._cancel_requested = threading.Event()
+
+    def cancel(self):
+        """Asks the function to stop at its next progress report."""
+        self._cancel_requested.set()
+
+    def report_progress(self, done):
+        """Passes the progress to the GUI, stops if cancel() was called."""
+        if self._cancel_requested.is_set():
+            raise OperationCancelled()
+        self.signals.progress.emit(done)
+
+    def run(self):
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except OperationCancelled:
+            self.signals.cancelled.emit()
+        except Exception as error:
+            self.signals.error.emit(error)
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
+
+
+class BackgroundRunner:
+    """
+    Starts BackendWorkers on a thread pool and keeps a reference
+    to each of them until it has finished.
+    """
+    def __init__(self, thread_pool=None):
+        self.thread_pool = thread_pool or QThreadPool.globalInstance()
+        self.workers = set()
+
+    def run(self, function, *args, on_result=None, on_error=None,
+            report_progress=False):
+        """
+        Runs function(*args) in the background. on_result and on_error
+        are called in the GUI thread with the result or the exception.
+        Returns the started worker, e.g. to connect to its progress
+        signal or to cancel it.
+        """
+        worker = BackendWorker(function, *args, report_progress=report_progress)
+        if on_result is not None:
+            worker.signals.result.connect(on_result)
+        if on_error is not None:
+            worker.signals.error.connect(on_error)
+        worker.signals.finished.connect(lambda: self.workers.discard(worker))
+        self.workers.add(worker)
+        self.thread_pool.start(worker)
+        return worker
+
+    def wait_for_all(self, timeout=-1):
+        """Waits until all started workers are done, e.g. before exiting."""
+        return self.thread_pool.waitForDone(timeout)
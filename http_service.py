@@ -0,0 +1,388 @@
+"""
+HTTP/JSON service that lets many desks share one pool of connections
+to the PostgreSQL database from the configuration file:
+
+    python -m http_service --port 8080
+
+    POST   /attendees                  add an attendee (JSON object)
+    GET    /attendees?after=&limit=    list attendees, a page at a time
+    GET    /attendees/{guest_id}       one attendee
+    GET    /search?q=&limit=&ranked=   find attendees by name (ranked: also
+                                       email and company, best matches first)
+    DELETE /attendees/{guest_id}       remove an attendee
+    DELETE /attendees?company=&added_after=&added_before=
+                                       remove every attendee matching the filters
+    GET    /export.{csv,xlsx,docx,parquet}
+                                       download the guest list
+    GET    /status                     pool and request coalescing counters
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import tempfile
+from datetime import datetime
+
+import asyncpg
+from aiohttp import web
+
+from backend import (
+    ATTENDEE_COLUMNS,
+    GUESTLIST_COLUMNS,
+    PAGE_SIZE,
+    SEARCH_LIMIT,
+    escape_like_pattern,
+    get_attendees_list_format_docx,
+    get_attendees_list_format_parquet,
+    get_attendees_list_format_xlsx,
+    select_attendee_columns,
+)
+from config import get_cached_configuration
+import connection_pool
+from connection_pool import set_configuration_file
+from export_cache import with_export_cache
+from storage import PostgresEngine
+
+DEFAULT_SERVICE_SETTINGS = {
+    "host": "127.0.0.1",
+    "port": "8080",
+    "min_connections": "2",
+    "max_connections": "20",
+}
+
+# Most attendees returned by one list or search request
+MAX_LIMIT = 1000
+
+# Bytes sent at once when an export file is downloaded
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Exports created by the backend functions; csv is streamed by COPY.
+# They read PostgreSQL whatever the [storage] engine, so they are cached
+# by its guest list version
+EXPORT_FUNCTIONS = {
+    "xlsx": with_export_cache(get_attendees_list_format_xlsx, "xlsx", PostgresEngine()),
+    "docx": with_export_cache(get_attendees_list_format_docx, "docx", PostgresEngine()),
+    "parquet": with_export_cache(get_attendees_list_format_parquet, "parquet",
+                                 PostgresEngine()),
+}
+
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "parquet": "application/octet-stream",
+}
+
+
+class RequestCoalescer:
+    """
+    Runs a coroutine once for all the concurrent requests with the same
+    key: the requests that come while it runs wait for its result instead
+    of running their own copy. A request that goes away does not cancel
+    it for the others.
+    """
+    def __init__(self):
+        self.started = 0
+        self.shared = 0
+        self._running = {}
+
+    async def run(self, key, make_coroutine):
+        future = self._running.get(key)
+        if future is None:
+            self.started += 1
+            future = asyncio.ensure_future(make_coroutine())
+            self._running[key] = future
+            future.add_done_callback(lambda _: self._running.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(future)
+
+
+def json_value(value):
+    """Converts values json does not know, e.g. dates, to text."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def json_response(data, status=200):
+    return web.json_response(
+        data, status=status, dumps=functools.partial(json.dumps, default=json_value))
+
+
+def records(rows, record_type):
+    """Returns a list of dictionaries of the rows, keyed by column name."""
+    return [record_type._make(row.values())._asdict() for row in rows]
+
+
+def bad_request(message):
+    return web.HTTPBadRequest(
+        text=json.dumps({"error": message}), content_type="application/json")
+
+
+def int_parameter(request, name, default, maximum=None):
+    """Returns the query parameter as an int; responds 400 if it is not one."""
+    try:
+        value = int(request.query.get(name, default))
+    except ValueError:
+        raise bad_request(f"{name} has to be a number")
+    if value < 0:
+        raise bad_request(f"{name} can not be negative")
+    return min(value, maximum) if maximum is not None else value
+
+
+def date_parameter(request, name):
+    """Returns the query parameter as a datetime (ISO format), or None."""
+    if name not in request.query:
+        return None
+    try:
+        return datetime.fromisoformat(request.query[name])
+    except ValueError:
+        raise bad_request(f"{name} has to be a date in ISO format")
+
+
+def columns_parameter(request):
+    """Returns the columns asked for with ?columns=a,b (see select_attendee_columns)."""
+    if "columns" not in request.query:
+        return select_attendee_columns(ATTENDEE_COLUMNS)
+    columns = tuple(column.strip() for column in request.query["columns"].split(","))
+    try:
+        return select_attendee_columns(columns)
+    except ValueError as error:
+        raise bad_request(str(error))
+
+
+async def add_attendee(request):
+    """Adds the attendee given as a JSON object. Responds with their data."""
+    try:
+        data = await request.json()
+    except ValueError:
+        raise bad_request("the body has to be a JSON object")
+    if not isinstance(data, dict) or not data.get("first_name") or not data.get("last_name"):
+        raise bad_request("first_name and last_name are required")
+    values = [data.get(column) for column in GUESTLIST_COLUMNS[:-1]] + [datetime.now()]
+    columns = ", ".join(GUESTLIST_COLUMNS)
+    placeholders = ", ".join(f"${number}" for number in range(1, len(values) + 1))
+    sql = f"""INSERT INTO guestlist({columns}) VALUES ({placeholders})
+              RETURNING {", ".join(ATTENDEE_COLUMNS)};"""
+    row = await request.app["pool"].fetchrow(sql, *values)
+    return json_response(records([row], select_attendee_columns(ATTENDEE_COLUMNS)[1])[0],
+                         status=201)
+
+
+async def list_attendees(request):
+    """
+    Responds with a page of attendees with guest_id greater than ?after=,
+    like backend.get_attendees_page.
+    """
+    after = int_parameter(request, "after", 0)
+    limit = int_parameter(request, "limit", PAGE_SIZE, MAX_LIMIT)
+    selected, record_type = columns_parameter(request)
+    sql = f"""SELECT {selected} FROM guestlist WHERE guest_id > $1
+              ORDER BY guest_id LIMIT $2;"""
+    rows = await request.app["pool"].fetch(sql, after, limit)
+    return json_response(records(rows, record_type))
+
+
+async def get_attendee(request):
+    """Responds with the attendee's data, or 404."""
+    selected, record_type = columns_parameter(request)
+    sql = f"""SELECT {selected} FROM guestlist WHERE guest_id = $1;"""
+    row = await request.app["pool"].fetchrow(sql, int(request.match_info["guest_id"]))
+    if row is None:
+        raise web.HTTPNotFound()
+    return json_response(records([row], record_type)[0])
+
+
+async def search_attendees(request):
+    """
+    Responds with up to ?limit= attendees whose full name contains ?q=,
+    or with ?ranked=1 the best matches by name, email or company (like
+    backend.search_attendees). Identical searches running at the same
+    time share one database query.
+    """
+    query = request.query.get("q", "").strip()
+    if not query:
+        raise bad_request("q is required")
+    limit = int_parameter(request, "limit", SEARCH_LIMIT, MAX_LIMIT)
+    ranked = request.query.get("ranked", "0").lower() in ("1", "yes", "true")
+    pattern = "%" + escape_like_pattern(query) + "%"
+    columns = ", ".join(ATTENDEE_COLUMNS)
+    if ranked:
+        sql = f"""SELECT {columns} FROM guestlist
+                  WHERE first_name || ' ' || last_name ILIKE $1
+                     OR email ILIKE $1
+                     OR company ILIKE $1
+                  ORDER BY greatest(
+                             similarity(first_name || ' ' || last_name, $2),
+                             similarity(email, $2),
+                             similarity(company, $2)) DESC,
+                           guest_id
+                  LIMIT $3;"""
+        arguments = (pattern, query, limit)
+    else:
+        sql = f"""SELECT {columns} FROM guestlist
+                  WHERE first_name || ' ' || last_name ILIKE $1
+                  ORDER BY guest_id LIMIT $2;"""
+        arguments = (pattern, limit)
+
+    pool = request.app["pool"]
+    rows = await request.app["coalescer"].run(
+        (sql, arguments), lambda: pool.fetch(sql, *arguments))
+    return json_response(records(rows, select_attendee_columns(ATTENDEE_COLUMNS)[1]))
+
+
+async def remove_attendee(request):
+    """Removes the attendee. Responds with their data, or 404."""
+    sql = f"""DELETE FROM guestlist WHERE guest_id = $1
+              RETURNING {", ".join(ATTENDEE_COLUMNS)};"""
+    row = await request.app["pool"].fetchrow(sql, int(request.match_info["guest_id"]))
+    if row is None:
+        raise web.HTTPNotFound()
+    return json_response(records([row], select_attendee_columns(ATTENDEE_COLUMNS)[1])[0])
+
+
+async def remove_attendees(request):
+    """
+    Removes every attendee matching all the filters given as ?company=,
+    ?added_after= and ?added_before=, like backend.remove_attendees.
+    Responds with their data; without any filter, with 400.
+    """
+    conditions, arguments = [], []
+    filters = (("company = ${}", request.query.get("company")),
+               ("date_added >= ${}", date_parameter(request, "added_after")),
+               ("date_added < ${}", date_parameter(request, "added_before")))
+    for condition, value in filters:
+        if value is not None:
+            arguments.append(value)
+            conditions.append(condition.format(len(arguments)))
+    if not conditions:
+        raise bad_request("at least one filter is required")
+    sql = f"""DELETE FROM guestlist WHERE {" AND ".join(conditions)}
+              RETURNING {", ".join(ATTENDEE_COLUMNS)};"""
+    rows = await request.app["pool"].fetch(sql, *arguments)
+    return json_response(records(rows, select_attendee_columns(ATTENDEE_COLUMNS)[1]))
+
+
+async def export_attendees(request):
+    """
+    Streams the guest list in the format of the file extension.
+    The csv file is sent as PostgreSQL writes it (COPY ... TO STDOUT).
+    The other formats are created by the backend export functions on
+    a thread, through the export cache (see export_cache.py), and the
+    file is sent in chunks.
+    """
+    file_format = request.match_info["file_format"]
+    if file_format not in EXPORT_CONTENT_TYPES:
+        raise web.HTTPNotFound()
+    response = web.StreamResponse(headers={
+        "Content-Type": EXPORT_CONTENT_TYPES[file_format],
+        "Content-Disposition": f'attachment; filename="attendees.{file_format}"',
+    })
+
+    if file_format == "csv":
+        await response.prepare(request)
+        columns = ", ".join(ATTENDEE_COLUMNS)
+        async with request.app["pool"].acquire() as conn:
+            await conn.copy_from_query(
+                f"SELECT {columns} FROM guestlist ORDER BY guest_id",
+                output=response.write, format="csv", header=True)
+        await response.write_eof()
+        return response
+
+    handle, filename = tempfile.mkstemp(suffix=f".{file_format}")
+    os.close(handle)
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, functools.partial(EXPORT_FUNCTIONS[file_format], filename, True))
+        await response.prepare(request)
+        with open(filename, "rb") as export_file:
+            while True:
+                chunk = export_file.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await response.write(chunk)
+    finally:
+        os.unlink(filename)
+    await response.write_eof()
+    return response
+
+
+async def get_status(request):
+    """Responds with the pool size and the request coalescing counters."""
+    pool, coalescer = request.app["pool"], request.app["coalescer"]
+    return json_response({
+        "pool_size": pool.get_size(),
+        "pool_idle": pool.get_idle_size(),
+        "searches_run": coalescer.started,
+        "searches_shared": coalescer.shared,
+    })
+
+
+@web.middleware
+async def database_errors(request, handler):
+    """Responds with 500 and the message of a database error."""
+    try:
+        return await handler(request)
+    except asyncpg.PostgresError as error:
+        return json_response({"error": str(error).strip()}, status=500)
+
+
+def create_app(filename=None):
+    """
+    Returns the aiohttp application. Its asyncpg pool connects to the
+    database from the [postgresql] section of the configuration file
+    (connection_pool.CONFIGURATION_FILE by default) and is sized by
+    the [service] section.
+    """
+    if filename is None:
+        filename = connection_pool.CONFIGURATION_FILE
+    app = web.Application(middlewares=[database_errors])
+
+    async def open_pool(app):
+        parameters = get_cached_configuration(filename=filename, section="postgresql")
+        settings = get_cached_configuration(filename=filename, section="service",
+                                            defaults=DEFAULT_SERVICE_SETTINGS)
+        app["pool"] = await asyncpg.create_pool(
+            min_size=int(settings["min_connections"]),
+            max_size=int(settings["max_connections"]),
+            **parameters)
+        app["coalescer"] = RequestCoalescer()
+
+    async def close_pool(app):
+        await app["pool"].close()
+
+    app.on_startup.append(open_pool)
+    app.on_cleanup.append(close_pool)
+    app.add_routes([
+        web.post("/attendees", add_attendee),
+        web.get("/attendees", list_attendees),
+        web.delete("/attendees", remove_attendees),
+        web.get(r"/attendees/{guest_id:\d+}", get_attendee),
+        web.delete(r"/attendees/{guest_id:\d+}", remove_attendee),
+        web.get("/search", search_attendees),
+        web.get(r"/export.{file_format:\w+}", export_attendees),
+        web.get("/status", get_status),
+    ])
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--config", default=connection_pool.CONFIGURATION_FILE,
+                        help="configuration file with the database to serve")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    args = parser.parse_args(argv)
+
+    set_configuration_file(args.config)
+    settings = get_cached_configuration(filename=args.config, section="service",
+                                        defaults=DEFAULT_SERVICE_SETTINGS)
+    web.run_app(create_app(args.config), host=args.host or settings["host"],
+                port=args.port or int(settings["port"]))
+
+
+if __name__ == "__main__":
+    main()
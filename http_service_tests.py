@@ -0,0 +1,121 @@
+import asyncio
+import csv
+import io
+import unittest
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from backend import get_list_all_attendees, remove_attendees
+from http_service import RequestCoalescer, create_app
+
+test_attendee = {'first_name': 'Hermenegildo', 'last_name': 'Servicename',
+                 'city': 'New York', 'company': 'Service Testers',
+                 'email': 'jd@testers.com', 'phone': '123456789'}
+
+
+class RequestCoalescerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_share_one_run(self):
+        """Checks if calls with the same key made at the same time run once."""
+        coalescer = RequestCoalescer()
+        runs = []
+
+        async def search():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return ['result']
+        results = await asyncio.gather(
+            *[coalescer.run('key', search) for _ in range(5)],
+            coalescer.run('other key', search))
+        self.assertEqual(results, [['result']] * 6)
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(coalescer.shared, 4)
+        await coalescer.run('key', search)
+        self.assertEqual(len(runs), 3)
+
+
+class HttpServiceTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = TestClient(TestServer(create_app()))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        remove_attendees(company='Service Testers')
+
+    async def add_test_attendee(self, **changes):
+        response = await self.client.post('/attendees', json={**test_attendee, **changes})
+        self.assertEqual(response.status, 201)
+        return await response.json()
+
+    async def test_add_get_and_remove(self):
+        """Checks if an added attendee can be read and removed."""
+        added = await self.add_test_attendee()
+        self.assertEqual(added['last_name'], 'Servicename')
+
+        response = await self.client.get(f"/attendees/{added['guest_id']}",
+                                         params={'columns': 'email,city'})
+        self.assertEqual(await response.json(),
+                         {'email': 'jd@testers.com', 'city': 'New York'})
+
+        response = await self.client.delete(f"/attendees/{added['guest_id']}")
+        self.assertEqual((await response.json())['guest_id'], added['guest_id'])
+        response = await self.client.get(f"/attendees/{added['guest_id']}")
+        self.assertEqual(response.status, 404)
+
+    async def test_bad_requests(self):
+        """Checks if invalid requests are answered with 400."""
+        for response in (
+                await self.client.post('/attendees', json={'first_name': 'Anna'}),
+                await self.client.get('/attendees', params={'limit': 'many'}),
+                await self.client.get('/attendees', params={'columns': 'salary'}),
+                await self.client.get('/search'),
+                await self.client.delete('/attendees')):
+            self.assertEqual(response.status, 400)
+            self.assertIn('error', await response.json())
+
+    async def test_list_and_search(self):
+        """Checks if the pages and searches return the expected attendees."""
+        await self.add_test_attendee()
+        await self.add_test_attendee(first_name='Anna')
+        response = await self.client.get('/attendees', params={'limit': 1000})
+        listed = await response.json()
+        self.assertEqual([attendee['guest_id'] for attendee in listed],
+                         [attendee.guest_id for attendee in get_list_all_attendees()])
+        page = await (await self.client.get(
+            '/attendees', params={'after': listed[0]['guest_id'], 'limit': 1})).json()
+        self.assertEqual(page, listed[1:2])
+
+        responses = await asyncio.gather(*[
+            self.client.get('/search', params={'q': 'anna servicename'})
+            for _ in range(3)])
+        for response in responses:
+            found = await response.json()
+            self.assertEqual([attendee['first_name'] for attendee in found], ['Anna'])
+
+    async def test_remove_by_filters(self):
+        """Checks if only the attendees matching every filter are removed."""
+        await self.add_test_attendee()
+        response = await self.client.delete(
+            '/attendees', params={'company': 'Service Testers',
+                                  'added_before': '2000-01-01'})
+        self.assertEqual(await response.json(), [])
+        response = await self.client.delete(
+            '/attendees', params={'company': 'Service Testers'})
+        self.assertEqual(len(await response.json()), 1)
+
+    async def test_export_csv(self):
+        """Checks if the streamed csv file has every attendee."""
+        await self.add_test_attendee()
+        response = await self.client.get('/export.csv')
+        self.assertEqual(response.headers['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(await response.text())))
+        self.assertEqual(rows[0][0], 'guest_id')
+        self.assertEqual([int(row[0]) for row in rows[1:]],
+                         [attendee.guest_id for attendee in get_list_all_attendees()])
+
+    async def test_export_xlsx(self):
+        """Checks if the xlsx file is downloaded."""
+        response = await self.client.get('/export.xlsx')
+        self.assertEqual(response.status, 200)
+        self.assertEqual((await response.read())[:2], b'PK')
+        self.assertEqual((await self.client.get('/export.pdf')).status, 404)
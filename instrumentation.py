@@ -0,0 +1,341 @@
+import json
+import logging
+import random
+import threading
+import time
+
+import connection_pool
+from config import get_cached_configuration
+
+DEFAULT_INSTRUMENTATION_SETTINGS = {
+    "enabled": "no",
+    "slow_query_ms": "200",
+    "slow_query_sample_rate": "1.0",
+    "slow_query_log": "",
+    "metrics_port": "0",
+}
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+PHASES = ("connect", "execute", "fetch")
+
+# Longest part of a statement written to the slow query log
+MAX_LOGGED_STATEMENT = 500
+
+slow_query_logger = logging.getLogger("conference_attendees.slow_queries")
+
+# Checked by backend.base_query before anything is measured
+enabled = False
+slow_query_seconds = 0.2
+slow_query_sample_rate = 1.0
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+_metrics_server = None
+
+
+class InstrumentedCursor:
+    """
+    Wraps a database cursor and measures how long its execute and
+    fetch calls take and how many rows they touch. Everything else
+    is passed to the wrapped cursor.
+    """
+    def __init__(self, cursor, timer):
+        self._cursor = cursor
+        self._timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _execute(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._timer.execute_seconds += time.perf_counter() - start
+            self._timer.statement = args[0] if args else None
+            if self._cursor.rowcount > 0 and self._cursor.description is None:
+                self._timer.rows += self._cursor.rowcount
+
+    def execute(self, *args, **kwargs):
+        return self._execute(self._cursor.execute, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._execute(self._cursor.executemany, *args, **kwargs)
+
+    def copy_expert(self, *args, **kwargs):
+        return self._execute(self._cursor.copy_expert, *args, **kwargs)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        rows = method(*args)
+        self._timer.fetch_seconds += time.perf_counter() - start
+        if isinstance(rows, list):
+            self._timer.rows += len(rows)
+        elif rows is not None:
+            self._timer.rows += 1
+        return rows
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+
+class QueryTimer:
+    """
+    Measures one call of a base_query function: the time spent getting
+    a connection, executing and fetching, the number of rows and whether
+    it failed. finish() adds the measurement to the collected metrics.
+    """
+    def __init__(self, function_name):
+        self.function_name = function_name
+        self.start = time.perf_counter()
+        self.connect_seconds = 0.0
+        self.execute_seconds = 0.0
+        self.fetch_seconds = 0.0
+        self.rows = 0
+        self.error = None
+        self.statement = None
+
+    def connected(self):
+        """Marks the moment the connection was obtained."""
+        self.connect_seconds = time.perf_counter() - self.start
+
+    def wrap(self, cursor):
+        """Returns the cursor wrapped in an InstrumentedCursor."""
+        return InstrumentedCursor(cursor, self)
+
+    def failed(self, error):
+        """Marks the call as failed."""
+        self.error = error
+
+    def finish(self):
+        """Records the measurement and logs the call if it was slow."""
+        total_seconds = time.perf_counter() - self.start
+        record(self.function_name, total_seconds,
+               (self.connect_seconds, self.execute_seconds, self.fetch_seconds),
+               self.rows, self.error is not None)
+        if total_seconds >= slow_query_seconds \
+                and random.random() < slow_query_sample_rate:
+            self.log_slow_query(total_seconds)
+
+    def log_slow_query(self, total_seconds):
+        """Writes the call to the slow query log."""
+        statement = self.statement
+        if isinstance(statement, bytes):
+            statement = statement.decode("utf-8", "replace")
+        statement = " ".join(str(statement).split())[:MAX_LOGGED_STATEMENT]
+        slow_query_logger.warning(
+            "%s took %.1f ms (connect %.1f ms, execute %.1f ms, fetch %.1f ms),"
+            " %d rows%s: %s",
+            self.function_name, total_seconds * 1000,
+            self.connect_seconds * 1000, self.execute_seconds * 1000,
+            self.fetch_seconds * 1000, self.rows,
+            ", failed" if self.error is not None else "", statement)
+
+
+def start_query_timer(function_name):
+    """Returns a QueryTimer if instrumentation is enabled, otherwise None."""
+    if not enabled:
+        return None
+    return QueryTimer(function_name)
+
+
+def new_function_metrics():
+    """Returns empty metrics of one function."""
+    return {
+        "calls": 0,
+        "errors": 0,
+        "rows": 0,
+        "seconds": 0.0,
+        "phase_seconds": dict.fromkeys(PHASES, 0.0),
+        "buckets": [0] * len(LATENCY_BUCKETS),
+    }
+
+
+def record(function_name, total_seconds, phase_seconds, rows, failed):
+    """Adds one call of the function to the collected metrics."""
+    with _metrics_lock:
+        metrics = _metrics.get(function_name)
+        if metrics is None:
+            metrics = _metrics[function_name] = new_function_metrics()
+        metrics["calls"] += 1
+        metrics["errors"] += int(failed)
+        metrics["rows"] += rows
+        metrics["seconds"] += total_seconds
+        for phase, seconds in zip(PHASES, phase_seconds):
+            metrics["phase_seconds"][phase] += seconds
+        for position, upper_bound in enumerate(LATENCY_BUCKETS):
+            if total_seconds <= upper_bound:
+                metrics["buckets"][position] += 1
+                break
+
+
+def get_metrics():
+    """
+    Returns a copy of the collected metrics: a dictionary keyed by
+    function name. Histogram buckets are not cumulative.
+    """
+    with _metrics_lock:
+        return json.loads(json.dumps(_metrics))
+
+
+def reset_metrics():
+    """Forgets all the collected metrics."""
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def render_json():
+    """Returns the collected metrics as a JSON document."""
+    metrics = get_metrics()
+    for function_metrics in metrics.values():
+        function_metrics["buckets"] = dict(zip(
+            [str(bound) for bound in LATENCY_BUCKETS], function_metrics["buckets"]))
+    return json.dumps(metrics, indent=2, sort_keys=True)
+
+
+def render_prometheus():
+    """Returns the collected metrics in the Prometheus text format."""
+    metrics = get_metrics()
+    lines = [
+        "# HELP backend_query_duration_seconds Duration of backend queries.",
+        "# TYPE backend_query_duration_seconds histogram",
+    ]
+    for name, function_metrics in sorted(metrics.items()):
+        cumulative = 0
+        for upper_bound, count in zip(LATENCY_BUCKETS, function_metrics["buckets"]):
+            cumulative += count
+            bound = "+Inf" if upper_bound == float("inf") else repr(upper_bound)
+            lines.append(f'backend_query_duration_seconds_bucket'
+                         f'{{function="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'backend_query_duration_seconds_sum{{function="{name}"}}'
+                     f' {function_metrics["seconds"]!r}')
+        lines.append(f'backend_query_duration_seconds_count{{function="{name}"}}'
+                     f' {function_metrics["calls"]}')
+
+    metric = "backend_query_phase_seconds_total"
+    lines.append(f"# HELP {metric} Time spent per phase of backend queries.")
+    lines.append(f"# TYPE {metric} counter")
+    for name, function_metrics in sorted(metrics.items()):
+        for phase in PHASES:
+            lines.append(f'{metric}{{function="{name}",phase="{phase}"}}'
+                         f' {function_metrics["phase_seconds"][phase]!r}')
+
+    counters = [
+        ("backend_query_rows_total", "rows", "Rows fetched or changed by backend queries."),
+        ("backend_query_errors_total", "errors", "Backend queries that failed."),
+    ]
+    for metric, key, help_text in counters:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, function_metrics in sorted(metrics.items()):
+            lines.append(f'{metric}{{function="{name}"}} {function_metrics[key]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(filename):
+    """
+    Writes the collected metrics to a file: JSON if its name ends
+    with .json, the Prometheus text format otherwise.
+    """
+    text = render_json() if filename.endswith(".json") else render_prometheus()
+    with open(filename, "w") as metrics_file:
+        metrics_file.write(text)
+    return filename
+
+
+def create_metrics_server(port, host="127.0.0.1"):
+    """
+    Returns an HTTP server serving /metrics (Prometheus text) and
+    /metrics.json. http.server is imported only here, as most runs
+    never serve the metrics.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = render_prometheus(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = render_json(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            body = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), MetricsRequestHandler)
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """
+    Starts serving the metrics over HTTP on a background thread.
+    Returns the server; its server_address holds the actual port.
+    """
+    global _metrics_server
+    if _metrics_server is None:
+        _metrics_server = create_metrics_server(port, host)
+        threading.Thread(target=_metrics_server.serve_forever,
+                         name="metrics-server", daemon=True).start()
+    return _metrics_server
+
+
+def enable(slow_query_ms=200, sample_rate=1.0, log_file=None):
+    """
+    Starts measuring every base_query call. Calls that take at least
+    slow_query_ms are written to the slow query log - only the given
+    fraction (sample_rate) of them - into log_file if one is given.
+    """
+    global enabled, slow_query_seconds, slow_query_sample_rate
+    slow_query_seconds = slow_query_ms / 1000
+    slow_query_sample_rate = sample_rate
+    if log_file and not any(getattr(handler, "baseFilename", None) == log_file
+                            for handler in slow_query_logger.handlers):
+        handler = logging.FileHandler(log_file)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_query_logger.addHandler(handler)
+    enabled = True
+
+
+def disable():
+    """Stops measuring. The metrics collected so far are kept."""
+    global enabled
+    enabled = False
+
+
+def configure(filename=None):
+    """
+    Enables instrumentation if the [instrumentation] section of the
+    configuration file (connection_pool.CONFIGURATION_FILE by default)
+    says so, and serves the metrics over HTTP if metrics_port is set.
+    Returns True if it was enabled.
+    """
+    if filename is None:
+        filename = connection_pool.CONFIGURATION_FILE
+    settings = get_cached_configuration(filename=filename, section="instrumentation",
+                                        defaults=DEFAULT_INSTRUMENTATION_SETTINGS)
+    if settings["enabled"].lower() not in ("yes", "true", "on", "1"):
+        return False
+    enable(slow_query_ms=float(settings["slow_query_ms"]),
+           sample_rate=float(settings["slow_query_sample_rate"]),
+           log_file=settings["slow_query_log"] or None)
+    if int(settings["metrics_port"]):
+        serve_metrics(int(settings["metrics_port"]))
+    return True
@@ -0,0 +1,81 @@
+import json
+import os
+import unittest
+import urllib.request
+
+import instrumentation
+from backend import base_query, get_list_all_attendees
+
+
+@base_query
+def failing_query(cur):
+    cur.execute("SELECT * FROM no_such_table;")
+    return cur, None
+
+
+class InstrumentationTests(unittest.TestCase):
+    def setUp(self):
+        instrumentation.reset_metrics()
+        instrumentation.enable(slow_query_ms=0, log_file='test_slow_queries.log')
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset_metrics()
+        for handler in list(instrumentation.slow_query_logger.handlers):
+            instrumentation.slow_query_logger.removeHandler(handler)
+            handler.close()
+        os.unlink('test_slow_queries.log')
+
+    def test_metrics_collected(self):
+        """
+        Checks if calls, rows, errors and phase timings are recorded
+        for every base_query function.
+        """
+        all_attendees = get_list_all_attendees()
+        get_list_all_attendees()
+        failing_query()
+        metrics = instrumentation.get_metrics()
+
+        listing = metrics['get_list_all_attendees']
+        self.assertEqual(listing['calls'], 2)
+        self.assertEqual(listing['rows'], 2 * len(all_attendees))
+        self.assertEqual(listing['errors'], 0)
+        self.assertEqual(sum(listing['buckets']), 2)
+        self.assertGreater(listing['phase_seconds']['execute'], 0)
+        self.assertEqual(metrics['failing_query']['errors'], 1)
+
+    def test_disabled(self):
+        """Checks if nothing is recorded when instrumentation is disabled."""
+        instrumentation.disable()
+        get_list_all_attendees()
+        self.assertEqual(instrumentation.get_metrics(), {})
+
+    def test_slow_query_log(self):
+        """Checks if calls above the threshold are written to the log."""
+        get_list_all_attendees()
+        with open('test_slow_queries.log') as log_file:
+            logged = log_file.read()
+        self.assertIn('get_list_all_attendees took', logged)
+        self.assertIn('FROM guestlist ORDER BY guest_id', logged)
+
+    def test_exports(self):
+        """
+        Checks if the metrics are exported as Prometheus text and JSON,
+        to a file and over HTTP.
+        """
+        get_list_all_attendees()
+        prometheus = instrumentation.render_prometheus()
+        self.assertIn('backend_query_duration_seconds_count'
+                      '{function="get_list_all_attendees"} 1', prometheus)
+        self.assertIn('le="+Inf"} 1', prometheus)
+
+        instrumentation.write_metrics('test_metrics.json')
+        with open('test_metrics.json') as metrics_file:
+            self.assertEqual(json.load(metrics_file)
+                             ['get_list_all_attendees']['calls'], 1)
+        os.unlink('test_metrics.json')
+
+        server = instrumentation.serve_metrics(0)
+        url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+        with urllib.request.urlopen(url) as response:
+            self.assertEqual(response.read().decode(), prometheus)
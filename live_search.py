@@ -0,0 +1,90 @@
+from collections import OrderedDict
+
+from attendee_cache import cached_get_attendees_page, like_pattern_matches
+from backend import ATTENDEE_COLUMNS, escape_like_pattern
+from storage import get_engine
+
+# Most attendees shown for one query; the user keeps typing to see the others
+LIVE_SEARCH_LIMIT = 20
+
+# Queries whose results are kept by a PrefixResultCache
+MAX_CACHED_QUERIES = 64
+
+
+def name_pattern(query):
+    """Returns the ILIKE pattern of full names containing the query."""
+    return "%" + escape_like_pattern(query) + "%"
+
+
+def search_by_name(query, limit=LIVE_SEARCH_LIMIT, columns=ATTENDEE_COLUMNS):
+    """
+    Returns a list of records of the first limit + 1 attendees (by
+    guest_id) whose full name contains the query, so the caller can
+    tell if there are more than limit of them. Runs one query with
+    LIMIT on the storage engine (see get_attendees_page); in PostgreSQL
+    through the attendee cache, so the desks asking for the same names
+    again are answered from memory while nothing changed.
+    """
+    engine = get_engine()
+    if engine.name == "postgresql" and columns[0] == "guest_id":
+        return cached_get_attendees_page(query, limit + 1, columns)
+    return engine.get_attendees_page(0, limit + 1, query, columns=columns)
+
+
+class PrefixResultCache:
+    """
+    Results of search_by_name kept for the queries typed so far.
+    Every attendee matching a query also matches the shorter queries it
+    starts with, so when the results of such a shorter query are complete
+    (not cut at limit), the longer query's results are found by filtering
+    them here, without asking the database. Keeps at most max_queries
+    results; the least recently used are forgotten first.
+    """
+    def __init__(self, limit=LIVE_SEARCH_LIMIT, max_queries=MAX_CACHED_QUERIES):
+        self.limit = limit
+        self.max_queries = max_queries
+        self._results = OrderedDict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def put(self, query, attendees):
+        """
+        Keeps the records returned by search_by_name(query, limit);
+        more than limit of them means the results were cut.
+        """
+        key = query.casefold()
+        self._results[key] = (list(attendees), len(attendees) <= self.limit)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_queries:
+            self._results.popitem(last=False)
+
+    def get(self, query):
+        """
+        Returns the records search_by_name(query, limit) would return,
+        taken from the cached results of the query itself or narrowed
+        from those of the longest shorter query it starts with.
+        Returns None if the database has to be asked.
+        """
+        key = query.casefold()
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key][0]
+        for length in range(len(key) - 1, 0, -1):
+            cached = self._results.get(key[:length])
+            if cached is None:
+                continue
+            attendees, complete = cached
+            if not complete:
+                return None
+            pattern = name_pattern(query)
+            narrowed = [attendee for attendee in attendees
+                        if like_pattern_matches(
+                            pattern, f"{attendee.first_name} {attendee.last_name}")]
+            self.put(query, narrowed)
+            return narrowed
+        return None
+
+    def clear(self):
+        """Forgets all the results, e.g. after attendees were added or removed."""
+        self._results.clear()
@@ -0,0 +1,53 @@
+import unittest
+
+from live_search import PrefixResultCache, search_by_name
+from storage import MemoryEngine, set_engine
+
+test_attendee_data = ['Hermenegildo', 'Livename', 'New York',
+                      'Testers', 'jd@testers.com', '123456789']
+
+
+class PrefixResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = MemoryEngine()
+        self.previous_engine = set_engine(self.engine)
+        for first_name in ('Anna', 'Annabel', 'Hanna', 'Bob'):
+            self.engine.store_attendee_data([first_name] + test_attendee_data[1:])
+
+    def tearDown(self):
+        set_engine(self.previous_engine)
+        self.engine.close()
+
+    def test_search_by_name_limit(self):
+        """Checks if one more attendee than the limit is returned."""
+        self.assertEqual(len(search_by_name('livename', limit=2)), 3)
+        self.assertEqual([attendee.first_name for attendee in search_by_name('anna')],
+                         ['Anna', 'Annabel', 'Hanna'])
+
+    def test_narrowed_from_complete_results(self):
+        """
+        Checks if the results of a longer query are narrowed from
+        complete results of a query it starts with, the same as
+        the database would return.
+        """
+        cache = PrefixResultCache(limit=5)
+        self.assertIsNone(cache.get('an'))
+        cache.put('an', search_by_name('an', limit=5))
+        for query in ('ANN', 'anna', 'annab', 'an_', 'an livename'):
+            self.assertEqual(cache.get(query), search_by_name(query, limit=5))
+        self.assertIsNone(cache.get('bob'))
+
+    def test_cut_results_not_narrowed(self):
+        """Checks if results cut at the limit are not narrowed."""
+        cache = PrefixResultCache(limit=2)
+        cache.put('an', search_by_name('an', limit=2))
+        self.assertIsNotNone(cache.get('an'))
+        self.assertIsNone(cache.get('anna'))
+
+    def test_least_recently_used_forgotten(self):
+        """Checks if only max_queries results are kept."""
+        cache = PrefixResultCache(limit=5, max_queries=2)
+        for query in ('anna', 'bob', 'hanna'):
+            cache.put(query, search_by_name(query, limit=5))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('anna'))
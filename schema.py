@@ -0,0 +1,216 @@
+from backend import base_query
+
+# Every migration is applied once, in this order. Never change or remove
+# a migration that was already released - add a new one instead.
+MIGRATIONS = [
+    (
+        "0001_create_guestlist",
+        """CREATE TABLE IF NOT EXISTS guestlist(
+                guest_id SERIAL PRIMARY KEY,
+                first_name VARCHAR(50) NOT NULL,
+                last_name VARCHAR(50) NOT NULL,
+                city VARCHAR(50),
+                company VARCHAR(50),
+                email VARCHAR(100),
+                phone VARCHAR(30),
+                date_added TIMESTAMP NOT NULL);""",
+    ),
+    (
+        "0002_trigram_search_indexes",
+        """CREATE EXTENSION IF NOT EXISTS pg_trgm;
+           CREATE INDEX IF NOT EXISTS guestlist_full_name_trgm_idx
+               ON guestlist USING gin ((first_name || ' ' || last_name) gin_trgm_ops);
+           CREATE INDEX IF NOT EXISTS guestlist_email_trgm_idx
+               ON guestlist USING gin (email gin_trgm_ops);
+           CREATE INDEX IF NOT EXISTS guestlist_company_trgm_idx
+               ON guestlist USING gin (company gin_trgm_ops);""",
+    ),
+    (
+        "0003_notify_guestlist_changes",
+        """CREATE OR REPLACE FUNCTION notify_guestlist_change() RETURNS trigger AS $$
+           DECLARE
+               changed_row guestlist%ROWTYPE;
+           BEGIN
+               IF TG_OP = 'DELETE' THEN
+                   changed_row := OLD;
+               ELSE
+                   changed_row := NEW;
+               END IF;
+               PERFORM pg_notify('guestlist_changes', json_build_object(
+                   'operation', TG_OP,
+                   'guest_id', changed_row.guest_id,
+                   'name', changed_row.first_name || ' ' || changed_row.last_name
+               )::text);
+               RETURN NULL;
+           END;
+           $$ LANGUAGE plpgsql;
+           DROP TRIGGER IF EXISTS guestlist_changes ON guestlist;
+           CREATE TRIGGER guestlist_changes
+               AFTER INSERT OR UPDATE OR DELETE ON guestlist
+               FOR EACH ROW EXECUTE PROCEDURE notify_guestlist_change();""",
+    ),
+    (
+        "0004_write_behind_entries",
+        """CREATE TABLE IF NOT EXISTS write_behind_entries(
+                entry_id VARCHAR(36) PRIMARY KEY,
+                saved_at TIMESTAMP NOT NULL DEFAULT now());""",
+    ),
+    (
+        "0005_guestlist_tombstones",
+        """CREATE TABLE IF NOT EXISTS guestlist_tombstones(
+                tombstone_id BIGSERIAL PRIMARY KEY,
+                guest_id INTEGER NOT NULL,
+                removed_at TIMESTAMP NOT NULL DEFAULT now());
+           CREATE OR REPLACE FUNCTION record_guestlist_tombstone() RETURNS trigger AS $$
+           BEGIN
+               INSERT INTO guestlist_tombstones(guest_id) VALUES (OLD.guest_id);
+               RETURN NULL;
+           END;
+           $$ LANGUAGE plpgsql;
+           DROP TRIGGER IF EXISTS guestlist_tombstones ON guestlist;
+           CREATE TRIGGER guestlist_tombstones
+               AFTER DELETE ON guestlist
+               FOR EACH ROW EXECUTE PROCEDURE record_guestlist_tombstone();""",
+    ),
+    (
+        "0006_guestlist_version",
+        """CREATE TABLE IF NOT EXISTS guestlist_version(
+                instance_id VARCHAR(32) NOT NULL,
+                version BIGINT NOT NULL);
+           INSERT INTO guestlist_version(instance_id, version)
+               SELECT md5(random()::text || clock_timestamp()::text), 0
+               WHERE NOT EXISTS (SELECT 1 FROM guestlist_version);
+           CREATE OR REPLACE FUNCTION bump_guestlist_version() RETURNS trigger AS $$
+           BEGIN
+               UPDATE guestlist_version SET version = version + 1;
+               RETURN NULL;
+           END;
+           $$ LANGUAGE plpgsql;
+           DROP TRIGGER IF EXISTS guestlist_version ON guestlist;
+           CREATE TRIGGER guestlist_version
+               AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON guestlist
+               FOR EACH STATEMENT EXECUTE PROCEDURE bump_guestlist_version();""",
+    ),
+    (
+        "0007_check_in",
+        """ALTER TABLE guestlist ADD COLUMN IF NOT EXISTS checked_in_at TIMESTAMP;
+           CREATE INDEX IF NOT EXISTS guestlist_email_lower_idx
+               ON guestlist (lower(email));""",
+    ),
+    (
+        "0008_duplicate_check_indexes",
+        r"""CREATE INDEX IF NOT EXISTS guestlist_email_key_idx
+               ON guestlist ((regexp_replace(lower(btrim(email)), '\+[^@]*@', '@')));
+           CREATE INDEX IF NOT EXISTS guestlist_phone_key_idx
+               ON guestlist ((right(regexp_replace(phone, '\D', '', 'g'), 9)));""",
+    ),
+    (
+        "0009_change_transaction_ids",
+        """ALTER TABLE guestlist ADD COLUMN IF NOT EXISTS inserted_txid BIGINT NOT NULL DEFAULT 0;
+           ALTER TABLE guestlist ALTER COLUMN inserted_txid SET DEFAULT txid_current();
+           CREATE INDEX IF NOT EXISTS guestlist_inserted_txid_idx
+               ON guestlist (inserted_txid);
+           ALTER TABLE guestlist_tombstones
+               ADD COLUMN IF NOT EXISTS removed_txid BIGINT NOT NULL DEFAULT 0;
+           ALTER TABLE guestlist_tombstones ALTER COLUMN removed_txid SET DEFAULT txid_current();
+           CREATE INDEX IF NOT EXISTS guestlist_tombstones_removed_txid_idx
+               ON guestlist_tombstones (removed_txid);""",
+    ),
+    (
+        "0010_guestlist_version_sequence",
+        """CREATE SEQUENCE IF NOT EXISTS guestlist_version_seq;
+           CREATE OR REPLACE FUNCTION bump_guestlist_version() RETURNS trigger AS $$
+           BEGIN
+               -- Shared, so writers do not wait for each other; held until
+               -- the transaction ends, so readers can tell that the version
+               -- has changed before the change is committed
+               PERFORM pg_advisory_xact_lock_shared(hashtext('guestlist_version'));
+               PERFORM nextval('guestlist_version_seq');
+               RETURN NULL;
+           END;
+           $$ LANGUAGE plpgsql;
+           ALTER TABLE guestlist_version DROP COLUMN IF EXISTS version;""",
+    ),
+    (
+        "0011_update_transaction_ids",
+        """ALTER TABLE guestlist ADD COLUMN IF NOT EXISTS updated_txid BIGINT;
+           CREATE INDEX IF NOT EXISTS guestlist_updated_txid_idx
+               ON guestlist (updated_txid);
+           CREATE OR REPLACE FUNCTION record_guestlist_update() RETURNS trigger AS $$
+           BEGIN
+               -- Only the exported columns (backend.ATTENDEE_COLUMNS) count,
+               -- so a check-in is not an update for delta_export.py
+               IF (NEW.first_name, NEW.last_name, NEW.city, NEW.company,
+                   NEW.email, NEW.phone, NEW.date_added)
+                  IS DISTINCT FROM
+                  (OLD.first_name, OLD.last_name, OLD.city, OLD.company,
+                   OLD.email, OLD.phone, OLD.date_added) THEN
+                   NEW.updated_txid := txid_current();
+               END IF;
+               RETURN NEW;
+           END;
+           $$ LANGUAGE plpgsql;
+           DROP TRIGGER IF EXISTS guestlist_updates ON guestlist;
+           CREATE TRIGGER guestlist_updates
+               BEFORE UPDATE ON guestlist
+               FOR EACH ROW EXECUTE PROCEDURE record_guestlist_update();""",
+    ),
+]
+
+
+@base_query
+def get_applied_migrations(cur):
+    """
+    Creates the table that keeps track of applied migrations, if needed.
+    Returns a list of the names of migrations applied so far.
+    """
+    sql = """CREATE TABLE IF NOT EXISTS schema_migrations(
+                    name VARCHAR(100) PRIMARY KEY,
+                    applied_at TIMESTAMP NOT NULL DEFAULT now());
+             SELECT name FROM schema_migrations;"""
+    cur.execute(sql)
+    return cur, [row[0] for row in cur.fetchall()]
+
+
+@base_query
+def apply_migration(cur, name, sql):
+    """
+    Runs a migration and records it as applied, in one transaction.
+    Returns the migration's name.
+    """
+    cur.execute(sql)
+    cur.execute("""INSERT INTO schema_migrations(name) VALUES (%s);""", (name,))
+    return cur, name
+
+
+@base_query
+def extension_installed(cur, name):
+    """Checks if the PostgreSQL extension is installed in the database."""
+    cur.execute("""SELECT 1 FROM pg_extension WHERE extname = %s;""", (name,))
+    return cur, cur.fetchone() is not None
+
+
+@base_query
+def trigger_installed(cur, name):
+    """Checks if a trigger with the given name exists in the database."""
+    cur.execute("""SELECT 1 FROM pg_trigger WHERE tgname = %s;""", (name,))
+    return cur, cur.fetchone() is not None
+
+
+def migrate():
+    """
+    Applies the migrations that were not applied yet. Stops at the first
+    one that fails. Returns a list of the names of migrations applied now.
+    """
+    applied = get_applied_migrations()
+    if applied is None:
+        return []
+
+    applied_now = []
+    for name, sql in MIGRATIONS:
+        if name in applied:
+            continue
+        if apply_migration(name, sql) is None:
+            break
+        applied_now.append(name)
+    return applied_now
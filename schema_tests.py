@@ -0,0 +1,16 @@
+import unittest
+
+from schema import MIGRATIONS, get_applied_migrations, migrate
+
+
+class SchemaTests(unittest.TestCase):
+    def test_migrate(self):
+        """
+        Checks if migrations are recorded once applied
+        and not applied a second time.
+        """
+        migrate()
+        applied = get_applied_migrations()
+        self.assertIn(MIGRATIONS[0][0], applied)
+        self.assertEqual(migrate(), [])
+        self.assertEqual(sorted(get_applied_migrations()), sorted(applied))
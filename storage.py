@@ -0,0 +1,499 @@
+import abc
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import backend
+from attendee_cache import like_pattern_matches
+from backend import (
+    ATTENDEE_COLUMNS,
+    GUESTLIST_COLUMNS,
+    PAGE_SIZE,
+    SEARCH_LIMIT,
+    STREAM_BATCH_SIZE,
+    escape_like_pattern,
+    make_attendees,
+    select_attendee_columns,
+)
+from config import get_cached_configuration
+import connection_pool
+
+DEFAULT_STORAGE_SETTINGS = {
+    "engine": "postgresql",
+    "path": "conference_attendees.sqlite3",
+}
+
+SQLITE_SCHEMA = """CREATE TABLE IF NOT EXISTS guestlist(
+                        guest_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        first_name VARCHAR(50) NOT NULL,
+                        last_name VARCHAR(50) NOT NULL,
+                        city VARCHAR(50),
+                        company VARCHAR(50),
+                        email VARCHAR(100),
+                        phone VARCHAR(30),
+                        date_added TIMESTAMP NOT NULL);
+                   CREATE TABLE IF NOT EXISTS guestlist_version(
+                        instance_id TEXT NOT NULL,
+                        version INTEGER NOT NULL);
+                   INSERT INTO guestlist_version(instance_id, version)
+                        SELECT lower(hex(randomblob(16))), 0
+                        WHERE NOT EXISTS (SELECT 1 FROM guestlist_version);
+                   CREATE TRIGGER IF NOT EXISTS guestlist_version_insert
+                        AFTER INSERT ON guestlist BEGIN
+                            UPDATE guestlist_version SET version = version + 1;
+                        END;
+                   CREATE TRIGGER IF NOT EXISTS guestlist_version_update
+                        AFTER UPDATE ON guestlist BEGIN
+                            UPDATE guestlist_version SET version = version + 1;
+                        END;
+                   CREATE TRIGGER IF NOT EXISTS guestlist_version_delete
+                        AFTER DELETE ON guestlist BEGIN
+                            UPDATE guestlist_version SET version = version + 1;
+                        END;"""
+
+_WORDS = re.compile(r"[^\W_]+")
+
+# Dates are kept as ISO 8601 text in SQLite and read back as datetime
+# objects from the columns declared as TIMESTAMP
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter(
+    "TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+
+def trigrams(text):
+    """
+    Returns the set of trigrams of the text, the way pg_trgm
+    creates them: every word is lowercased and padded with two
+    spaces in front and one at the end.
+    """
+    result = set()
+    for word in _WORDS.findall(text.lower()):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(text, query):
+    """
+    Works like pg_trgm's similarity(): returns the number of trigrams
+    the texts share divided by the number of their distinct trigrams.
+    NULL (None) is not similar to anything.
+    """
+    if text is None or query is None:
+        return 0.0
+    text_trigrams, query_trigrams = trigrams(text), trigrams(query)
+    if not text_trigrams or not query_trigrams:
+        return 0.0
+    shared = len(text_trigrams & query_trigrams)
+    return shared / len(text_trigrams | query_trigrams)
+
+
+def ilike(text, pattern):
+    """Works like PostgreSQL's 'text ILIKE pattern'."""
+    if text is None or pattern is None:
+        return None
+    return like_pattern_matches(pattern, text)
+
+
+class StorageEngine(abc.ABC):
+    """
+    Interface of the places attendees can be kept in. Every engine
+    has the same methods, with the same arguments and results as the
+    backend functions with the same names: attendees are returned as
+    Attendee records (or smaller records with the chosen columns),
+    errors are printed and None is returned, except inside a
+    transaction() block, where they are raised. An engine has to
+    implement every abstract method before it can be created.
+    """
+    name = None
+
+    @abc.abstractmethod
+    def store_attendee_data(self, attendee_data):
+        """Adds an attendee. Returns their guest_id."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def store_many_attendees_data(self, attendees_data):
+        """
+        Adds many attendees at once; each one's data is a tuple in
+        the GUESTLIST_COLUMNS order. Returns the number of attendees added.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_attendee(self, guest_id, columns=ATTENDEE_COLUMNS):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_list_all_attendees(self, columns=ATTENDEE_COLUMNS):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iterate_all_attendees(self, batch_size=STREAM_BATCH_SIZE,
+                              columns=ATTENDEE_COLUMNS):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_attendees_page(self, after_guest_id=0, page_size=PAGE_SIZE,
+                           name_filter=None, columns=ATTENDEE_COLUMNS):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_matching_attendees(self, attendees_name, columns=ATTENDEE_COLUMNS):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def search_attendees(self, query, limit=SEARCH_LIMIT, columns=ATTENDEE_COLUMNS):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def remove_attendee(self, guest_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def remove_attendees(self, guest_ids=None, company=None,
+                         added_after=None, added_before=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def table_version(self):
+        """
+        Returns a text that changes whenever attendees are added, changed
+        or removed, and differs between guest lists (see export_cache.py).
+        """
+        raise NotImplementedError
+
+    def attendees_to_export(self):
+        """
+        Returns the attendees argument for the export functions of
+        backend.py: the engine's guest list, read in batches.
+        """
+        return self.iterate_all_attendees()
+
+    @abc.abstractmethod
+    def transaction(self):
+        """
+        Returns a context manager: everything done inside the with block
+        is committed at its end, or rolled back if the block raises.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the engine's connections."""
+
+
+class PostgresEngine(StorageEngine):
+    """
+    The PostgreSQL database from the [postgresql] section of the
+    configuration file; the methods are the backend functions.
+    """
+    name = "postgresql"
+
+    def store_attendee_data(self, attendee_data):
+        return backend.store_attendee_data_in_postgresql(list(attendee_data))
+
+    def store_many_attendees_data(self, attendees_data):
+        # Imported here, as it loads pandas
+        from bulk_ingest import ingest_attendees
+
+        return ingest_attendees(attendees_data)["inserted"]
+
+    def get_attendee(self, guest_id, columns=ATTENDEE_COLUMNS):
+        return backend.get_attendee(guest_id, columns=columns)
+
+    def get_list_all_attendees(self, columns=ATTENDEE_COLUMNS):
+        return backend.get_list_all_attendees(columns=columns)
+
+    def iterate_all_attendees(self, batch_size=STREAM_BATCH_SIZE,
+                              columns=ATTENDEE_COLUMNS):
+        return backend.iterate_all_attendees(batch_size, columns=columns)
+
+    def get_attendees_page(self, after_guest_id=0, page_size=PAGE_SIZE,
+                           name_filter=None, columns=ATTENDEE_COLUMNS):
+        return backend.get_attendees_page(after_guest_id, page_size, name_filter,
+                                          columns=columns)
+
+    def get_matching_attendees(self, attendees_name, columns=ATTENDEE_COLUMNS):
+        return backend.get_matching_attendees(attendees_name, columns=columns)
+
+    def search_attendees(self, query, limit=SEARCH_LIMIT, columns=ATTENDEE_COLUMNS):
+        return backend.search_attendees(query, limit, columns=columns)
+
+    def remove_attendee(self, guest_id):
+        return backend.remove_attendee(guest_id)
+
+    def remove_attendees(self, guest_ids=None, company=None,
+                         added_after=None, added_before=None):
+        return backend.remove_attendees(guest_ids, company, added_after, added_before)
+
+    def table_version(self):
+        return backend.get_guestlist_version()
+
+    def attendees_to_export(self):
+        # None makes the exports read PostgreSQL themselves,
+        # so the csv one can use COPY instead of Python rows
+        return None
+
+    def transaction(self):
+        return backend.transaction()
+
+
+class SqliteEngine(StorageEngine):
+    """
+    Attendees kept in a SQLite file, for events run on a single laptop.
+    The same queries as in backend.py; ILIKE and pg_trgm's similarity()
+    are provided by the Python functions above. The connection is shared
+    by all threads, one operation at a time.
+    """
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     isolation_level=None,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.create_function("ilike", 2, ilike, deterministic=True)
+        self._conn.create_function("similarity", 2, similarity, deterministic=True)
+        self._conn.executescript(SQLITE_SCHEMA)
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._savepoints = 0
+
+    def _in_transaction(self):
+        return getattr(self._local, "depth", 0) > 0
+
+    def _run(self, query, *args):
+        """
+        Runs query(cur, *args) like backend.base_query does: commits,
+        prints errors and returns None, unless inside transaction().
+        """
+        with self._lock:
+            if self._in_transaction():
+                return query(self._conn.cursor(), *args)
+            try:
+                self._conn.execute("BEGIN;")
+                result = query(self._conn.cursor(), *args)
+                self._conn.execute("COMMIT;")
+                return result
+            except Exception as error:
+                self._conn.execute("ROLLBACK;")
+                print(error)
+                return None
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self._savepoints += 1
+            name = f"savepoint_{self._savepoints}"
+            self._conn.execute(f"SAVEPOINT {name};")
+            self._local.depth = getattr(self._local, "depth", 0) + 1
+            try:
+                yield self
+            except BaseException:
+                self._conn.execute(f"ROLLBACK TO SAVEPOINT {name};")
+                self._conn.execute(f"RELEASE SAVEPOINT {name};")
+                raise
+            else:
+                self._conn.execute(f"RELEASE SAVEPOINT {name};")
+            finally:
+                self._local.depth -= 1
+
+    def store_attendee_data(self, attendee_data):
+        attendee_data = list(attendee_data)
+        if len(attendee_data) == len(GUESTLIST_COLUMNS) - 1:
+            attendee_data.append(datetime.now())
+
+        def query(cur):
+            columns = ", ".join(GUESTLIST_COLUMNS)
+            placeholders = ", ".join(["?"] * len(GUESTLIST_COLUMNS))
+            cur.execute(f"""INSERT INTO guestlist({columns})
+                            VALUES ({placeholders});""", attendee_data)
+            return cur.lastrowid
+        return self._run(query)
+
+    def store_many_attendees_data(self, attendees_data):
+        def query(cur):
+            columns = ", ".join(GUESTLIST_COLUMNS)
+            placeholders = ", ".join(["?"] * len(GUESTLIST_COLUMNS))
+            cur.executemany(f"""INSERT INTO guestlist({columns})
+                                VALUES ({placeholders});""", attendees_data)
+            return cur.rowcount
+        return self._run(query)
+
+    def _select(self, columns, where="", parameters=(), order="ORDER BY guest_id",
+                limit=None):
+        """Runs a SELECT on guestlist. Returns a list of records."""
+        selected, record_type = select_attendee_columns(columns)
+        sql = f"""SELECT {selected} FROM guestlist {where} {order}"""
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters = tuple(parameters) + (limit,)
+
+        def query(cur):
+            cur.execute(sql, parameters)
+            return make_attendees(cur.fetchall(), record_type)
+        return self._run(query)
+
+    def get_attendee(self, guest_id, columns=ATTENDEE_COLUMNS):
+        attendees = self._select(columns, "WHERE guest_id = ?", (guest_id,))
+        if attendees is None:
+            return None
+        return attendees[0] if attendees else None
+
+    def get_list_all_attendees(self, columns=ATTENDEE_COLUMNS):
+        return self._select(columns)
+
+    def iterate_all_attendees(self, batch_size=STREAM_BATCH_SIZE,
+                              columns=ATTENDEE_COLUMNS):
+        """Yields the attendees, reading batch_size of them at a time."""
+        after_guest_id = 0
+        columns = tuple(columns)
+        if "guest_id" not in columns:
+            read_columns = ("guest_id",) + columns
+            record_type = select_attendee_columns(columns)[1]
+        else:
+            read_columns, record_type = columns, None
+        while True:
+            page = self.get_attendees_page(after_guest_id, batch_size,
+                                           columns=read_columns)
+            if not page:
+                return
+            after_guest_id = page[-1].guest_id
+            for attendee in page:
+                yield attendee if record_type is None else record_type._make(attendee[1:])
+
+    def get_attendees_page(self, after_guest_id=0, page_size=PAGE_SIZE,
+                           name_filter=None, columns=ATTENDEE_COLUMNS):
+        if name_filter:
+            pattern = "%" + escape_like_pattern(name_filter) + "%"
+            return self._select(
+                columns,
+                "WHERE guest_id > ? AND ilike(first_name || ' ' || last_name, ?)",
+                (after_guest_id, pattern), limit=page_size)
+        return self._select(columns, "WHERE guest_id > ?", (after_guest_id,),
+                            limit=page_size)
+
+    def get_matching_attendees(self, attendees_name, columns=ATTENDEE_COLUMNS):
+        return self._select(columns, "WHERE ilike(first_name || ' ' || last_name, ?)",
+                            (attendees_name,))
+
+    def search_attendees(self, query, limit=SEARCH_LIMIT, columns=ATTENDEE_COLUMNS):
+        query = query.strip()
+        pattern = "%" + escape_like_pattern(query) + "%"
+        return self._select(
+            columns,
+            """WHERE ilike(first_name || ' ' || last_name, :pattern)
+                  OR ilike(email, :pattern)
+                  OR ilike(company, :pattern)""",
+            {"pattern": pattern, "query": query, "limit": limit},
+            order="""ORDER BY max(
+                        similarity(first_name || ' ' || last_name, :query),
+                        similarity(email, :query),
+                        similarity(company, :query)) DESC,
+                      guest_id
+                     LIMIT :limit""")
+
+    def remove_attendee(self, guest_id):
+        def query(cur):
+            cur.execute("""DELETE FROM guestlist WHERE guest_id = ?;""", (guest_id,))
+        return self._run(query)
+
+    def remove_attendees(self, guest_ids=None, company=None,
+                         added_after=None, added_before=None):
+        conditions, parameters = [], []
+        if guest_ids is not None:
+            guest_ids = [int(guest_id) for guest_id in guest_ids]
+            conditions.append(
+                f"guest_id IN ({', '.join(['?'] * len(guest_ids))})"
+                if guest_ids else "0")
+            parameters += guest_ids
+        if company is not None:
+            conditions.append("company = ?")
+            parameters.append(company)
+        if added_after is not None:
+            conditions.append("date_added >= ?")
+            parameters.append(added_after)
+        if added_before is not None:
+            conditions.append("date_added < ?")
+            parameters.append(added_before)
+
+        def query(cur):
+            if not conditions:
+                raise ValueError("remove_attendees needs at least one filter")
+            where = " AND ".join(conditions)
+            columns = ", ".join(ATTENDEE_COLUMNS)
+            cur.execute(f"""SELECT {columns} FROM guestlist WHERE {where}
+                            ORDER BY guest_id;""", parameters)
+            removed_attendees = make_attendees(cur.fetchall())
+            cur.execute(f"""DELETE FROM guestlist WHERE {where};""", parameters)
+            return removed_attendees
+        return self._run(query)
+
+    def table_version(self):
+        def query(cur):
+            cur.execute("""SELECT instance_id || '-' || version FROM guestlist_version;""")
+            return cur.fetchone()[0]
+        return self._run(query)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MemoryEngine(SqliteEngine):
+    """
+    Attendees kept only in memory, gone when the app stops;
+    for tests, benchmarks and demos.
+    """
+    name = "memory"
+
+    def __init__(self):
+        super().__init__(":memory:")
+
+
+def create_engine(name, path=None):
+    """
+    Returns a new engine: 'postgresql', 'sqlite' (kept in the file
+    at path) or 'memory'. Raises ValueError for other names.
+    """
+    if name == "postgresql":
+        return PostgresEngine()
+    if name == "sqlite":
+        return SqliteEngine(path or DEFAULT_STORAGE_SETTINGS["path"])
+    if name == "memory":
+        return MemoryEngine()
+    raise ValueError(f"unknown storage engine: {name}")
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(filename=None):
+    """
+    Returns the engine chosen in the [storage] section of the
+    configuration file (connection_pool.CONFIGURATION_FILE by default),
+    created on the first call.
+    """
+    global _engine
+    if filename is None:
+        filename = connection_pool.CONFIGURATION_FILE
+    with _engine_lock:
+        if _engine is None:
+            settings = get_cached_configuration(filename=filename, section="storage",
+                                                defaults=DEFAULT_STORAGE_SETTINGS)
+            _engine = create_engine(settings["engine"], settings["path"])
+        return _engine
+
+
+def set_engine(engine):
+    """
+    Makes get_engine() return the given engine, e.g. a MemoryEngine
+    in tests. Returns the engine used before, if any.
+    """
+    global _engine
+    with _engine_lock:
+        previous, _engine = _engine, engine
+    return previous
@@ -0,0 +1,230 @@
+import os
+import unittest
+
+from datetime import datetime, timedelta
+
+import connection_pool
+import export_cache
+from backend import Attendee
+from export_cache import get_export_cache
+from schema import extension_installed, migrate
+from storage import (
+    MemoryEngine,
+    PostgresEngine,
+    SqliteEngine,
+    StorageEngine,
+    get_engine,
+    set_engine,
+    similarity,
+)
+
+SQLITE_FILE = 'test_storage.sqlite3'
+
+test_attendee_data = ['Hermenegildo', 'Storedname', 'New York',
+                      'Testers', 'jd@storedname.com', '123456789']
+
+
+class StorageEngineContract:
+    """
+    Tests every engine has to pass, so that they all behave the same.
+    Subclasses create the engine in make_engine().
+    """
+    def setUp(self):
+        self.engine = self.make_engine()
+
+    def tearDown(self):
+        self.engine.remove_attendees(company='Storedname Testers')
+        self.engine.close()
+
+    def add_test_attendees(self):
+        """Adds three test attendees. Returns their guest_ids."""
+        added = datetime(2019, 9, 13, 13, 22, 15, 271516)
+        guest_ids = []
+        for first_name, days in (('Hermenegildo', 0), ('Anna', 1), ('Żaneta', 2)):
+            attendee_data = [first_name] + test_attendee_data[1:3] \
+                + ['Storedname Testers'] + test_attendee_data[4:] \
+                + [added + timedelta(days=days)]
+            guest_ids.append(self.engine.store_attendee_data(attendee_data))
+        return guest_ids
+
+    def test_store_and_get(self):
+        """Checks if an added attendee is returned as an Attendee record."""
+        guest_id = self.add_test_attendees()[0]
+        attendee = self.engine.get_attendee(guest_id)
+        self.assertEqual(type(attendee), Attendee)
+        self.assertEqual(attendee.first_name, 'Hermenegildo')
+        self.assertEqual(attendee.date_added, datetime(2019, 9, 13, 13, 22, 15, 271516))
+        self.assertIsNone(self.engine.get_attendee(-1))
+        self.assertEqual(self.engine.get_attendee(guest_id, columns=('email',)),
+                         ('jd@storedname.com',))
+
+    def test_store_many(self):
+        """Checks if many attendees are added at once."""
+        added = datetime(2019, 9, 13, 13, 22, 15)
+        attendees_data = [(f'Bulk{number}',) + tuple(test_attendee_data[1:3])
+                          + ('Storedname Testers',) + tuple(test_attendee_data[4:])
+                          + (added,) for number in range(3)]
+        self.assertEqual(self.engine.store_many_attendees_data(attendees_data), 3)
+        stored = self.engine.get_matching_attendees('bulk_ storedname')
+        self.assertEqual([attendee.first_name for attendee in stored],
+                         ['Bulk0', 'Bulk1', 'Bulk2'])
+
+    def test_list_and_pages(self):
+        """Checks if listing, paging and streaming give the same attendees."""
+        self.add_test_attendees()
+        all_attendees = self.engine.get_list_all_attendees()
+        paged, page = [], self.engine.get_attendees_page(0, 2)
+        while page:
+            paged += page
+            page = self.engine.get_attendees_page(page[-1].guest_id, 2)
+        self.assertEqual(paged, all_attendees)
+        self.assertEqual(list(self.engine.iterate_all_attendees(batch_size=2)),
+                         all_attendees)
+        self.assertEqual(list(self.engine.iterate_all_attendees(columns=('email',)))[-1],
+                         ('jd@storedname.com',))
+        filtered = self.engine.get_attendees_page(0, 10, 'żANETA stored')
+        self.assertEqual([attendee.first_name for attendee in filtered], ['Żaneta'])
+
+    def test_matching_and_search(self):
+        """Checks ILIKE patterns and the ranked search."""
+        self.add_test_attendees()
+        matching = self.engine.get_matching_attendees('%anna storedNAME%')
+        self.assertEqual([attendee.first_name for attendee in matching], ['Anna'])
+        self.assertFalse(self.engine.get_matching_attendees('anna'))
+        self.assertFalse(self.engine.get_matching_attendees('%Anna\\_Storedname%'))
+
+        found = self.engine.search_attendees(' storedname ', 2)
+        self.assertEqual([attendee.first_name for attendee in found],
+                         ['Anna', 'Hermenegildo'])
+
+    def test_remove_attendees(self):
+        """Checks if only the attendees matching every filter are removed."""
+        guest_ids = self.add_test_attendees()
+        removed = self.engine.remove_attendees(
+            guest_ids=guest_ids, added_after=datetime(2019, 9, 14))
+        self.assertEqual([attendee.guest_id for attendee in removed], guest_ids[1:])
+        self.assertIsNone(self.engine.remove_attendees())
+        self.engine.remove_attendee(guest_ids[0])
+        self.assertIsNone(self.engine.get_attendee(guest_ids[0]))
+
+    def test_table_version(self):
+        """Checks if the table version changes when attendees are added or removed."""
+        before = self.engine.table_version()
+        guest_ids = self.add_test_attendees()
+        added = self.engine.table_version()
+        self.assertNotEqual(added, before)
+        self.assertEqual(self.engine.table_version(), added)
+        self.engine.remove_attendees(guest_ids=guest_ids)
+        self.assertNotIn(self.engine.table_version(), (before, added))
+
+    def test_transaction(self):
+        """Checks if a failed transaction leaves nothing behind."""
+        with self.assertRaises(ValueError):
+            with self.engine.transaction():
+                self.add_test_attendees()
+                self.engine.remove_attendees()
+        self.assertFalse(self.engine.get_matching_attendees('%Storedname%'))
+
+        with self.engine.transaction():
+            guest_ids = self.add_test_attendees()
+        self.assertEqual(len(self.engine.get_matching_attendees('%Storedname%')),
+                         len(guest_ids))
+
+
+class StorageEngineTests(unittest.TestCase):
+    def test_incomplete_engine(self):
+        """Checks if an engine missing a method fails when it is created."""
+        methods = {name: getattr(SqliteEngine, name)
+                   for name in StorageEngine.__abstractmethods__ if name != 'transaction'}
+        NoTransactionEngine = type('NoTransactionEngine', (StorageEngine,), methods)
+        with self.assertRaisesRegex(TypeError, 'transaction'):
+            NoTransactionEngine()
+
+
+class MemoryEngineTests(StorageEngineContract, unittest.TestCase):
+    def make_engine(self):
+        return MemoryEngine()
+
+    def test_similarity(self):
+        """Checks if trigram similarity is computed like pg_trgm does."""
+        self.assertEqual(similarity('word', 'word'), 1.0)
+        self.assertAlmostEqual(similarity('word', 'two words'), 4 / 11)
+        self.assertEqual(similarity(None, 'word'), 0.0)
+
+
+class SqliteEngineTests(StorageEngineContract, unittest.TestCase):
+    def make_engine(self):
+        return SqliteEngine(SQLITE_FILE)
+
+    def tearDown(self):
+        super().tearDown()
+        os.unlink(SQLITE_FILE)
+
+    def test_kept_in_file(self):
+        """Checks if the attendees are still there after opening the file again."""
+        guest_id = self.add_test_attendees()[0]
+        self.engine.close()
+        self.engine = self.make_engine()
+        self.assertEqual(self.engine.get_attendee(guest_id).first_name, 'Hermenegildo')
+
+
+class PostgresEngineTests(StorageEngineContract, unittest.TestCase):
+    def make_engine(self):
+        return PostgresEngine()
+
+    def test_table_version(self):
+        migrate()
+        if self.engine.table_version() is None:
+            self.skipTest('the 0010_guestlist_version_sequence migration is not applied')
+        super().test_table_version()
+
+    def test_table_version_of_uncommitted_change(self):
+        """
+        Checks if writers do not wait for each other, and if there is
+        no version while a change is not committed.
+        """
+        migrate()
+        if self.engine.table_version() is None:
+            self.skipTest('the 0010_guestlist_version_sequence migration is not applied')
+        pool = connection_pool.get_pool()
+        conn = pool.get_connection()
+        try:
+            conn.cursor().execute("""UPDATE guestlist SET city = city WHERE false;""")
+            self.add_test_attendees()
+            self.assertIsNone(self.engine.table_version())
+        finally:
+            pool.release_connection(conn)
+        self.assertIsNotNone(self.engine.table_version())
+
+    def test_matching_and_search(self):
+        if not extension_installed('pg_trgm'):
+            self.skipTest('the pg_trgm extension is not installed')
+        super().test_matching_and_search()
+
+
+class ConfigurationFileTests(unittest.TestCase):
+    def setUp(self):
+        with open('test_other.ini', 'w') as configuration_file:
+            configuration_file.write('[storage]\nengine=memory\n'
+                                     '[export_cache]\nenabled=no\n')
+        self.previous_file = connection_pool.CONFIGURATION_FILE
+        self.previous_engine = set_engine(None)
+        self.previous_cache, export_cache._cache = export_cache._cache, None
+
+    def tearDown(self):
+        connection_pool.set_configuration_file(self.previous_file)
+        engine = set_engine(self.previous_engine)
+        if engine is not None:
+            engine.close()
+        export_cache._cache = self.previous_cache
+        os.unlink('test_other.ini')
+
+    def test_set_configuration_file(self):
+        """
+        Checks if the engine and the export cache are set up from the
+        configuration file chosen with set_configuration_file.
+        """
+        connection_pool.set_configuration_file('test_other.ini')
+        self.assertEqual(get_engine().name, 'memory')
+        self.assertIsNone(get_export_cache())
+
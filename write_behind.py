@@ -0,0 +1,366 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import psycopg2
+from psycopg2 import extras
+
+from backend import (
+    GUESTLIST_COLUMNS,
+    base_query,
+    store_attendee_data_in_postgresql,
+    transaction,
+)
+from config import get_cached_configuration
+import connection_pool
+
+DEFAULT_WRITE_BEHIND_SETTINGS = {
+    "enabled": "no",
+    "journal": "write_behind_journal.sqlite3",
+    "batch_size": "500",
+    "max_retry_delay": "60",
+}
+
+# Seconds to wait before the first retry after a failed flush;
+# every next failure doubles it, up to max_retry_delay
+RETRY_DELAY = 1
+
+# Errors caused by the data of an entry (e.g. a name too long for its
+# column, or a NUL character psycopg2 cannot send); after any other one
+# (e.g. the database is not reachable) the batch is tried again later
+ENTRY_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, ValueError, TypeError)
+
+JOURNAL_SCHEMA = """CREATE TABLE IF NOT EXISTS pending_attendees(
+                        position INTEGER PRIMARY KEY AUTOINCREMENT,
+                        entry_id TEXT NOT NULL UNIQUE,
+                        attendee TEXT NOT NULL,
+                        queued_at REAL NOT NULL);"""
+
+# Entries PostgreSQL refused to save, with the reason, kept for a person
+# to look at instead of blocking the entries queued after them
+REJECTED_SCHEMA = """CREATE TABLE IF NOT EXISTS rejected_attendees(
+                         position INTEGER PRIMARY KEY AUTOINCREMENT,
+                         entry_id TEXT NOT NULL UNIQUE,
+                         attendee TEXT NOT NULL,
+                         queued_at REAL NOT NULL,
+                         error TEXT NOT NULL,
+                         rejected_at REAL NOT NULL);"""
+
+
+class AttendeeJournal:
+    """
+    Local SQLite file with the attendees waiting to be saved
+    in PostgreSQL, in the order they were added. Every entry is
+    on disk before append() returns, so it survives a restart.
+    Entries PostgreSQL refused are moved to the rejected_attendees table.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=FULL;")
+        self._conn.execute(JOURNAL_SCHEMA)
+        self._conn.execute(REJECTED_SCHEMA)
+
+    def append(self, attendee_data):
+        """
+        Takes in a list of attendee's data in the GUESTLIST_COLUMNS order.
+        Saves it in the journal. Returns the entry's id.
+        """
+        entry_id = str(uuid.uuid4())
+        attendee = [value.isoformat() if isinstance(value, datetime) else value
+                    for value in attendee_data]
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO pending_attendees(entry_id, attendee, queued_at)
+                   VALUES (?, ?, ?);""",
+                (entry_id, json.dumps(attendee), time.time()))
+        return entry_id
+
+    def oldest(self, limit):
+        """
+        Returns a list of up to limit (entry id, attendee's data) tuples,
+        the oldest entries first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT entry_id, attendee FROM pending_attendees
+                   ORDER BY position LIMIT ?;""", (limit,)).fetchall()
+        entries = []
+        for entry_id, attendee in rows:
+            attendee = json.loads(attendee)
+            attendee[-1] = datetime.fromisoformat(attendee[-1])
+            entries.append((entry_id, attendee))
+        return entries
+
+    def remove(self, entry_ids):
+        """Removes the entries that were saved in PostgreSQL."""
+        with self._lock:
+            self._conn.executemany(
+                """DELETE FROM pending_attendees WHERE entry_id = ?;""",
+                [(entry_id,) for entry_id in entry_ids])
+
+    def reject(self, entry_id, error):
+        """
+        Moves the entry to rejected_attendees with the error message,
+        so it is not tried again.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN;")
+            try:
+                self._conn.execute(
+                    """INSERT INTO rejected_attendees(entry_id, attendee, queued_at,
+                                                      error, rejected_at)
+                       SELECT entry_id, attendee, queued_at, ?, ?
+                       FROM pending_attendees WHERE entry_id = ?;""",
+                    (error, time.time(), entry_id))
+                self._conn.execute(
+                    """DELETE FROM pending_attendees WHERE entry_id = ?;""", (entry_id,))
+            except BaseException:
+                self._conn.execute("ROLLBACK;")
+                raise
+            self._conn.execute("COMMIT;")
+
+    def rejected(self):
+        """
+        Returns a list of (entry id, attendee's data as stored, error)
+        tuples of the rejected entries, the oldest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT entry_id, attendee, error FROM rejected_attendees
+                   ORDER BY position;""").fetchall()
+        return [(entry_id, json.loads(attendee), error)
+                for entry_id, attendee, error in rows]
+
+    def rejected_count(self):
+        """Returns the number of rejected entries."""
+        with self._lock:
+            return self._conn.execute(
+                """SELECT count(*) FROM rejected_attendees;""").fetchone()[0]
+
+    def backlog(self):
+        """
+        Returns the number of entries in the journal and the time
+        (as time.time()) the oldest of them was added, or None.
+        """
+        with self._lock:
+            return self._conn.execute(
+                """SELECT count(*), min(queued_at) FROM pending_attendees;""").fetchone()
+
+    def close(self):
+        """Closes the journal file."""
+        with self._lock:
+            self._conn.close()
+
+
+@base_query
+def save_journal_entries(cur, entries):
+    """
+    Takes in a list of (entry id, attendee's data) tuples from the journal.
+    Adds the attendees to guestlist, skipping the entries that were already
+    saved (the ids are recorded in write_behind_entries, created by the
+    0004_write_behind_entries migration), so an entry is never saved twice,
+    even if the app stopped before it was removed from the journal.
+    Returns the number of attendees added.
+    """
+    sql = """INSERT INTO write_behind_entries(entry_id) VALUES %s
+             ON CONFLICT DO NOTHING
+             RETURNING entry_id"""
+    new_entries = extras.execute_values(
+        cur, sql, [(entry_id,) for entry_id, _ in entries],
+        page_size=len(entries), fetch=True)
+    new_entry_ids = {row[0] for row in new_entries}
+    rows = [tuple(attendee) for entry_id, attendee in entries
+            if entry_id in new_entry_ids]
+    if rows:
+        columns = ", ".join(GUESTLIST_COLUMNS)
+        sql = f"""INSERT INTO guestlist({columns}) VALUES %s"""
+        extras.execute_values(cur, sql, rows, page_size=len(rows))
+    return cur, len(rows)
+
+
+class WriteBehindQueue(threading.Thread):
+    """
+    Adds attendees to the journal (see AttendeeJournal) and returns
+    at once; a background thread saves them in PostgreSQL in batches
+    of batch_size, each in one transaction. If a batch is refused for
+    its data, its entries are saved one by one, each behind a savepoint,
+    and the ones refused on their own are moved aside (see
+    AttendeeJournal.reject), so one bad entry does not hold up the rest.
+    After any other failure (e.g. the database cannot be reached) it
+    tries again after a delay that doubles with every failure, up to
+    max_retry_delay seconds. Entries left in the journal when the app
+    stopped are saved after it starts again.
+    """
+    def __init__(self, journal, batch_size=500, max_retry_delay=60):
+        super().__init__(name="write-behind-flusher", daemon=True)
+        self.journal = journal
+        self.batch_size = batch_size
+        self.max_retry_delay = max_retry_delay
+        self.last_error = None
+        self.retry_at = None
+        self._wake_up = threading.Event()
+        self._stopped = threading.Event()
+        self._flush_lock = threading.Lock()
+
+    def put(self, attendee_data):
+        """
+        Takes in a list of attendee's data, adds current time to it
+        (like store_attendee_data_in_postgresql) and puts it in the journal.
+        Returns the entry's id.
+        """
+        attendee_data = list(attendee_data)
+        if len(attendee_data) == len(GUESTLIST_COLUMNS) - 1:
+            attendee_data.append(datetime.now())
+        entry_id = self.journal.append(attendee_data)
+        self._wake_up.set()
+        return entry_id
+
+    def flush(self):
+        """
+        Saves the journal's entries in PostgreSQL, batch after batch,
+        until it is empty. Entries refused for their data are rejected
+        (see save_one_by_one); other errors are raised.
+        Returns the number of attendees added.
+        """
+        added = 0
+        with self._flush_lock:
+            while True:
+                entries = self.journal.oldest(self.batch_size)
+                if not entries:
+                    return added
+                try:
+                    with transaction():
+                        added += save_journal_entries(entries)
+                except ENTRY_ERRORS:
+                    added += self.save_one_by_one(entries)
+                    continue
+                self.journal.remove([entry_id for entry_id, _ in entries])
+
+    def save_one_by_one(self, entries):
+        """
+        Takes in a batch of entries that could not be saved together.
+        Saves them in one transaction, each behind its own savepoint,
+        and moves the ones refused for their data (ENTRY_ERRORS) to
+        rejected_attendees. Other errors are raised.
+        Returns the number of attendees added.
+        """
+        added = 0
+        saved = []
+        rejected = []
+        with transaction():
+            for entry in entries:
+                try:
+                    with transaction():
+                        added += save_journal_entries([entry])
+                except ENTRY_ERRORS as error:
+                    rejected.append((entry[0], str(error).strip() or type(error).__name__))
+                    continue
+                saved.append(entry[0])
+        self.journal.remove(saved)
+        for entry_id, error in rejected:
+            self.journal.reject(entry_id, error)
+        return added
+
+    def status(self):
+        """
+        Returns a dictionary with the number of attendees waiting to be
+        saved, the age of the oldest one in seconds, the number of rejected
+        ones (see AttendeeJournal.rejected), the last error (None after
+        a successful flush) and the seconds until the next retry.
+        """
+        pending, oldest = self.journal.backlog()
+        now = time.time()
+        return {
+            "pending": pending,
+            "oldest_seconds": now - oldest if oldest is not None else 0.0,
+            "rejected": self.journal.rejected_count(),
+            "last_error": self.last_error,
+            "retry_in": max(self.retry_at - now, 0.0) if self.retry_at else 0.0,
+        }
+
+    def stop(self, timeout=5.0):
+        """Stops the thread. Entries not saved yet stay in the journal."""
+        self._stopped.set()
+        self._wake_up.set()
+        self.join(timeout)
+
+    def run(self):
+        delay = RETRY_DELAY
+        while not self._stopped.is_set():
+            try:
+                self.flush()
+            except Exception as error:
+                self.last_error = str(error).strip()
+                self.retry_at = time.time() + delay
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+            self.last_error = None
+            self.retry_at = None
+            delay = RETRY_DELAY
+            self._wake_up.wait()
+            self._wake_up.clear()
+
+
+_queue = None
+
+
+def start_write_behind(filename=None):
+    """
+    Starts the write-behind queue if it is enabled in the [write_behind]
+    section of the configuration file (connection_pool.CONFIGURATION_FILE
+    by default). Returns True if it is running.
+    """
+    global _queue
+    if filename is None:
+        filename = connection_pool.CONFIGURATION_FILE
+    settings = get_cached_configuration(filename=filename, section="write_behind",
+                                        defaults=DEFAULT_WRITE_BEHIND_SETTINGS)
+    if settings["enabled"].lower() not in ("yes", "true", "on", "1"):
+        return False
+    if _queue is None or not _queue.is_alive():
+        _queue = WriteBehindQueue(AttendeeJournal(settings["journal"]),
+                                  batch_size=int(settings["batch_size"]),
+                                  max_retry_delay=float(settings["max_retry_delay"]))
+        _queue.start()
+    return True
+
+
+def stop_write_behind(timeout=5.0):
+    """
+    Stops the write-behind queue. The attendees not saved yet stay
+    in the journal and are saved after the next start.
+    """
+    global _queue
+    if _queue is not None:
+        _queue.stop(timeout)
+        _queue.journal.close()
+        _queue = None
+
+
+def queue_attendee(attendee_data):
+    """
+    Adds an attendee through the write-behind queue if it is running,
+    otherwise saves them in PostgreSQL straight away. Returns the
+    journal entry's id or the new attendee's guest_id.
+    """
+    if _queue is not None:
+        return _queue.put(attendee_data)
+    return store_attendee_data_in_postgresql(attendee_data)
+
+
+def write_behind_status():
+    """
+    Returns the status of the write-behind queue (see
+    WriteBehindQueue.status), or None if it is not running.
+    """
+    if _queue is None:
+        return None
+    return _queue.status()
@@ -0,0 +1,131 @@
+import os
+import time
+import unittest
+
+from datetime import datetime
+
+from backend import base_query, get_matching_attendees
+from schema import migrate
+from write_behind import AttendeeJournal, WriteBehindQueue, save_journal_entries
+
+JOURNAL_FILE = 'test_write_behind_journal.sqlite3'
+
+test_attendee_data = ['Hermenegildo', 'Journaledname', 'New York',
+                      'Testers', 'jd@testers.com', '123456789']
+
+
+@base_query
+def remove_write_behind_test_attendees(cur):
+    sql = """DELETE FROM guestlist WHERE last_name = 'Journaledname';"""
+    cur.execute(sql, )
+    return cur, None
+
+
+@base_query
+def write_behind_table_exists(cur):
+    cur.execute("""SELECT to_regclass('write_behind_entries') IS NOT NULL;""")
+    return cur, cur.fetchone()[0]
+
+
+def remove_journal_files():
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(JOURNAL_FILE + suffix):
+            os.unlink(JOURNAL_FILE + suffix)
+
+
+class AttendeeJournalTests(unittest.TestCase):
+    def tearDown(self):
+        remove_journal_files()
+
+    def test_entries_survive_reopening(self):
+        """
+        Checks if the entries are kept in order after the journal
+        is closed and opened again, and removed once saved.
+        """
+        journal = AttendeeJournal(JOURNAL_FILE)
+        added = datetime(2019, 9, 13, 13, 22, 15, 271516)
+        first = journal.append(test_attendee_data + [added])
+        second = journal.append(['Jane'] + test_attendee_data[1:] + [added])
+        journal.close()
+
+        journal = AttendeeJournal(JOURNAL_FILE)
+        entries = journal.oldest(10)
+        self.assertEqual([entry_id for entry_id, _ in entries], [first, second])
+        self.assertEqual(entries[0][1], test_attendee_data + [added])
+        self.assertEqual(journal.backlog()[0], 2)
+
+        journal.remove([first])
+        self.assertEqual([entry_id for entry_id, _ in journal.oldest(10)], [second])
+        journal.close()
+
+
+class WriteBehindQueueTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        migrate()
+        if not write_behind_table_exists():
+            raise unittest.SkipTest('the 0004_write_behind_entries migration'
+                                    ' is not applied')
+
+    def setUp(self):
+        self.queue = WriteBehindQueue(AttendeeJournal(JOURNAL_FILE), batch_size=2)
+
+    def tearDown(self):
+        self.queue.journal.close()
+        remove_journal_files()
+        remove_write_behind_test_attendees()
+
+    def test_flush(self):
+        """
+        Checks if queued attendees are saved in batches
+        and the journal is emptied.
+        """
+        for _ in range(3):
+            self.queue.put(test_attendee_data)
+        self.assertEqual(self.queue.status()['pending'], 3)
+        self.assertFalse(get_matching_attendees('%Journaledname%'))
+
+        self.assertEqual(self.queue.flush(), 3)
+        self.assertEqual(len(get_matching_attendees('%Journaledname%')), 3)
+        self.assertEqual(self.queue.status()['pending'], 0)
+
+    def test_entry_saved_once(self):
+        """
+        Checks if an entry that was saved, but not removed from the
+        journal before the app stopped, is not saved a second time.
+        """
+        self.queue.put(test_attendee_data)
+        save_journal_entries(self.queue.journal.oldest(10))
+
+        self.assertEqual(self.queue.flush(), 0)
+        self.assertEqual(len(get_matching_attendees('%Journaledname%')), 1)
+        self.assertEqual(self.queue.status()['pending'], 0)
+
+    def test_poison_entry_rejected(self):
+        """
+        Checks if an entry the database refuses is moved aside and
+        reported, and the entries around it are still saved.
+        """
+        self.queue.put(test_attendee_data)
+        poison_id = self.queue.put(['X' * 100] + test_attendee_data[1:])
+        self.queue.put(test_attendee_data)
+
+        self.assertEqual(self.queue.flush(), 2)
+        self.assertEqual(len(get_matching_attendees('%Journaledname%')), 2)
+        status = self.queue.status()
+        self.assertEqual((status['pending'], status['rejected']), (0, 1))
+        [(entry_id, attendee, error)] = self.queue.journal.rejected()
+        self.assertEqual((entry_id, attendee[0]), (poison_id, 'X' * 100))
+        self.assertTrue(error)
+        self.assertEqual(self.queue.flush(), 0)
+
+    def test_background_flush(self):
+        """Checks if the thread saves the attendees put in the queue."""
+        self.queue.start()
+        self.queue.put(test_attendee_data)
+        for _ in range(500):
+            if not self.queue.status()['pending']:
+                break
+            time.sleep(0.01)
+        self.queue.stop()
+        self.assertEqual(len(get_matching_attendees('%Journaledname%')), 1)